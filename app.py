@@ -1,61 +1,209 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Blueprint, Flask, Response, current_app, g, render_template, request, jsonify, stream_with_context
+import click
 import os
 import json
-import sqlite3
+import logging
+import math
+import time
+import uuid
 import xml.etree.ElementTree as ET
+from contextlib import contextmanager
 from datetime import datetime
 from werkzeug.utils import secure_filename
+from assets import fingerprint_static_urls, static_view
+from batch_forecast import MAX_BATCH_FORECASTS, apply_overrides, calculate_forecasts, expand_sweep, sweep_size
+from comparison import MAX_COMPARED_SCENARIOS, compare_forecasts
+from database import ConnectionPool, connect, run_with_retry
+from forecast_cache import ForecastCache, inputs_key
+from forecast_engine import calculate_forecast_result
+from incremental import forecast_horizon, forecast_with_checkpoints, update_forecast
+from jobs import FINISHED_STATUSES, JobRunner, cancel_job, create_job, get_job
+from logging_config import configure_logging
+from models import ForecastInput, ForecastResult
+from metrics import finish_request, observe_horizon, registry, start_request, timed_stage
+from portfolio import aggregate_portfolio
+from profiler import profiler_from_env
+from responses import compress_response, not_modified, tag_response
+from project_io import EXTENSIONS, FORMATS, format_for_path, import_projects, iter_export_records, read_records, write_records
+from sensitivity import DEFAULT_BUMP, SENSITIVITY_METRICS, calculate_break_even, calculate_sensitivity
+from simulation import DEFAULT_PERCENTILES, DEFAULT_SIMULATION_DRAWS, MAX_SIMULATION_DRAWS, run_simulation
+from storage import (PROJECT_CHUNK_SIZE, PROJECT_LIST_FIELDS, SCHEMA_VERSION, encode_cursor,
+                     find_projects_with_delays, insert_project_children, iter_projects_with_inputs,
+                     list_projects_query, load_project_children, load_scenario, load_scenarios, migrate,
+                     project_filter_conditions, project_inputs, upsert_scenario)
 
-app = Flask(__name__)
+# Routes live on a blueprint so create_app can build independent app instances
+routes = Blueprint('routes', __name__)
+
+log = logging.getLogger('forecast.app')
+inputs_log = logging.getLogger('forecast.inputs')
+engine_log = logging.getLogger('forecast.engine')
+storage_log = logging.getLogger('forecast.storage')
 
 # Database setup
 DATABASE = 'projects.db'
+# Page size of /get_projects when no limit is given, and the largest allowed
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# Forecast encodings: a dict per month, or parallel arrays that are much smaller on long horizons
+RESPONSE_FORMATS = ('rows', 'columnar')
+# How often /jobs/<id>/events checks the job, and the longest it stays silent
+JOB_EVENTS_POLL_SECONDS = 0.5
+JOB_EVENTS_KEEPALIVE_SECONDS = 15
+
+def create_app(database=None, init_schema=False):
+    """Create the Flask app
+
+    The database path comes from the argument, then the DATABASE environment
+    variable. Each app holds its own connection pool and forecast cache, so
+    every worker process gets its own. The schema is only migrated when
+    init_schema is set; under gunicorn the master process does it once before
+    forking workers (see gunicorn.conf.py).
+    """
+    configure_logging()
+    # /static is served by assets.static_view, with fingerprinted URLs and precompressed files
+    app = Flask(__name__, static_folder=None)
+    static_folder = os.path.join(app.root_path, 'static')
+    app.config['DATABASE'] = database or os.environ.get('DATABASE', DATABASE)
+    if init_schema:
+        init_db(app.config['DATABASE'])
+
+    # Connections are pooled and reused; each request holds at most one
+    app.extensions['db_pool'] = ConnectionPool(app.config['DATABASE'])
+    # Forecast results keyed on a hash of the parsed inputs
+    # Set FORECAST_CACHE_DB to also keep them in a SQLite file that survives restarts
+    app.extensions['forecast_cache'] = ForecastCache(
+        max_entries=int(os.environ.get('FORECAST_CACHE_SIZE', 256)),
+        disk_path=os.environ.get('FORECAST_CACHE_DB') or None
+    )
+    # Opt-in sampling profiler for slow requests, see profiler.py
+    app.extensions['profiler'] = profiler_from_env()
+    # Jobs queued in the jobs table, run on threads of whichever worker process claims them
+    app.extensions['job_runner'] = JobRunner(app.config['DATABASE'], JOB_HANDLERS, context=lambda: job_context(app))
+
+    app.register_blueprint(routes)
+    app.add_url_rule('/static/<path:filename>', endpoint='static', view_func=static_view(static_folder))
+    app.url_defaults(fingerprint_static_urls(static_folder))
+    app.cli.command('init-db')(init_db_command)
+    app.cli.command('import-projects')(import_projects_command)
+    app.cli.command('export-projects')(export_projects_command)
+    return app
+
+@routes.before_app_request
+def assign_request_id():
+    """Tag the request with the caller's X-Request-ID, or a new one, for the logs"""
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+
+@routes.after_app_request
+def return_request_id(response):
+    """Echo the request id so clients can match their calls to log lines"""
+    if 'request_id' in g:
+        response.headers['X-Request-ID'] = g.request_id
+    return response
+
+@routes.before_app_request
+def start_job_runner():
+    """Start this process's job dispatcher with its first request, so CLI commands never run jobs"""
+    current_app.extensions['job_runner'].start()
+
+@routes.before_app_request
+def start_request_metrics():
+    """Start timing the request and counting its queries"""
+    g.request_started = time.perf_counter()
+    start_request()
+    if current_app.extensions['profiler'] is not None:
+        current_app.extensions['profiler'].start()
+
+@routes.after_app_request
+def record_request_metrics(response):
+    """Record the request's latency and query count, and keep its profile if it was slow"""
+    if 'request_started' in g:
+        duration = time.perf_counter() - g.request_started
+        # The URL rule, not the path, so ids in URLs do not each become a series
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        finish_request(route, request.method, response.status_code, duration)
+        profiler = current_app.extensions['profiler']
+        if profiler is not None:
+            path = profiler.stop(duration, f"{request.method} {route} {g.get('request_id', '')}")
+            if path:
+                log.info("Slow request profile written to %s", path)
+    return response
+
+@routes.after_app_request
+def compress_json_response(response):
+    """gzip or brotli the response body when the client accepts it
+
+    Registered after record_request_metrics so it runs before it, and the
+    recorded latency includes the compression.
+    """
+    return compress_response(response, request.accept_encodings)
 
 def get_db():
-    """Get database connection"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Get the database connection of the current request"""
+    if 'db' not in g:
+        g.db = current_app.extensions['db_pool'].acquire()
+    return g.db
 
-def init_db():
-    """Initialize the database with projects table"""
-    conn = get_db()
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS projects (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            start_date TEXT,
-            contract_value REAL NOT NULL,
-            time_frame INTEGER NOT NULL,
-            payment_lag INTEGER NOT NULL,
-            contingency_percent REAL NOT NULL,
-            cash_floor REAL NOT NULL,
-            phases TEXT NOT NULL,
-            delays TEXT NOT NULL,
-            unexpected_costs TEXT NOT NULL,
-            billing_milestones TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    # Add start_date column if it doesn't exist (migration)
-    try:
-        conn.execute('ALTER TABLE projects ADD COLUMN start_date TEXT')
-        conn.commit()
-    except sqlite3.OperationalError:
-        pass  # Column already exists
+@routes.teardown_app_request
+def release_db(exception):
+    """Return the request's connection to the pool"""
+    conn = g.pop('db', None)
+    if conn is not None:
+        current_app.extensions['db_pool'].release(conn)
+
+def get_forecast_cache():
+    """Get the forecast cache of the current app"""
+    return current_app.extensions['forecast_cache']
+
+def init_db(database=DATABASE):
+    """Initialize the database, applying any pending schema migrations"""
+    conn = connect(database)
+    migrate(conn)
     conn.close()
 
-# Initialize database on startup
-init_db()
+def init_db_command():
+    """Apply pending schema migrations: flask --app app init-db"""
+    init_db(current_app.config['DATABASE'])
+    click.echo(f"Database {current_app.config['DATABASE']} is at schema version {SCHEMA_VERSION}")
 
+@click.argument('path')
+@click.option('--format', 'format', type=click.Choice(list(FORMATS)), help='Defaults to the file extension')
+@click.option('--skip-invalid', is_flag=True, help='Import the valid records even if some are invalid')
+def import_projects_command(path, format, skip_invalid):
+    """Import projects from a file: flask --app app import-projects projects.jsonl"""
+    format = format or format_for_path(path) or 'jsonl'
+    conn = connect(current_app.config['DATABASE'])
+    try:
+        with open(path, 'rb') as source:
+            report = import_projects(conn, read_records(source, format), skip_invalid)
+    finally:
+        conn.close()
+    for error in report['errors']:
+        click.echo(f"Record {error['record']}: {error['message']}", err=True)
+    if not report['committed']:
+        raise click.ClickException(f"{report['error_count']} invalid records, nothing imported")
+    click.echo(f"Imported {report['imported']} projects ({report['error_count']} invalid records skipped)")
+
+@click.argument('path')
+@click.option('--format', 'format', type=click.Choice(list(FORMATS)), help='Defaults to the file extension')
+def export_projects_command(path, format):
+    """Export every project to a file: flask --app app export-projects projects.jsonl"""
+    format = format or format_for_path(path) or 'jsonl'
+    conn = connect(current_app.config['DATABASE'])
+    try:
+        with open(path, 'wb') as target:
+            for chunk in write_records(iter_export_records(conn), format):
+                target.write(chunk)
+    finally:
+        conn.close()
+    click.echo(f"Projects exported to {path}")
 
-@app.route('/')
+@routes.route('/')
 def index():
     """Render the main page"""
     return render_template('index.html')
 
-@app.route('/generate_forecast', methods=['POST'])
+@routes.route('/generate_forecast', methods=['POST'])
 def generate_forecast_route():
     """Generate forecast based on assumptions given"""
     try:
@@ -69,82 +217,580 @@ def generate_forecast_route():
             return jsonify({'success': False, 'message': 'No inputs provided'}), 400
         
         scenario = data.get('scenario', 'base')
+        format = response_format(data.get('format', 'rows'))
+        engine = data.get('engine', 'loop')
+        if engine not in FORECAST_ENGINES:
+            return jsonify({'success': False, 'message': f'Unknown forecast engine: {engine}'}), 400
         
         # Validate the inputs
         if not validate_inputs(inputs):
             return jsonify({'success': False, 'message': 'Invalid inputs provided'}), 400
 
-        print("Inputs validated")
+        log.debug("Inputs validated")
         parsed_inputs = parse_inputs(inputs)
-        # Generate the forecast
-        forecast_result = calculate_forecast(parsed_inputs)
+        # 'base', or the id of a saved scenario whose overrides apply on top of the inputs
+        if scenario not in (None, '', 'base'):
+            try:
+                scenario_id = int(scenario)
+            except (TypeError, ValueError):
+                return jsonify({'success': False, 'message': "scenario must be 'base' or the id of a saved scenario"}), 400
+            saved = load_scenario(get_db(), scenario_id)
+            if saved is None:
+                return jsonify({'success': False, 'message': 'Scenario not found'}), 404
+            parsed_inputs = apply_overrides(parsed_inputs, saved['overrides'])
+        # Generate the forecast, reusing the cached result for identical inputs
+        key = inputs_key(parsed_inputs, engine)
+        forecast_result = get_forecast_cache().get_or_compute(key, lambda: run_engine(engine, parsed_inputs))
 
-        # Return the forecast
-        return jsonify({'success': True, 'message':'Forecast generated successfully', 'forecast': forecast_result})
+        # Return the forecast, with the key /update_forecast takes to re-forecast an edit of it
+        # and /forecast/<key> serves it again
+        response = jsonify({'success': True, 'message':'Forecast generated successfully',
+                            'forecast': forecast_json(forecast_result, format), 'forecast_key': key})
+        return tag_response(response, f'{key}-{format}')
     
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@routes.route('/update_forecast', methods=['POST'])
+def update_forecast_route():
+    """Re-forecast a cached forecast with some of its inputs changed
+
+    Takes the forecast_key of an earlier forecast and 'changes', raw inputs
+    in the override format of /generate_forecasts, except that 'phases'
+    replaces every phase. Only the months from the first one the changes can
+    affect are recomputed. 'base_inputs', the raw inputs of the base
+    forecast, let any worker rebuild the base when it is not in its memory
+    cache; without them that answers 404, and the full inputs go to
+    /generate_forecast instead.
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'success': False, 'message': 'No data provided'}), 400
+
+        base_key = data.get('forecast_key')
+        changes = data.get('changes')
+        format = response_format(data.get('format', 'rows'))
+        if not base_key or changes is None:
+            return jsonify({'success': False, 'message': 'forecast_key and changes are required'}), 400
+
+        base = checkpointed_forecast(base_key, data.get('base_inputs'))
+        if base is None:
+            return jsonify({'success': False, 'message': 'Base forecast is not cached'}), 404
+
+        parsed_inputs = apply_overrides(base.forecast_input.to_parsed(), changes, merge_phases=False)
+        key = inputs_key(parsed_inputs)
+        forecast_result = get_forecast_cache().get(key)
+        resumed_from_month = None
+        if forecast_result is None:
+            forecast_result, resumed_from_month = update_forecast_from(base, parsed_inputs)
+            if isinstance(forecast_result, ForecastResult):
+                observe_horizon(len(forecast_result) - resumed_from_month + 1)
+                get_forecast_cache().put(key, forecast_result)
+
+        response = jsonify({'success': True, 'message': 'Forecast updated successfully',
+                            'forecast': forecast_json(forecast_result, format), 'forecast_key': key,
+                            'resumed_from_month': resumed_from_month})
+        return tag_response(response, f'{key}-{format}')
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+def checkpointed_forecast(key, raw_inputs=None):
+    """The forecast cached under key, with the checkpoints an update resumes from
+
+    Results from the disk tier, the vectorized engine or another worker have
+    no checkpoints; the forecast is then run again with the loop engine from
+    raw_inputs, provided they hash to key. Returns None otherwise.
+    """
+    cache = get_forecast_cache()
+    base = cache.get(key)
+    if isinstance(base, ForecastResult) and base.checkpoints is not None:
+        return base
+    if not raw_inputs or not validate_inputs(raw_inputs):
+        return None
+    parsed_inputs = parse_inputs(raw_inputs)
+    if not isinstance(parsed_inputs, dict) or key not in [inputs_key(parsed_inputs, engine) for engine in FORECAST_ENGINES]:
+        return None
+    loop_key = inputs_key(parsed_inputs)
+    base = cache.get(loop_key) if loop_key != key else None
+    if isinstance(base, ForecastResult) and base.checkpoints is not None:
+        return base
+    forecast_input = ForecastInput.from_parsed(parsed_inputs)
+    if not forecast_input.phases:
+        return None
+    base = forecast_with_checkpoints(forecast_input)
+    observe_horizon(len(base))
+    cache.put(loop_key, base)
+    return base
+
+@routes.route('/generate_forecasts', methods=['POST'])
+def generate_forecasts_route():
+    """Generate many forecasts in one request
+
+    Accepts either 'inputs_list', an array of input sets, or one base 'inputs'
+    with a list of 'overrides' or a 'sweep' of values to combine.
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'success': False, 'message': 'No data provided'}), 400
+
+        forecasts = batch_forecasts(data)
+        return jsonify({'success': True, 'message': 'Forecasts generated successfully', 'forecasts': forecasts})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+def batch_forecasts(data, progress=None):
+    """Forecasts of a /generate_forecasts request body; raises ValueError when it is invalid"""
+    inputs_list = data.get('inputs_list')
+    if inputs_list is not None:
+        if not isinstance(inputs_list, list):
+            raise ValueError('inputs_list must be a list of inputs')
+        check_batch_size(len(inputs_list))
+        if not all(validate_inputs(inputs) for inputs in inputs_list):
+            raise ValueError('Invalid inputs provided')
+        variants = [None] * len(inputs_list)
+        parsed_variants = [parse_inputs(inputs) for inputs in inputs_list]
+    else:
+        inputs = data.get('inputs')
+        if not inputs:
+            raise ValueError('No inputs provided')
+        if not validate_inputs(inputs):
+            raise ValueError('Invalid inputs provided')
+        if data.get('overrides') is not None and data.get('sweep') is not None:
+            raise ValueError('Provide either overrides or sweep, not both')
+        # Counted before anything is expanded or parsed, so an oversized sweep costs nothing
+        if data.get('sweep') is not None:
+            check_batch_size(sweep_size(data['sweep']))
+            variants = list(expand_sweep(data['sweep']))
+        else:
+            variants = data.get('overrides', [{}])
+            if not isinstance(variants, list):
+                raise ValueError('overrides must be a list of overrides')
+            check_batch_size(len(variants))
+        # The shared base inputs are parsed once; each variant only converts its overrides
+        parsed_inputs = parse_inputs(inputs)
+        if not isinstance(parsed_inputs, dict):
+            raise ValueError('Failed to parse inputs')
+        parsed_variants = [apply_overrides(parsed_inputs, overrides) for overrides in variants]
+
+    if not all(isinstance(parsed, dict) for parsed in parsed_variants):
+        raise ValueError('Failed to parse inputs')
+
+    format = response_format(data.get('format', 'rows'))
+    results = cached_forecasts(parsed_variants, progress)
+    return [{'overrides': overrides, 'forecast': forecast_json(result, format)} for overrides, result in zip(variants, results)]
+
+def check_batch_size(count):
+    """Refuse batches of more than MAX_BATCH_FORECASTS forecasts"""
+    if count > MAX_BATCH_FORECASTS:
+        raise ValueError(f'At most {MAX_BATCH_FORECASTS} forecasts per request')
+
+def cached_forecasts(parsed_variants, progress=None):
+    """Forecast many parsed inputs, serving cached ones and evaluating the rest together"""
+    # The batch engine is the vectorized engine run over many inputs at once
+    keys = [inputs_key(parsed, 'vectorized') for parsed in parsed_variants]
+    results = [get_forecast_cache().get(key) for key in keys]
+    missing = [position for position, result in enumerate(results) if result is None]
+    for position, result in zip(missing, calculate_forecasts([parsed_variants[position] for position in missing], progress)):
+        results[position] = result
+        if isinstance(result, ForecastResult):
+            observe_horizon(len(result))
+            get_forecast_cache().put(keys[position], result)
+    return results
+
+@routes.route('/sensitivity', methods=['POST'])
+def sensitivity_route():
+    """Tornado sensitivity analysis and break-even thresholds for a project
+
+    Takes either posted 'inputs' or the 'project_id' of a saved project.
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'success': False, 'message': 'No data provided'}), 400
+
+        if data.get('project_id') is not None:
+            parsed_inputs = load_project_inputs(int(data['project_id']))
+            if parsed_inputs is None:
+                return jsonify({'success': False, 'message': 'Project not found'}), 404
+        else:
+            inputs = data.get('inputs')
+            if not inputs:
+                return jsonify({'success': False, 'message': 'No inputs provided'}), 400
+            if not validate_inputs(inputs):
+                return jsonify({'success': False, 'message': 'Invalid inputs provided'}), 400
+            parsed_inputs = parse_inputs(inputs)
+            if not isinstance(parsed_inputs, dict):
+                return jsonify({'success': False, 'message': 'Failed to parse inputs'}), 400
+        if not parsed_inputs['phases']:
+            return jsonify({'success': False, 'message': 'No phases provided'}), 400
+
+        sort_by = data.get('sort_by', 'min_net_cash')
+        if sort_by not in SENSITIVITY_METRICS:
+            return jsonify({'success': False, 'message': f'sort_by must be one of {", ".join(SENSITIVITY_METRICS)}'}), 400
+        sensitivity = calculate_sensitivity(parsed_inputs, bump=float(data.get('bump', DEFAULT_BUMP)), sort_by=sort_by)
+        break_even = calculate_break_even(
+            parsed_inputs,
+            delay_month=int(data.get('delay_month', 1)),
+            delay_expense=float(data.get('delay_expense', 0.0)),
+            max_delay=int(data['max_delay']) if data.get('max_delay') is not None else None
+        )
+
+        return jsonify({'success': True, 'sensitivity': sensitivity, 'break_even': break_even})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@routes.route('/save_scenario', methods=['POST'])
+def save_scenario_route():
+    """Save a named scenario of a project as overrides of its inputs
+
+    overrides use the format of /generate_forecasts. Saving under a name the
+    project already has replaces that scenario's overrides.
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'success': False, 'message': 'No data provided'}), 400
+
+        name = data.get('name', '')
+        if not name:
+            return jsonify({'success': False, 'message': 'Scenario name is required'}), 400
+        if data.get('project_id') is None:
+            return jsonify({'success': False, 'message': 'project_id is required'}), 400
+        project_id = int(data['project_id'])
+        overrides = data.get('overrides', {})
+        if not isinstance(overrides, dict):
+            return jsonify({'success': False, 'message': 'overrides must be an object'}), 400
+
+        parsed_inputs = load_project_inputs(project_id)
+        if parsed_inputs is None:
+            return jsonify({'success': False, 'message': 'Project not found'}), 404
+        # Overrides that do not apply to the project are turned away now rather than at every comparison
+        apply_overrides(parsed_inputs, overrides)
+
+        conn = get_db()
+
+        def save():
+            try:
+                scenario_id = upsert_scenario(conn, project_id, name, overrides)
+                conn.commit()
+                return scenario_id
+            except Exception:
+                conn.rollback()
+                raise
+
+        scenario_id = run_with_retry(save)
+        storage_log.info("Scenario '%s' of project %s saved with ID: %s", name, project_id, scenario_id)
+        return jsonify({'success': True, 'message': 'Scenario saved successfully', 'scenario_id': scenario_id})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        storage_log.exception("Error saving scenario")
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@routes.route('/get_scenarios/<int:project_id>', methods=['GET'])
+def get_scenarios(project_id):
+    """Get the saved scenarios of a project"""
+    try:
+        conn = get_db()
+        if conn.execute('SELECT 1 FROM projects WHERE id = ?', (project_id,)).fetchone() is None:
+            return jsonify({'success': False, 'message': 'Project not found'}), 404
+        return jsonify({'success': True, 'scenarios': load_scenarios(conn, project_id)})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@routes.route('/delete_scenario/<int:scenario_id>', methods=['DELETE'])
+def delete_scenario(scenario_id):
+    """Delete a saved scenario"""
+    try:
+        conn = get_db()
+
+        def delete():
+            try:
+                deleted = conn.execute('DELETE FROM scenarios WHERE id = ?', (scenario_id,)).rowcount
+                conn.commit()
+                return deleted
+            except Exception:
+                conn.rollback()
+                raise
+
+        if not run_with_retry(delete):
+            return jsonify({'success': False, 'message': 'Scenario not found'}), 404
+        return jsonify({'success': True, 'message': 'Scenario deleted successfully'})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@routes.route('/compare', methods=['POST'])
+def compare_route():
+    """Forecast a project and its scenarios in one pass and diff each scenario against the base
+
+    Takes the 'project_id' of a saved project, whose saved scenarios are
+    compared (only those in 'scenario_ids' when given), or posted 'inputs'.
+    Either way 'scenarios' can add unsaved ones as {name, overrides}. Each
+    scenario comes back with its headline figures, their differences from
+    the base and month-by-month deltas of the cash columns.
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'success': False, 'message': 'No data provided'}), 400
+
+        scenarios = []
+        if data.get('project_id') is not None:
+            project_id = int(data['project_id'])
+            parsed_inputs = load_project_inputs(project_id)
+            if parsed_inputs is None:
+                return jsonify({'success': False, 'message': 'Project not found'}), 404
+            scenario_ids = data.get('scenario_ids')
+            if scenario_ids is not None:
+                scenario_ids = list(dict.fromkeys(int(scenario_id) for scenario_id in scenario_ids))
+            saved = load_scenarios(get_db(), project_id, scenario_ids)
+            if scenario_ids is not None and len(saved) != len(scenario_ids):
+                return jsonify({'success': False, 'message': 'Scenario not found'}), 404
+            scenarios.extend({'id': scenario['id'], 'name': scenario['name'], 'overrides': scenario['overrides']}
+                             for scenario in saved)
+        else:
+            inputs = data.get('inputs')
+            if not inputs:
+                return jsonify({'success': False, 'message': 'No inputs provided'}), 400
+            if not validate_inputs(inputs):
+                return jsonify({'success': False, 'message': 'Invalid inputs provided'}), 400
+            parsed_inputs = parse_inputs(inputs)
+            if not isinstance(parsed_inputs, dict):
+                return jsonify({'success': False, 'message': 'Failed to parse inputs'}), 400
+        for scenario in data.get('scenarios', []):
+            if not isinstance(scenario, dict) or not isinstance(scenario.get('overrides', {}), dict):
+                return jsonify({'success': False, 'message': 'Each scenario must be an object with overrides'}), 400
+            scenarios.append({'id': None, 'name': scenario.get('name', ''), 'overrides': scenario.get('overrides', {})})
+
+        if not scenarios:
+            return jsonify({'success': False, 'message': 'No scenarios to compare'}), 400
+        if len(scenarios) > MAX_COMPARED_SCENARIOS:
+            return jsonify({'success': False, 'message': f'At most {MAX_COMPARED_SCENARIOS} scenarios per comparison'}), 400
+        if not parsed_inputs['phases']:
+            return jsonify({'success': False, 'message': 'No phases provided'}), 400
+
+        # The base and every scenario are forecast together, in structure-sharing batches
+        parsed_variants = [parsed_inputs] + [apply_overrides(parsed_inputs, scenario['overrides']) for scenario in scenarios]
+        results = cached_forecasts(parsed_variants)
+        comparison = compare_forecasts(results[0], list(zip(scenarios, results[1:])))
+        return jsonify({'success': True, 'comparison': comparison})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@routes.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    """Get forecast cache hit, miss and eviction counters"""
+    return jsonify({'success': True, 'cache': get_forecast_cache().stats()})
+
+@routes.route('/metrics', methods=['GET'])
+def metrics():
+    """Request, stage and database timings in the Prometheus text format"""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+@routes.route('/simulate', methods=['POST'])
+def simulate_route():
+    """Run a Monte Carlo risk simulation of the forecast"""
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'success': False, 'message': 'No data provided'}), 400
+
+        simulation = simulate(data)
+        return jsonify({'success': True, 'message': 'Simulation completed successfully', 'simulation': simulation})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+def simulate(data, progress=None):
+    """Simulation of a /simulate request body; raises ValueError when it is invalid"""
+    inputs = data.get('inputs')
+    if not inputs:
+        raise ValueError('No inputs provided')
+    if not validate_inputs(inputs):
+        raise ValueError('Invalid inputs provided')
+
+    draws = int(data.get('draws', DEFAULT_SIMULATION_DRAWS))
+    if draws < 1 or draws > MAX_SIMULATION_DRAWS:
+        raise ValueError(f'draws must be between 1 and {MAX_SIMULATION_DRAWS}')
+    seed = data.get('seed')
+    percentiles = data.get('percentiles', DEFAULT_PERCENTILES)
+
+    parsed_inputs = parse_inputs(inputs)
+    if not isinstance(parsed_inputs, dict):
+        raise ValueError('Failed to parse inputs')
+    if not parsed_inputs['phases']:
+        raise ValueError('No phases provided')
+
+    return run_simulation(
+        parsed_inputs,
+        data.get('distributions', {}),
+        draws=draws,
+        seed=int(seed) if seed is not None else None,
+        percentiles=[float(percentile) for percentile in percentiles],
+        workers=data.get('workers'),
+        progress=progress
+    )
+
 def validate_inputs(inputs):
-    """Validate the inputs"""
-    """Leaving this function empty for now"""
-    return True
+    """Validate the inputs
+
+    The contract value must be a positive number, since the gross margin is
+    a share of it, and delays cannot have a negative length. Values that do
+    not convert are left to parse_inputs.
+    """
+    try:
+        if not 0 < float(inputs['contract_value']) < math.inf:
+            return False
+    except (KeyError, TypeError, ValueError):
+        pass
+    try:
+        return all(int(delay.get('length', 0)) >= 0 for delay in inputs.get('delays', {}).values())
+    except (AttributeError, TypeError, ValueError):
+        return True
 
-@app.route('/get_projects', methods=['GET'])
+@routes.route('/get_projects', methods=['GET'])
 def get_projects():
-    """Get all saved projects"""
+    """Get one page of saved projects, newest first
+
+    Query parameters: limit, cursor (the next_cursor of the previous page),
+    fields (comma separated columns), name (prefix), start_from and start_to
+    (YYYY-MM-DD), min_contract_value and max_contract_value. The page is
+    streamed row by row instead of being built in memory.
+    """
     try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+        if limit < 1 or limit > MAX_PAGE_SIZE:
+            return jsonify({'success': False, 'message': f'limit must be between 1 and {MAX_PAGE_SIZE}'}), 400
+        fields = [field.strip() for field in request.args.get('fields', '').split(',') if field.strip()]
+        fields = list(dict.fromkeys(fields)) or list(PROJECT_LIST_FIELDS)
+        filters = {
+            name: request.args[name]
+            for name in ('name', 'start_from', 'start_to', 'min_contract_value', 'max_contract_value')
+            if request.args.get(name)
+        }
+        # One extra row tells whether there is a next page
+        query, params = list_projects_query(fields, filters, request.args.get('cursor'), limit + 1)
         conn = get_db()
-        projects = conn.execute('''
-            SELECT id, name, start_date, contract_value, time_frame, payment_lag, 
-                   contingency_percent, cash_floor, created_at, updated_at
-            FROM projects
-            ORDER BY created_at DESC
-        ''').fetchall()
-        conn.close()
-        
-        projects_list = []
-        for project in projects:
-            projects_list.append({
-                'id': project['id'],
-                'name': project['name'],
-                'start_date': project['start_date'] or '',
-                'contract_value': project['contract_value'],
-                'time_frame': project['time_frame'],
-                'payment_lag': project['payment_lag'],
-                'contingency_percent': project['contingency_percent'],
-                'cash_floor': project['cash_floor'],
-                'created_at': project['created_at'],
-                'updated_at': project['updated_at']
-            })
-        
-        return jsonify({'success': True, 'projects': projects_list})
+        cursor = conn.execute(query, params)
+        rows = cursor.fetchmany(PROJECT_CHUNK_SIZE)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+    def generate(rows):
+        yield '{"success": true, "projects": ['
+        count = 0
+        next_cursor = None
+        while rows:
+            for row in rows:
+                if count == limit:
+                    next_cursor = encode_cursor(last)
+                    break
+                project = {field: row[field] for field in fields}
+                if 'start_date' in project:
+                    project['start_date'] = project['start_date'] or ''
+                yield (',' if count else '') + json.dumps(project)
+                last = row
+                count += 1
+            if next_cursor is not None:
+                break
+            rows = cursor.fetchmany(PROJECT_CHUNK_SIZE)
+        yield f'], "next_cursor": {json.dumps(next_cursor)}}}'
+
+    return Response(stream_with_context(generate(rows)), mimetype='application/json')
+
+@routes.route('/import_projects', methods=['POST'])
+def import_projects_route():
+    """Import projects streamed in the request body
+
+    format is jsonl (default), csv or columnar, laid out as /export_projects
+    writes them. The whole body is read and validated first, then records
+    are inserted in batches of IMPORT_BATCH_SIZE within one transaction.
+    Invalid records are reported by number; unless skip_invalid=1 is given,
+    any invalid record means nothing is imported.
+    """
+    try:
+        format = request.args.get('format', 'jsonl')
+        if format not in FORMATS:
+            return jsonify({'success': False, 'message': f'Unknown format: {format}'}), 400
+        skip_invalid = request.args.get('skip_invalid', '').lower() in ('1', 'true', 'yes')
+
+        report = import_projects(get_db(), read_records(request.stream, format), skip_invalid)
+        storage_log.info("Imported %d projects, %d invalid records", report['imported'], report['error_count'])
+        if not report['committed']:
+            return jsonify({'success': False, 'message': f"{report['error_count']} invalid records, nothing imported",
+                            **report}), 400
+        return jsonify({'success': True, 'message': f"{report['imported']} projects imported", **report})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        storage_log.exception("Error importing projects")
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@routes.route('/export_projects', methods=['GET'])
+def export_projects_route():
+    """Stream every project with its phases, delays, milestones and unexpected costs
+
+    format is jsonl (default), csv or columnar. Projects are read from the
+    database one chunk at a time as the response is sent, so memory stays
+    bounded however many there are.
+    """
+    format = request.args.get('format', 'jsonl')
+    if format not in FORMATS:
+        return jsonify({'success': False, 'message': f'Unknown format: {format}'}), 400
+    try:
+        records = iter_export_records(get_db())
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
+    return Response(
+        stream_with_context(write_records(records, format)),
+        mimetype=FORMATS[format],
+        headers={'Content-Disposition': f'attachment; filename=projects.{EXTENSIONS[format]}'}
+    )
 
-@app.route('/get_project/<int:project_id>', methods=['GET'])
+@routes.route('/get_project/<int:project_id>', methods=['GET'])
 def get_project(project_id):
-    """Get a specific project by ID with all its data"""
+    """Get a specific project by ID with all its data
+
+    Projects are only ever inserted, so the id and updated_at identify the
+    response; a client revalidating with If-None-Match gets a 304 without
+    the child rows being read.
+    """
     try:
         conn = get_db()
+        version = project_version(project_id)
+        if version is None:
+            return jsonify({'success': False, 'message': 'Project not found'}), 404
+        etag = f'project-{version}'
+        unchanged = not_modified(request, etag)
+        if unchanged is not None:
+            return unchanged
+
         project = conn.execute('''
             SELECT id, name, start_date, contract_value, time_frame, payment_lag, 
-                   contingency_percent, cash_floor, phases, delays, 
-                   unexpected_costs, billing_milestones, created_at, updated_at
+                   contingency_percent, cash_floor, created_at, updated_at
             FROM projects
             WHERE id = ?
         ''', (project_id,)).fetchone()
-        conn.close()
         
         if not project:
             return jsonify({'success': False, 'message': 'Project not found'}), 404
         
-        # Parse JSON strings back to dictionaries
-        # Convert delay keys from strings to integers (as they were stored as strings)
-        delays_parsed = json.loads(project['delays'])
-        delays_converted = {}
-        for key, value in delays_parsed.items():
-            delays_converted[int(key)] = value
+        children = load_project_children(conn, [project_id])[project_id]
         
         project_data = {
             'id': project['id'],
@@ -155,19 +801,225 @@ def get_project(project_id):
             'payment_lag': project['payment_lag'],
             'contingency_percent': project['contingency_percent'],
             'cash_floor': project['cash_floor'],
-            'phases': json.loads(project['phases']),
-            'delays': delays_converted,
-            'unexpected_costs': json.loads(project['unexpected_costs']),
-            'billing_milestones': json.loads(project['billing_milestones']),
+            'phases': children['phases'],
+            'delays': children['delays'],
+            'unexpected_costs': children['unexpected_costs'],
+            'billing_milestones': children['billing_milestones'],
             'created_at': project['created_at'],
             'updated_at': project['updated_at']
         }
         
-        return jsonify({'success': True, 'project': project_data})
+        return tag_response(jsonify({'success': True, 'project': project_data}), etag)
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@routes.route('/project_forecast/<int:project_id>', methods=['GET'])
+def project_forecast(project_id):
+    """Forecast of a saved project, revalidated with its ETag instead of re-sent
+
+    ?format=rows (default) or columnar.
+    """
+    try:
+        format = response_format(request.args.get('format', 'rows'))
+        version = project_version(project_id)
+        if version is None:
+            return jsonify({'success': False, 'message': 'Project not found'}), 404
+        etag = f'forecast-{version}-{format}'
+        unchanged = not_modified(request, etag)
+        if unchanged is not None:
+            return unchanged
+
+        parsed_inputs = load_project_inputs(project_id)
+        key = inputs_key(parsed_inputs)
+        forecast_result = get_forecast_cache().get_or_compute(key, lambda: run_engine('loop', parsed_inputs))
+        response = jsonify({'success': True, 'forecast': forecast_json(forecast_result, format), 'forecast_key': key})
+        return tag_response(response, etag)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@routes.route('/forecast/<forecast_key>', methods=['GET'])
+def get_forecast(forecast_key):
+    """A cached forecast by the forecast_key /generate_forecast or /update_forecast returned
+
+    The key is a hash of the inputs, so the forecast behind it never changes
+    and If-None-Match is answered without touching the cache.
+    """
+    try:
+        format = response_format(request.args.get('format', 'rows'))
+        etag = f'{forecast_key}-{format}'
+        unchanged = not_modified(request, etag)
+        if unchanged is not None:
+            return unchanged
+
+        forecast_result = get_forecast_cache().get(forecast_key)
+        if forecast_result is None:
+            return jsonify({'success': False, 'message': 'Forecast not found; generate it again'}), 404
+        response = jsonify({'success': True, 'forecast': forecast_json(forecast_result, format), 'forecast_key': forecast_key})
+        return tag_response(response, etag)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
-@app.route('/create_project', methods=['POST'])
+@routes.route('/projects_with_delays', methods=['GET'])
+def projects_with_delays():
+    """Find projects with a delay longer than min_length months, optionally in one phase"""
+    try:
+        min_length = int(request.args.get('min_length', 0))
+        phase = request.args.get('phase') or None
+        conn = get_db()
+        projects = find_projects_with_delays(conn, min_length, phase)
+        return jsonify({'success': True, 'projects': projects})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@routes.route('/portfolio_forecast', methods=['GET'])
+def portfolio_forecast():
+    """Get the combined forecast of all saved projects, or a filtered subset"""
+    try:
+        # Optional filters: ids=1,2,3, name (prefix), start_from and start_to (YYYY-MM-DD)
+        portfolio = portfolio_for(get_db(), request.args)
+        return jsonify({'success': True, 'portfolio': portfolio})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+def portfolio_for(conn, filters, progress=None):
+    """Portfolio forecast of the projects matching the /portfolio_forecast filters"""
+    conditions, params = project_filter_conditions(filters)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+    # Only counted when someone is watching the progress
+    total = conn.execute(f'SELECT COUNT(*) FROM projects {where}', params).fetchone()[0] if progress else None
+    # Rows are streamed from the cursor and forecast chunk by chunk, never loaded all at once
+    cursor = conn.execute(f'''
+        SELECT id, name, start_date, contract_value, time_frame, payment_lag,
+               contingency_percent, cash_floor
+        FROM projects
+        {where}
+        ORDER BY start_date, id
+    ''', params)
+    projects = (
+        {
+            'id': row['id'],
+            'name': row['name'],
+            'start_date': row['start_date'],
+            'inputs': inputs
+        }
+        for row, inputs in iter_projects_with_inputs(conn, cursor)
+    )
+    return aggregate_portfolio(projects, progress=progress, total=total)
+
+@routes.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue a forecasts, simulate or portfolio job and return its id at once
+
+    params is the body /generate_forecasts or /simulate take, or the query
+    parameters of /portfolio_forecast. Poll /jobs/<id> for the result, or
+    follow /jobs/<id>/events for its progress.
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'success': False, 'message': 'No data provided'}), 400
+        kind = data.get('kind')
+        if kind not in JOB_HANDLERS:
+            return jsonify({'success': False, 'message': f'Unknown job kind: {kind}'}), 400
+        params = data.get('params', {})
+        if not isinstance(params, dict):
+            return jsonify({'success': False, 'message': 'params must be an object'}), 400
+
+        job_id = create_job(get_db(), kind, params)
+        if job_id is None:
+            return jsonify({'success': False, 'message': 'Too many queued jobs, try again later'}), 429
+        current_app.extensions['job_runner'].wake()
+        log.info("Queued %s job %s", kind, job_id)
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status_url': f'/jobs/{job_id}',
+            'events_url': f'/jobs/{job_id}/events'
+        }), 202, {'Location': f'/jobs/{job_id}'}
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@routes.route('/jobs/<job_id>', methods=['GET'])
+def get_job_route(job_id):
+    """Get a job's status and progress, with its result once it has succeeded"""
+    try:
+        job = get_job(get_db(), job_id, with_result=True)
+        if job is None:
+            return jsonify({'success': False, 'message': 'Job not found'}), 404
+        return jsonify({'success': True, 'job': job})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@routes.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job_route(job_id):
+    """Cancel a queued job, or ask a running one to stop"""
+    try:
+        status = cancel_job(get_db(), job_id)
+        if status is None:
+            return jsonify({'success': False, 'message': 'Job not found'}), 404
+        if status in ('succeeded', 'failed'):
+            return jsonify({'success': False, 'message': f'Job already {status}', 'status': status}), 409
+        if status == 'running':
+            return jsonify({'success': True, 'message': 'Cancellation requested', 'status': status}), 202
+        return jsonify({'success': True, 'message': 'Job cancelled', 'status': status})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@routes.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Stream a job's progress as server-sent events until it finishes
+
+    A 'progress' event carries the job whenever its status, progress or
+    message change, and a 'done' event the finished job, without its
+    result. Each open stream holds a server thread.
+    """
+    try:
+        if get_job(get_db(), job_id) is None:
+            return jsonify({'success': False, 'message': 'Job not found'}), 404
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+    database = current_app.config['DATABASE']
+
+    def generate():
+        # Its own connection, so a long stream does not keep one from the pool
+        conn = connect(database)
+        try:
+            sent = None
+            last_sent = time.monotonic()
+            while True:
+                job = get_job(conn, job_id)
+                if job is None:
+                    yield 'event: error\ndata: {"message": "Job not found"}\n\n'
+                    return
+                if job['status'] in FINISHED_STATUSES:
+                    yield f'event: done\ndata: {json.dumps(job)}\n\n'
+                    return
+                state = (job['status'], job['progress'], job['message'])
+                if state != sent:
+                    yield f'event: progress\ndata: {json.dumps(job)}\n\n'
+                    sent = state
+                    last_sent = time.monotonic()
+                elif time.monotonic() - last_sent > JOB_EVENTS_KEEPALIVE_SECONDS:
+                    # A comment line keeps proxies from closing an idle stream
+                    yield ': keepalive\n\n'
+                    last_sent = time.monotonic()
+                time.sleep(JOB_EVENTS_POLL_SECONDS)
+        finally:
+            conn.close()
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@routes.route('/create_project', methods=['POST'])
 def create_project_route():
     """Create and save a project"""
     try:
@@ -191,6 +1043,12 @@ def create_project_route():
         
         # Save the project to database
         project_id = save_project_to_db(project_name, parsed_inputs, inputs)
+
+        # Precompute the forecast so opening the project is a cache lookup
+        try:
+            get_forecast_cache().get_or_compute(inputs_key(parsed_inputs), lambda: run_engine('loop', parsed_inputs))
+        except Exception as e:
+            log.warning("Error precomputing forecast for project %s: %s", project_id, e)
         
         return jsonify({
             'success': True, 
@@ -210,6 +1068,7 @@ def create_project_route():
 # Payment lag -- what is this?
 # Billing Milstones -- what is this?
 
+@timed_stage('parse_inputs')
 def parse_inputs(inputs):
     """Parse the inputs"""
     try:
@@ -221,7 +1080,7 @@ def parse_inputs(inputs):
         min_cash_allowed = float(inputs['cash_floor'])
         contingency_percent = float(inputs['contingency_percent'])
 
-        print("Inputs converted")
+        inputs_log.debug("Inputs converted")
 
         phases = inputs.get('phases', {})
         delays = inputs.get('delays', {})
@@ -236,7 +1095,7 @@ def parse_inputs(inputs):
                     'length': int(delay.get('length', 0)),
                     'expense': float(delay.get('expense', 0))
                 }
-        print("Delays converted")
+        inputs_log.debug("Delays converted")
 
         # Convert phase values to proper types
         phases_processed = {}
@@ -247,18 +1106,18 @@ def parse_inputs(inputs):
                 'overhead': float(phase_data.get('overhead', 0)),
                 'upfront': float(phase_data.get('upfront', 0))
             }
-        print("Phases converted")
+        inputs_log.debug("Phases converted")
 
         # Convert unexpected costs to proper types
         unexpected_costs_processed = {}
         for key, value in unexpected_costs.items():
             unexpected_costs_processed[str(key)] = float(value)
-        print("Unexpected costs converted")
+        inputs_log.debug("Unexpected costs converted")
         # Convert billing milestones keys to strings (they come as strings from frontend)
         billing_milestones_processed = {}
         for key, value in billing_milestones.items():
             billing_milestones_processed[str(key)] = float(value)
-        print("Billing milestones converted")
+        inputs_log.debug("Billing milestones converted")
 
         phases = phases_processed
         delays = delays_processed
@@ -279,230 +1138,133 @@ def parse_inputs(inputs):
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@timed_stage('calculate_forecast')
 def calculate_forecast(parsed_inputs):
-    """Generate the forecast"""
+    """Generate the forecast as a ForecastResult"""
     try:
-        time_frame = parsed_inputs['time_frame']
-        payment_lag = parsed_inputs['payment_lag']
-        contract_value = parsed_inputs['contract_value']
-        min_cash_allowed = parsed_inputs['min_cash_allowed']
-        contingency_percent = parsed_inputs['contingency_percent']
-        phases = parsed_inputs['phases']
-        delays = parsed_inputs['delays']
-        unexpected_costs = parsed_inputs['unexpected_costs']
-        billing_milestones = parsed_inputs['billing_milestones']
-        print("Inputs Setup Complete")
-
-        min_net_cash = 0
-        min_net_cash_month = 0
-        verdict = 'Go'
-        cumulative_net_cash = 0
-        cumulative_expenses = 0
-        payback_period = 999
-        payback_found = False
-
-        total_delays = sum(delay['length'] for delay in delays.values())
-        cumulative_delays = 0
-        current_delay = False
-        delay_remaining = 0
-
-        print("Total delays calculated")
-
-        if not phases:
+        # Typed once here, so the month loop reads plain attributes
+        forecast_input = ForecastInput.from_parsed(parsed_inputs)
+        engine_log.debug("Inputs Setup Complete")
+
+        if not forecast_input.phases:
             return {'success': False, 'message': 'No phases provided'}
-        
-        current_phase = next(iter(phases))
-        current_phase_remaining = int(phases[current_phase]['length']) - 1
-        current_phase_expense = float(phases[current_phase]['expense'])
-        current_phase_overhead = float(phases[current_phase]['overhead'])
-        current_phase_upfront = float(phases[current_phase]['upfront'])
-        phase_change = True
-        cumulative_cash_out = 0
-        delay_start = 0
-        # Calculate the forecast
-        forecast = []
-
-        print("Setup Complete")
-        for i in range(1, time_frame+payment_lag+total_delays+1):
-            # Determine current delay
-            # If the current month is a delay, set the current delay to true and decrement the delay remaining
-            # If the delay remaining is 0, set the current delay to false
-            if i in delays:
-                cumulative_delays += int(delays[i]['length'])
-                current_delay = True
-                delay_remaining = int(delays[i]['length']) - 1
-                delay_start = i
-            elif current_delay and delay_remaining > 0:
-                delay_remaining -= 1
-            else:
-                current_delay = False
-                delay_remaining = 0
-                delay_start = 0
-
-            print("Delay Determined")
-
-            # Determine current phase
-            # If the current phase is not complete, decrement the remaining months and set the phase change to false
-            if current_phase_remaining >= 0:
-                if not current_delay:
-                    current_phase_remaining -= 1
-                phase_change = False
-            else:
-                # Get next phase (this is a simplified version - you may want to track phase order)
-                phase_list = list(phases.keys())
-                current_index = phase_list.index(current_phase) if current_phase in phase_list else 0
-                next_index = (current_index + 1) % len(phase_list)
-                if next_index == 0:
-                    current_phase = None
-                    current_phase_remaining = 99
-                    phase_change = True
-                    current_phase_expense = 0
-                    current_phase_overhead = 0
-                    current_phase_upfront = 0
-                else: 
-                    current_phase = phase_list[next_index]
-                    current_phase_remaining = int(phases[current_phase]['length']) - 1
-                    current_phase_expense = float(phases[current_phase]['expense'])
-                    current_phase_overhead = float(phases[current_phase]['overhead'])
-                    current_phase_upfront = float(phases[current_phase]['upfront'])
-                    phase_change = True
-
-            print("Phase Determined")
-
-            # Check if current phase has unexpected costs
-            if current_phase in unexpected_costs:
-                unexpected_cost_percent = unexpected_costs[current_phase]
-                unexpected_cost = current_phase_expense * unexpected_cost_percent
-            else: 
-                unexpected_cost = 0
-            
-            print("Unexpected Cost Determined")
-
-            # Calculate the cash in and cash out
-            # billing_milestones is a dict with month indices (0-based) and percentages
-            if not current_delay:
-                milestone_key = str(i - payment_lag - cumulative_delays) if i >= payment_lag + cumulative_delays else None
-                milestone_percent = billing_milestones.get(milestone_key, 0) if milestone_key else 0
-                cash_in = milestone_percent * contract_value
-            else:
-                cash_in = 0
-
-            print("Cash In Determined")
-
-            # During a delay, the cash out is just the delay expense plus overhead
-            # Overhead does not apply to cumulative expense that is uses for gross margin calculation
-            if current_delay:
-                if delay_start in delays:
-                    delay_expense = float(delays[delay_start]['expense'])
-                    cumulative_expenses += delay_expense
-                    cash_out = delay_expense + current_phase_overhead
-            else:
-                cumulative_expenses += current_phase_expense + (contingency_percent * current_phase_expense) + unexpected_cost
-                cash_out = current_phase_expense + current_phase_overhead + (contingency_percent * current_phase_expense) + unexpected_cost
-
-            print("Cash Out Determined")
-
-            net_cash = cash_in - cash_out
-            cumulative_net_cash += net_cash
-            cumulative_cash_out += cash_out
-
-            if phase_change or i == 1:
-                net_cash -= current_phase_upfront
-                cash_out += current_phase_upfront
-                cumulative_net_cash -= current_phase_upfront
-                cumulative_expenses -= current_phase_upfront
-            forecast.append({
-                'cash_in': cash_in,
-                'cash_out': cash_out,
-                'net_cash': net_cash,
-                'cumulative_net_cash': cumulative_net_cash,
-                'phase': current_phase,
-            })
-            print("Forecast Appended")
-
-            # Set the minimum net cash and the minimum net cash month
-            if i == 1:
-                min_net_cash = cumulative_net_cash
-            else:
-                if cumulative_net_cash < min_net_cash:
-                    min_net_cash = cumulative_net_cash
-                    min_net_cash_month = i
-
-            # If the cumulative net cash is less than the minimum cash allowed, the project is should be restructured
-            if cumulative_net_cash < min_cash_allowed:
-                verdict = 'Restructure'
-            
-            # If the cumulative net cash is greater than 0 and the payback period has not been found, set the payback period to the current month
-            if cumulative_net_cash > 0 and payback_found == False:
-                payback_period = i
-                payback_found = True
-                
-        print("made it through loop")
-        # If the contract value is less than the monthly expense multiplied by the time frame, the project is not profitable
-        if contract_value < cumulative_cash_out:
-            verdict = 'Not Profitable'
-
-        # Calculate the gross margin and the margin with contingency
-        gross_margin = (contract_value - cumulative_expenses) / contract_value
-
-        print(forecast)
 
-        return {
-            'forecast': forecast,
-            'verdict': verdict,
-            'payback_period': payback_period,
-            'gross_margin': gross_margin,
-            'min_net_cash': min_net_cash,
-            'min_net_cash_month': min_net_cash_month,
-            'cumulative_net_cash': cumulative_net_cash
-        }
-    except Exception as e:
-        print("Exception in generate_forecast: ", e)
-        return jsonify({'success': False, 'message': str(e)}), 500
+        engine_log.debug("Setup Complete, %d months to forecast", forecast_horizon(forecast_input))
+        # The month loop lives in incremental.py so an edit can resume it from a checkpoint
+        result = forecast_with_checkpoints(forecast_input)
+        engine_log.debug("Forecast loop complete")
+        if engine_log.isEnabledFor(logging.DEBUG):
+            engine_log.debug("Forecast: %s", result.rows())
+        return result
+    except Exception:
+        # Raised for the caller to answer; a response here would be cached or serialized as a forecast
+        engine_log.exception("Exception in generate_forecast")
+        raise
+
+# Forecast engines selectable with the 'engine' option on /generate_forecast
+# Both return the same ForecastResult; the vectorized engine avoids the per-month Python loop
+FORECAST_ENGINES = {
+    'loop': calculate_forecast,
+    'vectorized': timed_stage('calculate_forecast_vectorized')(calculate_forecast_result),
+}
+
+# Resumes a loop-engine forecast from its last checkpoint before the first changed month
+update_forecast_from = timed_stage('update_forecast')(update_forecast)
+
+# Background job kinds: each takes the job's params and a progress callback, see jobs.py
+JOB_HANDLERS = {
+    'forecasts': lambda params, progress: {'forecasts': batch_forecasts(params, progress)},
+    'simulate': lambda params, progress: {'simulation': simulate(params, progress)},
+    'portfolio': lambda params, progress: {'portfolio': portfolio_for(get_db(), params, progress)},
+}
 
+@contextmanager
+def job_context(app):
+    """App context a background job runs in, returning its connection to the pool afterwards"""
+    with app.app_context():
+        try:
+            yield
+        finally:
+            release_db(None)
+
+def run_engine(engine, parsed_inputs):
+    """Run a forecast engine and record how many months it simulated"""
+    result = FORECAST_ENGINES[engine](parsed_inputs)
+    if isinstance(result, ForecastResult):
+        observe_horizon(len(result))
+    return result
+
+def forecast_json(result, format='rows'):
+    """Convert a forecast to the JSON response, per-month dicts or columnar arrays; errors pass through"""
+    if not isinstance(result, ForecastResult):
+        return result
+    return result.to_columns() if format == 'columnar' else result.to_dict()
+
+def response_format(format):
+    """Check a requested forecast format"""
+    if format not in RESPONSE_FORMATS:
+        raise ValueError(f'format must be one of {", ".join(RESPONSE_FORMATS)}')
+    return format
+
+@timed_stage('save_project_to_db')
 def save_project_to_db(project_name, parsed_inputs, original_inputs):
     """Save project to SQLite database"""
     try:
         conn = get_db()
         
-        # Convert complex data structures to JSON strings for storage
-        phases_json = json.dumps(parsed_inputs['phases'])
-        delays_json = json.dumps({str(k): v for k, v in parsed_inputs['delays'].items()})
-        unexpected_costs_json = json.dumps(parsed_inputs['unexpected_costs'])
-        billing_milestones_json = json.dumps(parsed_inputs['billing_milestones'])
-        
         start_date = original_inputs.get('start_date', '')
+
+        def insert_project():
+            try:
+                cursor = conn.execute('''
+                    INSERT INTO projects (
+                        name, start_date, contract_value, time_frame, payment_lag, 
+                        contingency_percent, cash_floor
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    project_name,
+                    start_date,
+                    parsed_inputs['contract_value'],
+                    parsed_inputs['time_frame'],
+                    parsed_inputs['payment_lag'],
+                    parsed_inputs['contingency_percent'],
+                    parsed_inputs['min_cash_allowed']
+                ))
+                # Phases, delays, milestones and unexpected costs go to their own tables in the same transaction
+                insert_project_children(conn, cursor.lastrowid, parsed_inputs)
+                conn.commit()
+                return cursor.lastrowid
+            except Exception:
+                conn.rollback()
+                raise
+
+        # A write that still finds the database locked after the busy timeout is retried
+        project_id = run_with_retry(insert_project)
         
-        cursor = conn.execute('''
-            INSERT INTO projects (
-                name, start_date, contract_value, time_frame, payment_lag, 
-                contingency_percent, cash_floor, phases, delays, 
-                unexpected_costs, billing_milestones
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            project_name,
-            start_date,
-            parsed_inputs['contract_value'],
-            parsed_inputs['time_frame'],
-            parsed_inputs['payment_lag'],
-            parsed_inputs['contingency_percent'],
-            parsed_inputs['min_cash_allowed'],
-            phases_json,
-            delays_json,
-            unexpected_costs_json,
-            billing_milestones_json
-        ))
-        
-        project_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        
-        print(f"Project '{project_name}' saved with ID: {project_id}")
+        storage_log.info("Project '%s' saved with ID: %s", project_name, project_id)
         return project_id
     except Exception as e:
-        print(f"Error saving project: {e}")
+        storage_log.exception("Error saving project")
         raise
 
+def project_version(project_id):
+    """The id and updated_at of a saved project for its ETags, or None if it does not exist"""
+    row = get_db().execute('SELECT updated_at FROM projects WHERE id = ?', (project_id,)).fetchone()
+    # ETags may not hold spaces: '2024-01-01 12:00:00' -> '2024-01-01T12:00:00'
+    return f"{project_id}-{row['updated_at'].replace(' ', 'T')}" if row else None
+
+def load_project_inputs(project_id):
+    """Load the parsed inputs of a saved project, or None if it does not exist"""
+    conn = get_db()
+    project = conn.execute('''
+        SELECT id, time_frame, payment_lag, contract_value, contingency_percent, cash_floor
+        FROM projects
+        WHERE id = ?
+    ''', (project_id,)).fetchone()
+    parsed_inputs = project_inputs(project, load_project_children(conn, [project_id])[project_id]) if project else None
+    return parsed_inputs
+
 if __name__ == '__main__':
+    # Development server only; production runs gunicorn -c gunicorn.conf.py wsgi:app
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=False)
+    create_app(init_schema=True).run(host='0.0.0.0', port=port, debug=False, threaded=True)
@@ -0,0 +1,92 @@
+import hashlib
+import mimetypes
+import os
+import re
+from functools import lru_cache
+
+from flask import Response, abort, request
+from werkzeug.security import safe_join
+
+from responses import compress, is_compressible, negotiate_encoding
+
+# Fingerprinted URLs change whenever the file does, so browsers may keep them for a year
+FINGERPRINTED_MAX_AGE = 365 * 24 * 3600
+FINGERPRINT_LENGTH = 12
+# 'script.0123456789ab.js' -> ('script', '0123456789ab', '.js')
+FINGERPRINTED_NAME = re.compile(rf'^(.*)\.([0-9a-f]{{{FINGERPRINT_LENGTH}}})(\.[^./]+)$')
+
+
+@lru_cache(maxsize=256)
+def read_asset(path, mtime_ns, size):
+    """Contents and fingerprint of a static file, read once per version of the file"""
+    with open(path, 'rb') as source:
+        data = source.read()
+    return data, hashlib.sha256(data).hexdigest()[:FINGERPRINT_LENGTH]
+
+
+@lru_cache(maxsize=256)
+def compressed_asset(path, mtime_ns, size, encoding):
+    """A static file compressed at the highest level, once per version and coding"""
+    return compress(read_asset(path, mtime_ns, size)[0], encoding, static=True)
+
+
+def asset_version(path):
+    stat = os.stat(path)
+    return path, stat.st_mtime_ns, stat.st_size
+
+
+def fingerprinted_filename(static_folder, filename):
+    """filename with the fingerprint of its contents before the extension, e.g. script.0123456789ab.js"""
+    path = safe_join(static_folder, filename)
+    if path is None or not os.path.isfile(path):
+        return filename
+    _, digest = read_asset(*asset_version(path))
+    stem, extension = os.path.splitext(filename)
+    return f'{stem}.{digest}{extension}'
+
+
+def fingerprint_static_urls(static_folder):
+    """url_defaults callback making url_for('static', ...) point at fingerprinted filenames"""
+    def add_fingerprint(endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = fingerprinted_filename(static_folder, values['filename'])
+    return add_fingerprint
+
+
+def static_view(static_folder):
+    """View serving the static folder under plain and fingerprinted names
+
+    A fingerprint that matches the file's contents is cached by browsers
+    for a year without revalidation; a plain name, or a stale fingerprint
+    from before a deploy, gets the current file with an ETag to revalidate.
+    Text files are served precompressed in the client's preferred coding.
+    """
+    def serve_static(filename):
+        name, fingerprint = filename, None
+        match = FINGERPRINTED_NAME.match(filename)
+        if match and not os.path.isfile(safe_join(static_folder, filename) or ''):
+            name, fingerprint = match.group(1) + match.group(3), match.group(2)
+        path = safe_join(static_folder, name)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+
+        version = asset_version(path)
+        data, digest = read_asset(*version)
+        mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        encoding = negotiate_encoding(request.accept_encodings) if is_compressible(mimetype) else None
+        if encoding is not None:
+            data = compressed_asset(*version, encoding)
+
+        response = Response(data, mimetype=mimetype)
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        if is_compressible(mimetype):
+            response.vary.add('Accept-Encoding')
+        response.set_etag(f'{digest}-{encoding or "identity"}')
+        if fingerprint == digest:
+            response.headers['Cache-Control'] = f'public, max-age={FINGERPRINTED_MAX_AGE}, immutable'
+        else:
+            response.headers['Cache-Control'] = 'public, no-cache'
+        return response.make_conditional(request)
+
+    return serve_static
@@ -0,0 +1,215 @@
+import itertools
+import math
+
+import numpy as np
+
+from forecast_engine import BATCH_VERDICTS, calculate_forecast_batch
+from models import ForecastResult
+
+MAX_BATCH_FORECASTS = 1000
+# Variants are evaluated together in groups of at most this many
+BATCH_GROUP_SIZE = 250
+
+# Raw input name -> (parsed input name, type), as converted by parse_inputs
+SCALAR_FIELDS = {
+    'time_frame': ('time_frame', int),
+    'payment_lag': ('payment_lag', int),
+    'contract_value': ('contract_value', float),
+    'cash_floor': ('min_cash_allowed', float),
+    'contingency_percent': ('contingency_percent', float),
+}
+PHASE_FIELDS = {'length': int, 'expense': float, 'overhead': float, 'upfront': float}
+
+
+def sweep_phase_field(name):
+    """(phase name, field) of a 'phases.<phase>.<field>' sweep key, or a ValueError naming the key"""
+    phase_name, _, field = name[len('phases.'):].rpartition('.')
+    if not phase_name or field not in PHASE_FIELDS:
+        raise ValueError(f"Invalid sweep key: {name}; phase fields are 'phases.<phase>.<field>' "
+                         f"with field one of {', '.join(PHASE_FIELDS)}")
+    return phase_name, field
+
+
+def sweep_size(sweep):
+    """Number of overrides expand_sweep yields, worked out without expanding the sweep
+
+    Also checks every key names an input, so expand_sweep can trust them.
+    """
+    if not isinstance(sweep, dict) or not all(isinstance(values, list) for values in sweep.values()):
+        raise ValueError('sweep must map input names to lists of values')
+    for name in sweep:
+        if name.startswith('phases.'):
+            sweep_phase_field(name)
+        elif name not in SCALAR_FIELDS and name not in ('delays', 'unexpected_costs', 'billing_milestones'):
+            raise ValueError(f'Invalid sweep key: {name}')
+    return math.prod(len(values) for values in sweep.values())
+
+
+def expand_sweep(sweep):
+    """Yield one override per combination of {'name': [values], ...}
+
+    Names are raw input names; phase fields use a dotted path such as
+    'phases.Design.expense'. Check sweep_size first: the combinations
+    multiply.
+    """
+    names = list(sweep.keys())
+    for values in itertools.product(*(sweep[name] for name in names)):
+        override = {}
+        for name, value in zip(names, values):
+            if name.startswith('phases.'):
+                phase_name, field = sweep_phase_field(name)
+                override.setdefault('phases', {}).setdefault(phase_name, {})[field] = value
+            else:
+                override[name] = value
+        yield override
+
+
+def convert(value, to_type, name):
+    """value as to_type, or a ValueError naming the input"""
+    try:
+        return to_type(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} must be a number, not {value!r}')
+
+
+def mapping(value, name):
+    """value when it is an object, else a ValueError naming the input"""
+    if not isinstance(value, dict):
+        raise ValueError(f'{name} must be an object')
+    return value
+
+
+def apply_overrides(parsed_inputs, overrides, merge_phases=True):
+    """Return a copy of parsed inputs with raw-input overrides applied
+
+    Scalars are replaced, phases are merged field by field, and delays,
+    unexpected costs and billing milestones are replaced as a whole. Values
+    are converted the same way parse_inputs converts them. With merge_phases
+    off, phases are replaced as a whole too, so phases left out of the
+    override are removed. Overrides of the wrong shape raise ValueError.
+    """
+    variant = dict(parsed_inputs)
+    for name, value in mapping(overrides, 'overrides').items():
+        if name in SCALAR_FIELDS:
+            parsed_name, to_type = SCALAR_FIELDS[name]
+            variant[parsed_name] = convert(value, to_type, name)
+            # As validate_inputs requires, since the gross margin is a share of it
+            if name == 'contract_value' and not 0 < variant[parsed_name] < math.inf:
+                raise ValueError('contract_value must be a positive number')
+        elif name == 'phases':
+            phases = dict(variant['phases']) if merge_phases else {}
+            for phase_name, fields in mapping(value, 'phases').items():
+                phase = dict(phases.get(str(phase_name), {field: to_type(0) for field, to_type in PHASE_FIELDS.items()}))
+                for field, field_value in mapping(fields, f'phases.{phase_name}').items():
+                    if field not in PHASE_FIELDS:
+                        raise ValueError(f'Unknown phase field: {field}')
+                    phase[field] = convert(field_value, PHASE_FIELDS[field], f'phases.{phase_name}.{field}')
+                phases[str(phase_name)] = phase
+            variant['phases'] = phases
+        elif name == 'delays':
+            delays = {
+                convert(key, int, 'delay start month'): {
+                    'length': convert(mapping(delay, f'delays.{key}').get('length', 0), int, f'delays.{key}.length'),
+                    'expense': convert(delay.get('expense', 0), float, f'delays.{key}.expense'),
+                }
+                for key, delay in mapping(value, 'delays').items() if key is not None and key != ''
+            }
+            if any(delay['length'] < 0 for delay in delays.values()):
+                raise ValueError('Delay lengths cannot be negative')
+            variant['delays'] = delays
+        elif name in ('unexpected_costs', 'billing_milestones'):
+            variant[name] = {
+                str(key): convert(percent, float, f'{name}.{key}') for key, percent in mapping(value, name).items()
+            }
+        else:
+            raise ValueError(f'Unknown override: {name}')
+    return variant
+
+
+def structure_key(parsed_inputs):
+    """Inputs that a batch shares: the phase order and the billing milestones"""
+    return (tuple(parsed_inputs['phases'].keys()), tuple(sorted(parsed_inputs['billing_milestones'].items())))
+
+
+def evaluate_group(variants):
+    """Forecast variants that share one structure_key in a single batch"""
+    base = variants[0]
+    phase_list = list(base['phases'].keys())
+    delay_count = max(len(variant['delays']) for variant in variants)
+
+    def phase_column(field):
+        return np.array([[variant['phases'][name][field] for name in phase_list] for variant in variants])
+
+    def delay_column(field, fill, dtype):
+        return np.array([
+            [delay[field] for delay in variant['delays'].values()] + [fill] * (delay_count - len(variant['delays']))
+            for variant in variants
+        ], dtype=dtype).reshape(len(variants), delay_count)
+
+    def scalar(name):
+        return np.array([variant[name] for variant in variants])
+
+    result = calculate_forecast_batch(
+        base,
+        phase_column('length').astype(np.int64),
+        phase_column('expense').astype(float),
+        np.array([[variant['unexpected_costs'].get(name, 0.0) for name in phase_list] for variant in variants]),
+        scalar('payment_lag'),
+        np.array([
+            list(variant['delays'].keys()) + [0] * (delay_count - len(variant['delays'])) for variant in variants
+        ], dtype=np.int64).reshape(len(variants), delay_count),
+        delay_column('length', 0, np.int64),
+        delay_column('expense', 0.0, float),
+        time_frames=scalar('time_frame'),
+        contract_values=scalar('contract_value'),
+        min_cash_allowed=scalar('min_cash_allowed'),
+        contingency_percents=scalar('contingency_percent'),
+        phase_overheads=phase_column('overhead').astype(float),
+        phase_upfronts=phase_column('upfront').astype(float),
+        include_months=True
+    )
+
+    forecasts = []
+    for row, horizon in enumerate(result['horizon'].tolist()):
+        months = max(horizon, 0)
+        # Copy each row out so a result does not keep the whole batch array alive
+        forecasts.append(ForecastResult(
+            phase_list,
+            result['cash_in'][row, :months].copy(),
+            result['cash_out'][row, :months].copy(),
+            result['net_cash'][row, :months].copy(),
+            result['cumulative_net_cash'][row, :months].copy(),
+            result['phase_index'][row, :months],
+            BATCH_VERDICTS[result['verdict'][row]],
+            result['payback_period'][row],
+            result['gross_margin'][row],
+            result['min_net_cash'][row],
+            result['min_net_cash_month'][row],
+            result['cumulative_net_cash'][row, months - 1] if months else 0
+        ))
+    return forecasts
+
+
+def calculate_forecasts(parsed_variants, progress=None):
+    """Forecast many parsed inputs, batching those that share their structure
+
+    Returns one ForecastResult per input, in order, or an error dict for
+    inputs without phases. progress, when given, is called with (variants
+    done, variants) after each batch.
+    """
+    results = [None] * len(parsed_variants)
+    groups = {}
+    for position, variant in enumerate(parsed_variants):
+        if not variant['phases']:
+            results[position] = {'success': False, 'message': 'No phases provided'}
+            continue
+        groups.setdefault(structure_key(variant), []).append(position)
+
+    for positions in groups.values():
+        for start in range(0, len(positions), BATCH_GROUP_SIZE):
+            chunk = positions[start:start + BATCH_GROUP_SIZE]
+            for position, forecast in zip(chunk, evaluate_group([parsed_variants[position] for position in chunk])):
+                results[position] = forecast
+            if progress:
+                progress(sum(result is not None for result in results), len(parsed_variants))
+    return results
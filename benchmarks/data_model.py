@@ -0,0 +1,69 @@
+"""Memory and throughput of columnar ForecastResults against per-month dicts
+
+For each horizon, holds many forecasts both as ForecastResult objects and
+as the per-month dicts of the JSON response, and reports the memory each
+takes and how fast each engine produces them.
+
+    python benchmarks/data_model.py --forecasts 1000 --horizons 120,240,480
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+import app as app_module  # noqa: E402
+from benchmarks.suite import synthetic_inputs  # noqa: E402
+from forecast_engine import calculate_forecast_result  # noqa: E402
+
+
+def held_memory(build):
+    """Bytes still allocated by the value build() returns"""
+    tracemalloc.start()
+    value = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del value
+    return current
+
+
+def rate(function, count):
+    function()
+    started = time.perf_counter()
+    for _ in range(count):
+        function()
+    return count / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--forecasts', type=int, default=1000, help='forecasts held per horizon')
+    parser.add_argument('--horizons', default='120,240,480')
+    args = parser.parse_args()
+
+    for horizon in [int(months) for months in args.horizons.split(',')]:
+        parsed = app_module.parse_inputs(synthetic_inputs(horizon, 20, 'sparse', 'dense'))
+        loop = app_module.calculate_forecast(parsed)
+        vectorized = calculate_forecast_result(parsed)
+
+        columnar_bytes = held_memory(lambda: [calculate_forecast_result(parsed) for _ in range(args.forecasts)])
+        dict_bytes = held_memory(lambda: [vectorized.to_dict() for _ in range(args.forecasts)])
+        print(f'{len(vectorized)} months x {args.forecasts} forecasts: '
+              f'dicts {dict_bytes / 2 ** 20:8.2f} MiB  columnar {columnar_bytes / 2 ** 20:8.2f} MiB  '
+              f'({dict_bytes / columnar_bytes:.1f}x smaller)')
+
+        count = max(args.forecasts // 5, 20)
+        print(f'{"":>{len(str(len(vectorized))) + 7}}'
+              f'loop engine {rate(lambda: app_module.calculate_forecast(parsed), count):8.0f}/s'
+              f'  + dicts {rate(lambda: app_module.calculate_forecast(parsed).to_dict(), count):8.0f}/s   '
+              f'vectorized {rate(lambda: calculate_forecast_result(parsed), count):8.0f}/s'
+              f'  + dicts {rate(lambda: calculate_forecast_result(parsed).to_dict(), count):8.0f}/s')
+        assert loop.to_dict() == vectorized.to_dict()
+
+
+if __name__ == '__main__':
+    main()
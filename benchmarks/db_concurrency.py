@@ -0,0 +1,165 @@
+"""Concurrent read/write benchmark of the SQLite connection settings
+
+Compares the old per-query connections in rollback-journal mode against
+the pooled WAL connections of database.py. Reader threads run the
+/get_projects and /get_project queries while writer threads save projects,
+all against a scratch copy of the schema.
+
+    python benchmarks/db_concurrency.py --readers 8 --writers 2 --seconds 5
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import ConnectionPool, connect, is_locked_error, run_with_retry  # noqa: E402
+from storage import insert_project_children, load_project_children, migrate  # noqa: E402
+
+SAMPLE_INPUTS = {
+    'time_frame': 12,
+    'payment_lag': 1,
+    'contract_value': 500000.0,
+    'min_cash_allowed': -100000.0,
+    'contingency_percent': 0.1,
+    'phases': {
+        'Design': {'length': 3, 'expense': 20000.0, 'overhead': 2000.0, 'upfront': 5000.0},
+        'Build': {'length': 6, 'expense': 30000.0, 'overhead': 3000.0, 'upfront': 10000.0},
+        'Close': {'length': 3, 'expense': 10000.0, 'overhead': 1000.0, 'upfront': 0.0},
+    },
+    'delays': {4: {'length': 2, 'expense': 5000.0}},
+    'unexpected_costs': {'Build': 0.05},
+    'billing_milestones': {'3': 0.3, '9': 0.4, '12': 0.3},
+}
+
+
+def legacy_connect(path):
+    """Connection as app.get_db used to open it, once per query"""
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA foreign_keys = ON')
+    return conn
+
+
+def save_project(conn, index):
+    cursor = conn.execute('''
+        INSERT INTO projects (name, start_date, contract_value, time_frame, payment_lag, contingency_percent, cash_floor)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (f'Bench {index}', '2025-01-01', 500000.0, 12, 1, 0.1, -100000.0))
+    insert_project_children(conn, cursor.lastrowid, SAMPLE_INPUTS)
+    conn.commit()
+
+
+def read_projects(conn):
+    rows = conn.execute('SELECT id FROM projects ORDER BY created_at DESC LIMIT 50').fetchall()
+    if rows:
+        load_project_children(conn, [rows[0]['id']])
+
+
+def prepare(path, projects):
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    for index in range(projects):
+        save_project(conn, index)
+    conn.close()
+
+
+def run(mode, path, readers, writers, seconds):
+    """Run readers and writers for a number of seconds and count operations and lock errors"""
+    pool = ConnectionPool(path, max_size=readers + writers) if mode == 'pooled' else None
+    counts = {'reads': 0, 'writes': 0, 'locked': 0, 'errors': 0}
+    latencies = []
+    lock = threading.Lock()
+    stop = time.perf_counter() + seconds
+
+    def worker(is_writer, number):
+        done = 0
+        local_latencies = []
+        locked = errors = 0
+        while time.perf_counter() < stop:
+            started = time.perf_counter()
+            try:
+                if pool is None:
+                    conn = legacy_connect(path)
+                    try:
+                        save_project(conn, number) if is_writer else read_projects(conn)
+                    finally:
+                        conn.close()
+                else:
+                    conn = pool.acquire()
+                    try:
+                        if is_writer:
+                            def write():
+                                try:
+                                    save_project(conn, number)
+                                except Exception:
+                                    conn.rollback()
+                                    raise
+                            run_with_retry(write)
+                        else:
+                            read_projects(conn)
+                    finally:
+                        pool.release(conn)
+                done += 1
+                local_latencies.append(time.perf_counter() - started)
+            except sqlite3.OperationalError as e:
+                if is_locked_error(e):
+                    locked += 1
+                else:
+                    errors += 1
+        with lock:
+            counts['writes' if is_writer else 'reads'] += done
+            counts['locked'] += locked
+            counts['errors'] += errors
+            latencies.extend(local_latencies)
+
+    threads = [threading.Thread(target=worker, args=(False, n)) for n in range(readers)]
+    threads += [threading.Thread(target=worker, args=(True, n)) for n in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if pool is not None:
+        pool.close_all()
+
+    latencies.sort()
+    return {
+        'mode': mode,
+        'reads_per_second': counts['reads'] / seconds,
+        'writes_per_second': counts['writes'] / seconds,
+        'locked_errors': counts['locked'],
+        'other_errors': counts['errors'],
+        'p50_ms': latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+        'p99_ms': latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--projects', type=int, default=500, help='projects saved before the run')
+    args = parser.parse_args()
+
+    for mode in ('legacy', 'pooled'):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bench.db')
+            prepare(path, args.projects)
+            if mode == 'pooled':
+                # WAL is a property of the database file; set it once as the app does at startup
+                connect(path).close()
+            result = run(mode, path, args.readers, args.writers, args.seconds)
+        print(
+            f"{result['mode']:>7}: {result['reads_per_second']:9.1f} reads/s {result['writes_per_second']:8.1f} writes/s"
+            f"  p50 {result['p50_ms']:6.2f} ms  p99 {result['p99_ms']:7.2f} ms"
+            f"  locked {result['locked_errors']}  other errors {result['other_errors']}"
+        )
+
+
+if __name__ == '__main__':
+    main()
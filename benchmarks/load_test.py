@@ -0,0 +1,169 @@
+"""Load test of /generate_forecast and /get_projects under gunicorn
+
+Starts gunicorn with each requested worker count against a scratch
+database, drives each endpoint from concurrent keep-alive clients and
+reports requests/sec with p50/p99 latency. Pass --url to load an already
+running server instead.
+
+    python benchmarks/load_test.py --workers 1,2,4 --concurrency 16 --seconds 10
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.db_concurrency import save_project  # noqa: E402
+from database import connect  # noqa: E402
+from storage import migrate  # noqa: E402
+
+FORECAST_BODY = json.dumps({'inputs': {
+    'time_frame': 24,
+    'payment_lag': 2,
+    'contract_value': 1500000,
+    'cash_floor': -250000,
+    'contingency_percent': 0.1,
+    'phases': {
+        'Design': {'length': 4, 'expense': 30000, 'overhead': 2000, 'upfront': 10000},
+        'Build': {'length': 14, 'expense': 45000, 'overhead': 4000, 'upfront': 25000},
+        'Close': {'length': 6, 'expense': 15000, 'overhead': 1000, 'upfront': 0},
+    },
+    'delays': {'6': {'length': 2, 'expense': 8000}},
+    'unexpected_costs': {'Build': 0.05},
+    'billing_milestones': {'4': 0.2, '12': 0.3, '18': 0.3, '24': 0.2},
+}})
+
+ENDPOINTS = {
+    '/generate_forecast': ('POST', '/generate_forecast', FORECAST_BODY),
+    '/get_projects': ('GET', '/get_projects?limit=100', None),
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(host, port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'Server on {host}:{port} did not start')
+
+
+def drive(host, port, method, path, body, concurrency, seconds):
+    """Send requests from concurrent clients for a number of seconds"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop = time.perf_counter() + seconds
+    headers = {'Content-Type': 'application/json'} if body else {}
+
+    def client():
+        conn = http.client.HTTPConnection(host, port, timeout=60)
+        local = []
+        failed = 0
+        while time.perf_counter() < stop:
+            started = time.perf_counter()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    failed += 1
+                    continue
+                local.append(time.perf_counter() - started)
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                conn.close()
+                conn = http.client.HTTPConnection(host, port, timeout=60)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests_per_second': len(latencies) / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+        'p99_ms': latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000 if latencies else 0.0,
+        'errors': errors[0],
+    }
+
+
+def report(label, endpoints, concurrency, seconds, host, port):
+    for name, (method, path, body) in endpoints.items():
+        result = drive(host, port, method, path, body, concurrency, seconds)
+        print(
+            f"{label:>10} {name:<20} {result['requests_per_second']:9.1f} req/s"
+            f"  p50 {result['p50_ms']:7.2f} ms  p99 {result['p99_ms']:8.2f} ms  errors {result['errors']}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', default='1,2,4', help='comma separated gunicorn worker counts')
+    parser.add_argument('--threads', type=int, default=4, help='threads per worker')
+    parser.add_argument('--concurrency', type=int, default=16, help='concurrent clients')
+    parser.add_argument('--seconds', type=float, default=10.0, help='duration per endpoint')
+    parser.add_argument('--projects', type=int, default=1000, help='projects saved before the run')
+    parser.add_argument('--url', help='load an already running server instead of starting gunicorn')
+    args = parser.parse_args()
+
+    if args.url:
+        target = urlsplit(args.url)
+        report('external', ENDPOINTS, args.concurrency, args.seconds, target.hostname, target.port or 80)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = os.path.join(directory, 'load.db')
+        conn = connect(database)
+        migrate(conn)
+        for index in range(args.projects):
+            save_project(conn, index)
+        conn.close()
+
+        for workers in [int(count) for count in args.workers.split(',')]:
+            port = free_port()
+            # The forecast cache would turn every repeat forecast into a lookup
+            env = dict(os.environ, DATABASE=database, FORECAST_CACHE_SIZE='0')
+            server = subprocess.Popen([
+                sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app',
+                '--workers', str(workers), '--threads', str(args.threads),
+                '--bind', f'127.0.0.1:{port}', '--access-logfile', '/dev/null',
+                # Worker recycling would drop keep-alive connections mid-run
+                '--max-requests', '0'
+            ], cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                wait_for('127.0.0.1', port)
+                report(f'{workers} worker' + ('s' if workers > 1 else ''), ENDPOINTS,
+                       args.concurrency, args.seconds, '127.0.0.1', port)
+            finally:
+                server.terminate()
+                server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Per-request latency of /generate_forecast at different log levels
+
+DEBUG logs every forecast month, as the old print() calls did; INFO and
+above skip the per-month logging entirely. Logs are written to a scratch
+file so the terminal does not skew the timings. Run it against an older
+checkout with --print-baseline to time the print() version.
+
+    python benchmarks/logging_overhead.py --months 120 --requests 300
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def forecast_inputs(months):
+    """A forecast of roughly the given number of months over four phases"""
+    length = max(months // 4, 1)
+    return {
+        'time_frame': length * 4,
+        'payment_lag': 2,
+        'contract_value': 5000000,
+        'cash_floor': -1000000,
+        'contingency_percent': 0.1,
+        'phases': {
+            f'Phase {number}': {'length': length, 'expense': 25000, 'overhead': 2000, 'upfront': 5000}
+            for number in range(1, 5)
+        },
+        'delays': {str(length): {'length': 2, 'expense': 5000}},
+        'unexpected_costs': {'Phase 2': 0.05},
+        'billing_milestones': {str(month): 0.1 for month in range(length, length * 4 + 1, max(length * 4 // 10, 1))},
+    }
+
+
+def time_requests(client, body, requests):
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        response = client.post('/generate_forecast', json=body)
+        latencies.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.data
+    latencies.sort()
+    return statistics.mean(latencies) * 1000, latencies[int(len(latencies) * 0.99)] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--months', type=int, default=120)
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--levels', default='WARNING,INFO,DEBUG')
+    parser.add_argument('--print-baseline', action='store_true',
+                        help='time a checkout that still prints, with stdout sent to a scratch file')
+    args = parser.parse_args()
+
+    # The cache would answer every repeat request without running the forecast
+    os.environ['FORECAST_CACHE_SIZE'] = '0'
+    body = {'inputs': forecast_inputs(args.months)}
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = os.path.join(directory, 'bench.db')
+        # Older checkouts create projects.db in the working directory on import
+        os.chdir(directory)
+        import app as app_module
+
+        if args.print_baseline:
+            if hasattr(app_module, 'create_app'):
+                client = app_module.create_app(database, init_schema=True).test_client()
+            else:
+                client = app_module.app.test_client()
+            with open(os.path.join(directory, 'stdout.log'), 'w') as sink, contextlib.redirect_stdout(sink):
+                mean, p99 = time_requests(client, body, args.requests)
+            print(f"{'print()':>8}: mean {mean:7.3f} ms  p99 {p99:7.3f} ms")
+            return
+
+        from logging_config import configure_logging
+        app = app_module.create_app(database, init_schema=True)
+        client = app.test_client()
+        for level in args.levels.split(','):
+            with open(os.path.join(directory, f'{level}.log'), 'w') as sink:
+                configure_logging(level=level, stream=sink)
+                mean, p99 = time_requests(client, body, args.requests)
+            print(f'{level:>8}: mean {mean:7.3f} ms  p99 {p99:7.3f} ms')
+        configure_logging(stream=io.StringIO())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+"""Benchmark suite for the forecast engine and the HTTP endpoints
+
+Times parse_inputs, the timeline compile step, the forecast engines and an
+incremental re-forecast directly on synthetic inputs at several scales, then
+/generate_forecast, /create_project and /get_projects through the Flask test
+client against a scratch database. Each case records
+median and best time and peak traced memory.
+
+    python benchmarks/suite.py --save benchmarks/baseline.json
+    python benchmarks/suite.py --compare benchmarks/baseline.json --threshold 0.25
+
+With --compare the run exits with status 1 when any case's median time or
+peak memory exceeds its baseline by more than the threshold. Baselines are
+machine specific; save one on the machine that runs the comparison.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Quiet logs and no cache, so every request does the full work being measured
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+os.environ['FORECAST_CACHE_SIZE'] = '0'
+
+import app as app_module  # noqa: E402
+from batch_forecast import apply_overrides  # noqa: E402
+from incremental import update_forecast  # noqa: E402
+from models import ForecastInput  # noqa: E402
+from timeline import compile_timeline, timeline_key  # noqa: E402
+
+TIME_FRAMES = (12, 60, 240)
+PHASE_COUNTS = (3, 20, 100)
+DENSITIES = ('sparse', 'dense')
+# Each case runs until it has this much total time or MAX_REPEATS runs
+MIN_CASE_SECONDS = 0.2
+MIN_REPEATS = 5
+MAX_REPEATS = 200
+# Projects saved before /get_projects is timed
+LISTED_PROJECTS = 2000
+
+
+def synthetic_inputs(time_frame, phase_count, delays, milestones):
+    """Raw inputs, as the frontend posts them, for one benchmark scale
+
+    Phase lengths split time_frame evenly (at least one month each). Sparse
+    delays and milestones are a handful; dense ones fall every few months.
+    """
+    base, extra = divmod(time_frame, phase_count)
+    phases = {
+        f'Phase {number}': {
+            'length': max(base + (1 if number <= extra else 0), 1),
+            'expense': 10000 + 500 * number,
+            'overhead': 1000,
+            'upfront': 2500 if number % 5 == 1 else 0,
+        }
+        for number in range(1, phase_count + 1)
+    }
+    delay_step = max(time_frame // 3, 1) if delays == 'sparse' else 4
+    milestone_step = max(time_frame // 4, 1) if milestones == 'sparse' else 1
+    milestone_months = list(range(milestone_step, time_frame + 1, milestone_step))
+    return {
+        'time_frame': time_frame,
+        'payment_lag': 2,
+        'contract_value': 20000 * time_frame * (1 + phase_count / 50),
+        'cash_floor': -5000 * time_frame,
+        'contingency_percent': 0.1,
+        'start_date': '2025-01-01',
+        'phases': phases,
+        'delays': {str(month): {'length': 1, 'expense': 3000} for month in range(delay_step, time_frame, delay_step)},
+        'unexpected_costs': {name: 0.05 for name in list(phases)[::4]},
+        'billing_milestones': {str(month): 1 / len(milestone_months) for month in milestone_months},
+    }
+
+
+def measure(function):
+    """Median and best wall time of function(), and peak traced memory of one call"""
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < MAX_REPEATS and (len(timings) < MIN_REPEATS or time.perf_counter() - started < MIN_CASE_SECONDS):
+        call_started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - call_started)
+
+    # Memory is traced on a separate call; tracing slows the code down too much to time it
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'median_ms': statistics.median(timings) * 1000,
+        'best_ms': min(timings) * 1000,
+        'repeats': len(timings),
+        'peak_kib': peak / 1024,
+    }
+
+
+def engine_cases(scales):
+    for time_frame, phase_count, delays, milestones in scales:
+        name = f'{time_frame}m/{phase_count}p/{delays}-delays/{milestones}-milestones'
+        inputs = synthetic_inputs(time_frame, phase_count, delays, milestones)
+        parsed = app_module.parse_inputs(inputs)
+        yield f'parse_inputs {name}', lambda inputs=inputs: app_module.parse_inputs(inputs)
+        # The timeline the loop engine compiles once per schedule, timed without its cache
+        key = timeline_key(ForecastInput.from_parsed(parsed))
+        yield f'compile_timeline {name}', lambda key=key: compile_timeline.__wrapped__(*key)
+        for engine, calculate in app_module.FORECAST_ENGINES.items():
+            yield f'calculate_forecast[{engine}] {name}', lambda calculate=calculate, parsed=parsed: calculate(parsed)
+        # An edit of the last billing milestone, re-forecast from the base forecast's checkpoints
+        base = app_module.calculate_forecast(parsed)
+        last_month = max(inputs['billing_milestones'], key=int)
+        edited = apply_overrides(parsed, {'billing_milestones': dict(inputs['billing_milestones'], **{last_month: 0.5})})
+        yield f'update_forecast[last-milestone] {name}', lambda base=base, edited=edited: update_forecast(base, edited)
+
+
+def http_cases(client, scales):
+    for time_frame, phase_count, delays, milestones in scales:
+        name = f'{time_frame}m/{phase_count}p/{delays}-delays/{milestones}-milestones'
+        inputs = synthetic_inputs(time_frame, phase_count, delays, milestones)
+        yield f'POST /generate_forecast {name}', lambda inputs=inputs: expect_ok(
+            client.post('/generate_forecast', json={'inputs': inputs}))
+        yield f'POST /create_project {name}', lambda inputs=inputs: expect_ok(
+            client.post('/create_project', json={'name': 'Benchmark', 'inputs': inputs}))
+
+    inputs = synthetic_inputs(60, 3, 'sparse', 'sparse')
+    for _ in range(LISTED_PROJECTS):
+        expect_ok(client.post('/create_project', json={'name': 'Listed', 'inputs': inputs}))
+    yield 'GET /get_projects first page', lambda: expect_ok(client.get('/get_projects'))
+    yield 'GET /get_projects limit=1000', lambda: expect_ok(client.get('/get_projects?limit=1000'))
+
+
+def expect_ok(response):
+    if response.status_code != 200:
+        raise RuntimeError(f'{response.status_code}: {response.get_data(as_text=True)[:200]}')
+    response.get_data()
+
+
+def compare(results, baseline, threshold):
+    """Cases whose median time or peak memory grew past the threshold"""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get('results', {}).get(name)
+        if before is None:
+            continue
+        for metric in ('median_ms', 'peak_kib'):
+            if before[metric] > 0 and result[metric] > before[metric] * (1 + threshold):
+                regressions.append(f'{name}: {metric} {before[metric]:.3f} -> {result[metric]:.3f} '
+                                   f'(+{(result[metric] / before[metric] - 1) * 100:.0f}%)')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--save', help='write the results to this baseline file')
+    parser.add_argument('--compare', help='baseline file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed fractional regression')
+    parser.add_argument('--filter', default='', help='only run cases whose name contains this')
+    parser.add_argument('--quick', action='store_true', help='smallest and largest scales only')
+    parser.add_argument('--skip-http', action='store_true')
+    args = parser.parse_args()
+
+    time_frames = (TIME_FRAMES[0], TIME_FRAMES[-1]) if args.quick else TIME_FRAMES
+    phase_counts = (PHASE_COUNTS[0], PHASE_COUNTS[-1]) if args.quick else PHASE_COUNTS
+    scales = list(itertools.product(time_frames, phase_counts, DENSITIES, DENSITIES))
+    # The endpoints are dominated by request handling, so one density per scale is enough there
+    http_scales = [(time_frame, phase_count, density, density)
+                   for time_frame, phase_count in itertools.product(time_frames, phase_counts) for density in DENSITIES]
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        cases = engine_cases(scales)
+        if not args.skip_http:
+            client = app_module.create_app(os.path.join(directory, 'bench.db'), init_schema=True).test_client()
+            cases = itertools.chain(cases, http_cases(client, http_scales))
+        for name, function in cases:
+            if args.filter not in name:
+                continue
+            results[name] = measure(function)
+            result = results[name]
+            print(f"{name:<78} median {result['median_ms']:9.3f} ms  best {result['best_ms']:9.3f} ms"
+                  f"  peak {result['peak_kib']:9.1f} KiB")
+
+    if args.save:
+        with open(args.save, 'w') as baseline_file:
+            json.dump({
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'results': results,
+            }, baseline_file, indent=2)
+        print(f'Baseline written to {args.save}')
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold)
+        if regressions:
+            print(f'{len(regressions)} regression(s) past {args.threshold:.0%}:')
+            for regression in regressions:
+                print(f'  {regression}')
+            sys.exit(1)
+        print(f'No regressions past {args.threshold:.0%}')
+
+
+if __name__ == '__main__':
+    main()
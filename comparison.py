@@ -0,0 +1,89 @@
+import numpy as np
+
+from models import ForecastResult
+
+# Most scenarios /compare forecasts against the base in one request
+MAX_COMPARED_SCENARIOS = 50
+# Monthly columns compared month by month
+MONTHLY_COLUMNS = ('cash_in', 'cash_out', 'net_cash', 'cumulative_net_cash')
+# payback_period when the forecast never pays back
+NO_PAYBACK = 999
+
+
+def headline(result):
+    """The headline figures of a ForecastResult, named as in the /generate_forecast response"""
+    return {
+        'verdict': result.verdict,
+        'payback_period': result.payback_period,
+        'gross_margin': result.gross_margin,
+        'min_net_cash': result.min_net_cash,
+        'min_net_cash_month': result.min_net_cash_month,
+        'cumulative_net_cash': result.final_net_cash,
+        'months': len(result),
+    }
+
+
+def extend(column, months, carry):
+    """A monthly column padded to months entries
+
+    Cash flows are zero after a forecast ends; running totals (carry) keep
+    their last value.
+    """
+    if len(column) >= months:
+        return column
+    fill = column[-1] if carry and len(column) else 0.0
+    return np.concatenate((column, np.full(months - len(column), fill)))
+
+
+def monthly_deltas(base, result):
+    """Scenario minus base for each monthly column, over the longer of the two forecasts"""
+    months = max(len(base), len(result))
+    return {
+        column: (extend(getattr(result, column), months, column == 'cumulative_net_cash') -
+                 extend(getattr(base, column), months, column == 'cumulative_net_cash')).tolist()
+        for column in MONTHLY_COLUMNS
+    }
+
+
+def headline_differences(base, result):
+    """Scenario minus base for the headline figures
+
+    The payback difference is None when either forecast never pays back.
+    """
+    never = NO_PAYBACK in (base.payback_period, result.payback_period)
+    return {
+        'verdict': {'base': base.verdict, 'scenario': result.verdict, 'changed': base.verdict != result.verdict},
+        'payback_period': None if never else result.payback_period - base.payback_period,
+        'gross_margin': result.gross_margin - base.gross_margin,
+        'min_net_cash': result.min_net_cash - base.min_net_cash,
+        'cumulative_net_cash': result.final_net_cash - base.final_net_cash,
+        'months': len(result) - len(base),
+    }
+
+
+def compare_forecasts(base, scenarios):
+    """Compare scenario forecasts against the base forecast
+
+    base is a ForecastResult; scenarios is a list of (scenario dict,
+    ForecastResult or error dict) pairs. Returns the base's headline and
+    monthly columns, and for each scenario its headline, the differences in
+    the headline figures and the month-by-month deltas.
+    """
+    compared = []
+    for scenario, result in scenarios:
+        if not isinstance(result, ForecastResult):
+            compared.append({**scenario, 'error': result.get('message', 'Forecast failed')})
+            continue
+        compared.append({
+            **scenario,
+            'forecast': headline(result),
+            'differences': headline_differences(base, result),
+            'monthly_deltas': monthly_deltas(base, result),
+        })
+    return {
+        'base': {
+            'forecast': headline(base),
+            'monthly': {column: getattr(base, column).tolist() for column in MONTHLY_COLUMNS},
+        },
+        'scenarios': compared,
+    }
@@ -0,0 +1,149 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from metrics import observe_query
+
+# Connection tuning; SQLITE_CACHE_KIB is the page cache of each connection
+POOL_SIZE = int(os.environ.get('SQLITE_POOL_SIZE', 8))
+BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+CACHE_SIZE_KIB = int(os.environ.get('SQLITE_CACHE_KIB', 8192))
+# Statements kept compiled per connection and reused across requests
+STATEMENT_CACHE_SIZE = 256
+# Writes that still hit 'database is locked' after the busy timeout are retried this many times
+WRITE_RETRIES = 3
+RETRY_BACKOFF_SECONDS = 0.05
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection that reports the duration of each statement to the metrics"""
+
+    def execute(self, sql, *args):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, *args)
+        finally:
+            observe_query(statement_kind(sql), time.perf_counter() - started)
+
+    def executemany(self, sql, *args):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, *args)
+        finally:
+            observe_query(statement_kind(sql), time.perf_counter() - started)
+
+
+def statement_kind(sql):
+    """First keyword of a statement, e.g. SELECT, used as a low-cardinality label"""
+    words = sql.split(None, 1)
+    return words[0].upper() if words else ''
+
+
+def connect(path):
+    """Open a connection with the pragmas every connection of the app uses
+
+    WAL lets readers run alongside a writer, and synchronous=NORMAL is safe
+    in WAL mode while skipping an fsync per commit. busy_timeout makes
+    SQLite wait for a lock instead of failing straight away.
+    """
+    conn = sqlite3.connect(
+        path,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        factory=TimedConnection
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute(f'PRAGMA cache_size = {-CACHE_SIZE_KIB}')
+    conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    conn.execute('PRAGMA foreign_keys = ON')
+    return conn
+
+
+def is_locked_error(error):
+    """Whether an error is SQLite reporting a lock it could not get in time"""
+    return isinstance(error, sqlite3.OperationalError) and (
+        'database is locked' in str(error) or 'database is busy' in str(error)
+    )
+
+
+def run_with_retry(operation, retries=WRITE_RETRIES, backoff=RETRY_BACKOFF_SECONDS):
+    """Call operation(), retrying with jittered backoff while the database is locked
+
+    operation must roll back its own partial work before raising, so it is
+    safe to run again.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return operation()
+        except sqlite3.OperationalError as e:
+            if not is_locked_error(e) or attempt == retries:
+                raise
+            time.sleep(backoff * (2 ** attempt) * (0.5 + random.random()))
+
+
+class ConnectionPool:
+    """Thread-safe pool of configured SQLite connections to one database file
+
+    Connections are handed out with acquire() and returned with release().
+    At most max_size idle connections are kept; extra connections opened
+    under load are closed when released. The pool notices when it is used
+    in a forked worker and never hands the parent's connections to the child.
+    """
+
+    def __init__(self, path, max_size=POOL_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.opened = 0
+        self.reused = 0
+
+    def acquire(self):
+        """Return an idle connection, or open a new one"""
+        with self._lock:
+            self._check_fork()
+            if self._idle:
+                self.reused += 1
+                return self._idle.pop()
+            self.opened += 1
+        return connect(self.path)
+
+    def release(self, conn):
+        """Return a connection to the pool, rolling back anything left uncommitted"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            return
+        with self._lock:
+            self._check_fork()
+            if len(self._idle) < self.max_size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close_all(self):
+        """Close every idle connection"""
+        with self._lock:
+            while self._idle:
+                self._idle.pop().close()
+
+    def stats(self):
+        """Connections opened, reused and currently idle"""
+        with self._lock:
+            return {'opened': self.opened, 'reused': self.reused, 'idle': len(self._idle), 'max_size': self.max_size}
+
+    def _check_fork(self):
+        # Caller holds the lock; connections must not cross a fork, so drop the inherited ones
+        if os.getpid() != self._pid:
+            self._idle.clear()
+            self._pid = os.getpid()
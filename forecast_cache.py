@@ -0,0 +1,163 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from database import connect
+from models import ForecastResult
+
+
+def inputs_key(parsed_inputs, engine='loop'):
+    """Canonical hash of the output of parse_inputs and the engine forecasting it
+
+    Phases keep their order because it drives the forecast; delays, unexpected
+    costs and billing milestones are lookups, so they are sorted. The engines
+    agree on the figures, but only loop-engine results carry the checkpoints
+    /update_forecast resumes from, so each engine has its own entries.
+    """
+    canonical = [
+        engine,
+        parsed_inputs['time_frame'],
+        parsed_inputs['payment_lag'],
+        parsed_inputs['contract_value'],
+        parsed_inputs['min_cash_allowed'],
+        parsed_inputs['contingency_percent'],
+        [
+            [name, phase['length'], phase['expense'], phase['overhead'], phase['upfront']]
+            for name, phase in parsed_inputs['phases'].items()
+        ],
+        sorted([int(month), delay['length'], delay['expense']] for month, delay in parsed_inputs['delays'].items()),
+        sorted([str(name), percent] for name, percent in parsed_inputs['unexpected_costs'].items()),
+        sorted([str(month), percent] for month, percent in parsed_inputs['billing_milestones'].items()),
+    ]
+    encoded = json.dumps(canonical, separators=(',', ':')).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class ForecastCache:
+    """LRU cache of ForecastResults keyed on inputs_key
+
+    Holds at most max_entries results in memory, in their columnar form. When disk_path is set, results
+    are also written through to a SQLite table of at most max_disk_entries rows
+    that survives restarts; memory misses fall back to it.
+    """
+
+    def __init__(self, max_entries=256, disk_path=None, max_disk_entries=10000):
+        self.max_entries = max_entries
+        self.disk_path = disk_path
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if disk_path:
+            self._init_disk()
+
+    def _connect(self):
+        # WAL and a busy timeout, since every worker process writes to the same file
+        return connect(self.disk_path)
+
+    def _init_disk(self):
+        conn = self._connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS forecast_cache (
+                key TEXT PRIMARY KEY,
+                result TEXT NOT NULL,
+                accessed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_forecast_cache_accessed_at ON forecast_cache(accessed_at)')
+        conn.commit()
+        conn.close()
+
+    def get(self, key):
+        """Return the cached result for key, or None"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+        result = self._disk_get(key) if self.disk_path else None
+        with self._lock:
+            if result is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._store(key, result)
+        return result
+
+    def put(self, key, result):
+        """Cache a result in memory and, when enabled, on disk"""
+        with self._lock:
+            self._store(key, result)
+        if self.disk_path:
+            self._disk_put(key, result)
+
+    def get_or_compute(self, key, compute):
+        """Return the cached result for key, computing and caching it on a miss"""
+        result = self.get(key)
+        if result is None:
+            result = compute()
+            # Only successful forecasts are cached, never error payloads
+            if isinstance(result, ForecastResult):
+                self.put(key, result)
+        return result
+
+    def clear(self):
+        """Drop every in-memory entry"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Hit, miss and eviction counters"""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                'disk_enabled': bool(self.disk_path),
+            }
+
+    def _store(self, key, result):
+        # Caller holds the lock
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_get(self, key):
+        conn = self._connect()
+        row = conn.execute('SELECT result FROM forecast_cache WHERE key = ?', (key,)).fetchone()
+        if row:
+            conn.execute('UPDATE forecast_cache SET accessed_at = CURRENT_TIMESTAMP WHERE key = ?', (key,))
+            conn.commit()
+        conn.close()
+        if not row:
+            return None
+        # Columnar rows name every phase; rows written before that hold the per-month dicts
+        result = json.loads(row[0])
+        return ForecastResult.from_columns(result) if 'columns' in result else ForecastResult.from_dict(result)
+
+    def _disk_put(self, key, result):
+        conn = self._connect()
+        conn.execute('''
+            INSERT OR REPLACE INTO forecast_cache (key, result, accessed_at)
+            VALUES (?, ?, CURRENT_TIMESTAMP)
+        ''', (key, json.dumps(result.to_columns())))
+        # Keep only the most recently used rows
+        conn.execute('''
+            DELETE FROM forecast_cache WHERE key IN (
+                SELECT key FROM forecast_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+            )
+        ''', (self.max_disk_entries,))
+        conn.commit()
+        conn.close()
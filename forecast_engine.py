@@ -0,0 +1,402 @@
+import numpy as np
+
+from models import ForecastResult
+
+# Phase that follows the last configured phase. The loop engine models it as
+# a phase with no costs whose remaining counter starts at 99.
+END_PHASE_LENGTH = 100
+
+
+def expand_delays(delays, horizon):
+    """Expand delays into month-indexed arrays
+
+    Arrays are indexed by month (1..horizon); index 0 is unused.
+    Returns the delay mask, the expense charged in each delay month and the
+    cumulative delay length that has started on or before each month.
+    """
+    in_delay = np.zeros(horizon + 1, dtype=bool)
+    delay_expense = np.zeros(horizon + 1)
+    delay_started = np.zeros(horizon + 1, dtype=np.int64)
+
+    starts = sorted(month for month in delays if 1 <= month <= horizon)
+    for position, start in enumerate(starts):
+        length = int(delays[start]['length'])
+        # A delay always covers its start month and is cut short when the next delay starts
+        end = start + max(length, 1) - 1
+        if position + 1 < len(starts):
+            end = min(end, starts[position + 1] - 1)
+        end = min(end, horizon)
+        in_delay[start:end + 1] = True
+        delay_expense[start:end + 1] = float(delays[start]['expense'])
+        delay_started[start] += length
+
+    return in_delay, delay_expense, np.cumsum(delay_started)
+
+
+def expand_phases(phases, in_delay, horizon):
+    """Expand phases into month-indexed arrays
+
+    Returns the phase index in effect for each month (-1 once the phases run
+    out) and a mask of the months where a new phase starts. Phases only count
+    down in months without a delay, and every phase after the first also
+    occupies the month it starts in, which mirrors the loop engine.
+    """
+    phase_list = list(phases.keys())
+    phase_index = np.full(horizon + 1, -1, dtype=np.int64)
+    phase_start = np.zeros(horizon + 1, dtype=bool)
+    working_months = np.concatenate(([0], np.cumsum(~in_delay[1:])))
+
+    current = 0
+    length = int(phases[phase_list[0]]['length'])
+    start = 0
+    while start <= horizon:
+        # The phase ends once it has counted down `length` working months after it started
+        if length <= 0:
+            switch = start + 1
+        else:
+            target = working_months[start] + length
+            switch = int(np.searchsorted(working_months, target, side='left')) + 1
+        phase_index[max(start, 1):min(switch, horizon + 1)] = current
+        if switch > horizon:
+            break
+        phase_start[switch] = True
+
+        next_index = (current + 1) % len(phase_list) if current >= 0 else 1 % len(phase_list)
+        if next_index == 0:
+            current = -1
+            length = END_PHASE_LENGTH
+        else:
+            current = next_index
+            length = int(phases[phase_list[current]]['length'])
+        start = switch
+
+    return phase_index, phase_start
+
+
+def expand_milestones(billing_milestones, horizon):
+    """Expand billing milestones into an array indexed by billing month"""
+    milestone_percent = np.zeros(horizon + 1)
+    for key, percent in billing_milestones.items():
+        try:
+            month = int(key)
+        except ValueError:
+            continue
+        # The loop engine looks milestones up by str(month), so only canonical keys ever match
+        if str(month) == str(key) and 0 <= month <= horizon:
+            milestone_percent[month] = float(percent)
+    return milestone_percent
+
+
+def calculate_forecast_arrays(parsed_inputs):
+    """Generate the forecast as month-indexed arrays
+
+    Returns the cash columns and the phase index per month as arrays, plus the
+    same headline figures as calculate_forecast and the cash out total the
+    'Not Profitable' check uses. Callers that aggregate many forecasts use
+    this directly to avoid building one dict per month.
+    """
+    time_frame = parsed_inputs['time_frame']
+    payment_lag = parsed_inputs['payment_lag']
+    contract_value = parsed_inputs['contract_value']
+    min_cash_allowed = parsed_inputs['min_cash_allowed']
+    contingency_percent = parsed_inputs['contingency_percent']
+    phases = parsed_inputs['phases']
+    delays = parsed_inputs['delays']
+    unexpected_costs = parsed_inputs['unexpected_costs']
+    billing_milestones = parsed_inputs['billing_milestones']
+
+    if not phases:
+        raise ValueError('No phases provided')
+
+    phase_list = list(phases.keys())
+    horizon = time_frame + payment_lag + sum(delay['length'] for delay in delays.values())
+    if horizon <= 0:
+        # Nothing to simulate, so report the loop engine's starting values
+        empty = np.zeros(0)
+        return {
+            'cash_in': empty,
+            'cash_out': empty,
+            'net_cash': empty,
+            'cumulative_net_cash': empty,
+            'phase_index': np.zeros(0, dtype=np.int64),
+            'phase_list': phase_list,
+            'verdict': 'Not Profitable' if contract_value < 0 else 'Go',
+            'payback_period': 999,
+            'gross_margin': (contract_value - 0) / contract_value,
+            'min_net_cash': 0,
+            'min_net_cash_month': 0,
+            'final_net_cash': 0,
+            'cumulative_cash_out': 0
+        }
+
+    in_delay, delay_expense, cumulative_delays = expand_delays(delays, horizon)
+    phase_index, phase_start = expand_phases(phases, in_delay, horizon)
+    milestone_percent = expand_milestones(billing_milestones, horizon)
+
+    # Per-phase rates, with a trailing zero row for months after the last phase
+    expense_rate = np.array([phases[name]['expense'] for name in phase_list] + [0.0])
+    overhead_rate = np.array([phases[name]['overhead'] for name in phase_list] + [0.0])
+    upfront_rate = np.array([phases[name]['upfront'] for name in phase_list] + [0.0])
+    unexpected_rate = np.array([unexpected_costs.get(name, 0.0) for name in phase_list] + [0.0])
+
+    months = np.arange(horizon + 1)[1:]
+    in_delay = in_delay[1:]
+    phase_index = phase_index[1:]
+    expense = expense_rate[phase_index]
+    overhead = overhead_rate[phase_index]
+    upfront = np.where(phase_start[1:] | (months == 1), upfront_rate[phase_index], 0.0)
+    unexpected_cost = expense * unexpected_rate[phase_index]
+    contingency = contingency_percent * expense
+
+    # Cash in: billing milestones shifted by the payment lag and the delays so far
+    billing_month = months - payment_lag - cumulative_delays[1:]
+    billable = ~in_delay & (billing_month >= 0)
+    cash_in = np.where(billable, milestone_percent[np.clip(billing_month, 0, horizon)] * contract_value, 0.0)
+
+    # Cash out: delay months cost the delay expense plus overhead
+    working_cash_out = expense + overhead + contingency + unexpected_cost
+    cash_out = np.where(in_delay, delay_expense[1:] + overhead, working_cash_out)
+    expenses = np.where(in_delay, delay_expense[1:], expense + contingency + unexpected_cost)
+
+    net_cash = cash_in - cash_out
+    cumulative_cash_out = np.cumsum(cash_out)[-1]
+
+    # Interleave the upfront costs so the running totals are accumulated in the same order as the loop
+    net_steps = np.empty(2 * horizon)
+    net_steps[0::2] = net_cash
+    net_steps[1::2] = -upfront
+    cumulative_net = np.cumsum(net_steps)[1::2]
+    expense_steps = np.empty(2 * horizon)
+    expense_steps[0::2] = expenses
+    expense_steps[1::2] = -upfront
+    cumulative_expenses = np.cumsum(expense_steps)[-1]
+
+    net_cash = net_cash - upfront
+    cash_out = cash_out + upfront
+
+    # The loop engine keeps month 0 when the minimum is in the first month
+    min_index = int(np.argmin(cumulative_net))
+    min_net_cash = float(cumulative_net[min_index])
+    min_net_cash_month = min_index + 1 if min_index > 0 else 0
+
+    positive = cumulative_net > 0
+    payback_period = int(np.argmax(positive)) + 1 if positive.any() else 999
+
+    verdict = 'Go'
+    if (cumulative_net < min_cash_allowed).any():
+        verdict = 'Restructure'
+    if contract_value < cumulative_cash_out:
+        verdict = 'Not Profitable'
+
+    gross_margin = (contract_value - cumulative_expenses) / contract_value
+
+    return {
+        'cash_in': cash_in,
+        'cash_out': cash_out,
+        'net_cash': net_cash,
+        'cumulative_net_cash': cumulative_net,
+        'phase_index': phase_index,
+        'phase_list': phase_list,
+        'verdict': verdict,
+        'payback_period': payback_period,
+        'gross_margin': float(gross_margin),
+        'min_net_cash': min_net_cash,
+        'min_net_cash_month': min_net_cash_month,
+        'final_net_cash': float(cumulative_net[-1]),
+        'cumulative_cash_out': float(cumulative_cash_out)
+    }
+
+
+def calculate_forecast_result(parsed_inputs):
+    """Generate the forecast as a columnar ForecastResult, or an error dict without phases"""
+    if not parsed_inputs['phases']:
+        return {'success': False, 'message': 'No phases provided'}
+    result = calculate_forecast_arrays(parsed_inputs)
+    return ForecastResult(
+        result['phase_list'], result['cash_in'], result['cash_out'], result['net_cash'],
+        result['cumulative_net_cash'], result['phase_index'], result['verdict'], result['payback_period'],
+        result['gross_margin'], result['min_net_cash'], result['min_net_cash_month'], result['final_net_cash']
+    )
+
+
+def calculate_forecast_vectorized(parsed_inputs):
+    """Generate the forecast with array operations instead of a month loop"""
+    result = calculate_forecast_result(parsed_inputs)
+    return result.to_dict() if isinstance(result, ForecastResult) else result
+
+
+def calculate_forecast_batch(parsed_inputs, phase_lengths, phase_expenses, unexpected_rates,
+                             payment_lags, delay_starts, delay_lengths, delay_expenses, *,
+                             time_frames=None, contract_values=None, min_cash_allowed=None,
+                             contingency_percents=None, phase_overheads=None, phase_upfronts=None,
+                             include_months=False):
+    """Generate many forecasts of one project at once
+
+    Every argument after parsed_inputs holds one row per draw: phase_lengths,
+    phase_expenses and unexpected_rates have one column per phase, and the
+    delay arrays one column per delay (a start below 1 means no delay). The
+    keyword arrays optionally vary the remaining inputs per draw; otherwise
+    the values in parsed_inputs are shared by every draw.
+    Months past a draw's horizon carry its final cumulative net cash forward.
+    Returns a dict of arrays with one entry per draw, plus the monthly cash
+    columns and phase index when include_months is set. Running totals are
+    accumulated in the same order as the loop engine, so each draw matches
+    calculate_forecast exactly.
+    """
+    phases = parsed_inputs['phases']
+    phase_list = list(phases.keys())
+    phase_count = len(phase_list)
+    draws = phase_lengths.shape[0]
+    rows = np.arange(draws)[:, None]
+
+    def per_draw(values, default):
+        return np.broadcast_to(default if values is None else values, (draws,))
+
+    time_frame = per_draw(time_frames, parsed_inputs['time_frame'])
+    contract_value = per_draw(contract_values, parsed_inputs['contract_value'])
+    min_cash_allowed = per_draw(min_cash_allowed, parsed_inputs['min_cash_allowed'])
+    contingency_percent = per_draw(contingency_percents, parsed_inputs['contingency_percent'])
+    if phase_overheads is None:
+        phase_overheads = np.tile([phases[name]['overhead'] for name in phase_list], (draws, 1))
+    if phase_upfronts is None:
+        phase_upfronts = np.tile([phases[name]['upfront'] for name in phase_list], (draws, 1))
+
+    horizons = time_frame + payment_lags + delay_lengths.sum(axis=1)
+    horizon = max(int(horizons.max()), 1)
+    months = np.arange(horizon + 1)[None, :]
+    in_horizon = (months >= 1) & (months <= horizons[:, None])
+
+    # Delays: sort the starts so each delay can be cut short by the next one
+    starts = np.where(delay_starts >= 1, delay_starts, horizon + 1)
+    starts = np.where(starts <= horizons[:, None], starts, horizon + 1)
+    order = np.argsort(starts, axis=1, kind='stable')
+    starts = np.take_along_axis(starts, order, axis=1)
+    lengths = np.take_along_axis(delay_lengths, order, axis=1)
+    expenses = np.take_along_axis(delay_expenses, order, axis=1)
+    next_starts = np.concatenate((starts[:, 1:], np.full((draws, 1), horizon + 1)), axis=1)
+    ends = np.minimum(np.minimum(starts + np.maximum(lengths, 1) - 1, next_starts - 1), horizons[:, None])
+    active = (starts <= horizon) & (ends >= starts)
+
+    delay_marks = np.zeros((draws, horizon + 2))
+    delay_columns = np.zeros((draws, horizon + 2), dtype=np.int64)
+    started_marks = np.zeros((draws, horizon + 2), dtype=np.int64)
+    row_index = np.broadcast_to(rows, starts.shape)
+    np.add.at(delay_marks, (row_index[active], starts[active]), 1)
+    np.add.at(delay_marks, (row_index[active], ends[active] + 1), -1)
+    # Starts are sorted, so a running maximum of the column number finds the delay in effect
+    delay_columns[row_index[active], starts[active]] = np.nonzero(active)[1] + 1
+    started = starts <= horizon
+    np.add.at(started_marks, (row_index[started], starts[started]), lengths[started])
+    in_delay = np.cumsum(delay_marks, axis=1)[:, :horizon + 1] > 0.5
+    governing = np.maximum.accumulate(delay_columns, axis=1)[:, :horizon + 1]
+    delay_expense = np.where(
+        in_delay, np.take_along_axis(np.concatenate((np.zeros((draws, 1)), expenses), axis=1), governing, axis=1), 0.0
+    )
+    cumulative_delays = np.cumsum(started_marks, axis=1)[:, :horizon + 1]
+
+    # Phases: month in which each working-month count is reached, then walk the phase sequence
+    working = ~in_delay
+    working[:, 0] = False
+    working_months = np.cumsum(working, axis=1)
+    month_of_working = np.full((draws, horizon + 2), horizon + 1, dtype=np.int64)
+    month_of_working[:, 0] = 0
+    working_rows, working_cols = np.nonzero(working)
+    month_of_working[working_rows, working_months[working_rows, working_cols]] = working_cols
+
+    phase_start = np.zeros((draws, horizon + 1), dtype=bool)
+    sequence = []
+    current = 0
+    start = np.zeros(draws, dtype=np.int64)
+    while True:
+        sequence.append(current)
+        pending = start <= horizons
+        if not pending.any():
+            break
+        if current == phase_count:
+            length = np.full(draws, END_PHASE_LENGTH)
+        else:
+            length = phase_lengths[:, current]
+        target = np.clip(working_months[np.arange(draws), np.minimum(start, horizon)] + length, 0, horizon + 1)
+        switch = np.where(length <= 0, start + 1, month_of_working[np.arange(draws), target] + 1)
+        switched = pending & (switch <= horizons)
+        phase_start[np.arange(draws)[switched], switch[switched]] = True
+        start = np.where(pending, switch, start)
+
+        next_index = (current + 1) % phase_count if current < phase_count else 1 % phase_count
+        current = phase_count if next_index == 0 else next_index
+
+    segment = np.cumsum(phase_start, axis=1)
+    phase_index = np.array(sequence)[np.minimum(segment, len(sequence) - 1)]
+
+    # Per-phase rates, with a trailing zero column for months after the last phase
+    def per_month(phase_values):
+        zero_column = np.zeros((draws, 1))
+        return np.take_along_axis(np.concatenate((phase_values, zero_column), axis=1), phase_index, axis=1)
+
+    expense = per_month(phase_expenses)
+    overhead = per_month(phase_overheads)
+    upfront = np.where(phase_start | (months == 1), per_month(phase_upfronts), 0.0)
+    unexpected_cost = expense * per_month(unexpected_rates)
+    contingency = contingency_percent[:, None] * expense
+
+    milestone_percent = expand_milestones(parsed_inputs['billing_milestones'], horizon)
+    billing_month = months - payment_lags[:, None] - cumulative_delays
+    billable = ~in_delay & (billing_month >= 0)
+    cash_in = np.where(
+        billable, milestone_percent[np.clip(billing_month, 0, horizon)] * contract_value[:, None], 0.0
+    )
+
+    cash_out = np.where(in_delay, delay_expense + overhead, expense + overhead + contingency + unexpected_cost)
+    month_expenses = np.where(in_delay, delay_expense, expense + contingency + unexpected_cost)
+
+    cash_in = np.where(in_horizon, cash_in, 0.0)[:, 1:]
+    cash_out = np.where(in_horizon, cash_out, 0.0)[:, 1:]
+    upfront = np.where(in_horizon, upfront, 0.0)[:, 1:]
+    month_expenses = np.where(in_horizon, month_expenses, 0.0)[:, 1:]
+    in_horizon = in_horizon[:, 1:]
+
+    # Interleave the upfront costs so the running totals are accumulated in the same order as the loop
+    net_cash = cash_in - cash_out
+    net_steps = np.empty((draws, 2 * horizon))
+    net_steps[:, 0::2] = net_cash
+    net_steps[:, 1::2] = -upfront
+    cumulative_net = np.cumsum(net_steps, axis=1)[:, 1::2]
+    expense_steps = np.empty((draws, 2 * horizon))
+    expense_steps[:, 0::2] = month_expenses
+    expense_steps[:, 1::2] = -upfront
+    cumulative_expenses = np.cumsum(expense_steps, axis=1)[:, -1]
+    cumulative_cash_out = np.cumsum(cash_out, axis=1)[:, -1]
+
+    has_months = horizons > 0
+    min_candidates = np.where(in_horizon, cumulative_net, np.inf)
+    min_index = np.argmin(min_candidates, axis=1)
+    min_net_cash = np.where(has_months, min_candidates[np.arange(draws), min_index], 0.0)
+    min_net_cash_month = np.where(min_index > 0, min_index + 1, 0)
+
+    positive = in_horizon & (cumulative_net > 0)
+    payback_period = np.where(positive.any(axis=1), np.argmax(positive, axis=1) + 1, 999)
+
+    verdict = np.zeros(draws, dtype=np.int8)
+    verdict[(in_horizon & (cumulative_net < min_cash_allowed[:, None])).any(axis=1)] = 1
+    verdict[contract_value < cumulative_cash_out] = 2
+
+    result = {
+        'horizon': horizons,
+        'cumulative_net_cash': cumulative_net,
+        'verdict': verdict,
+        'payback_period': payback_period,
+        'gross_margin': (contract_value - cumulative_expenses) / contract_value,
+        'min_net_cash': min_net_cash,
+        'min_net_cash_month': min_net_cash_month,
+    }
+    if include_months:
+        # Months after the last phase use index -1, as in calculate_forecast_arrays
+        result['cash_in'] = cash_in
+        result['cash_out'] = cash_out + upfront
+        result['net_cash'] = net_cash - upfront
+        result['phase_index'] = np.where(phase_index[:, 1:] == phase_count, -1, phase_index[:, 1:])
+    return result
+
+
+# Verdict codes used by calculate_forecast_batch
+BATCH_VERDICTS = ('Go', 'Restructure', 'Not Profitable')
@@ -0,0 +1,40 @@
+"""gunicorn settings: pre-forked workers, each serving requests on several threads
+
+WEB_CONCURRENCY sets the number of worker processes and GUNICORN_THREADS the
+threads per worker. Simulations and portfolio forecasts also use a small
+process pool per worker, of PROCESS_POOL_WORKERS processes (process_pool.py).
+Forecasts are CPU bound, so worker processes are what let one slow forecast
+run alongside other requests; threads cover requests waiting on SQLite.
+"""
+import glob
+import multiprocessing
+import os
+
+from app import DATABASE, init_db
+from process_pool import shutdown_pool
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+# Portfolio forecasts and large simulations can run for a while
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+# Recycle workers now and then so memory held by large requests is returned
+max_requests = 1000
+max_requests_jitter = 100
+accesslog = '-'
+
+
+def on_starting(server):
+    """Migrate the schema once in the master, before any worker starts"""
+    init_db(os.environ.get('DATABASE', DATABASE))
+    # Metrics snapshots of a previous run would be merged into this one's
+    if os.environ.get('METRICS_DIR'):
+        os.makedirs(os.environ['METRICS_DIR'], exist_ok=True)
+        for path in glob.glob(os.path.join(os.environ['METRICS_DIR'], 'metrics-*.json')):
+            os.remove(path)
+
+
+def worker_exit(server, worker):
+    """Stop the worker's process pool with it"""
+    shutdown_pool()
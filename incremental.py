@@ -0,0 +1,236 @@
+import logging
+from bisect import bisect_right
+
+import numpy as np
+
+from models import ForecastInput, ForecastResult, ForecastState
+from timeline import timeline_for
+
+engine_log = logging.getLogger('forecast.engine')
+
+# Months between the ForecastStates the loop engine keeps; an edit replays at most this many unchanged months
+CHECKPOINT_INTERVAL = 12
+
+
+def forecast_horizon(forecast_input):
+    """Number of months the loop engine forecasts"""
+    return forecast_input.time_frame + forecast_input.payment_lag + sum(
+        delay.length for delay in forecast_input.delays.values())
+
+
+def run_months(forecast_input, state, interval=CHECKPOINT_INTERVAL):
+    """Run the month loop from state to the end of the horizon
+
+    Returns the monthly columns from state.month on, the state after the
+    last month, and the ForecastStates taken every interval months on the
+    way (state itself first, the final state last).
+    """
+    contract_value = forecast_input.contract_value
+    contingency_percent = forecast_input.contingency_percent
+    delays = forecast_input.delays
+    unexpected_costs = forecast_input.unexpected_costs
+    timeline = timeline_for(forecast_input)
+    horizon = timeline.horizon
+    phase_index = timeline.phase_index
+    phase_start = timeline.phase_start
+    delay_starts = timeline.delay_start
+    milestone_percent = timeline.milestone_percent
+
+    # Amounts of the phases that run, with a trailing zero entry that phase_index -1 picks for the end phase
+    phases = forecast_input.phases[:timeline.phases_reached]
+    working_cash_out = []
+    working_expenses = []
+    for phase in phases:
+        unexpected_cost = phase.expense * unexpected_costs[phase.name] if phase.name in unexpected_costs else 0
+        working_cash_out.append(phase.expense + phase.overhead + (contingency_percent * phase.expense) + unexpected_cost)
+        working_expenses.append(phase.expense + (contingency_percent * phase.expense) + unexpected_cost)
+    working_cash_out.append(0.0)
+    working_expenses.append(0.0)
+    overheads = [phase.overhead for phase in phases] + [0.0]
+    upfronts = [phase.upfront for phase in phases] + [0.0]
+
+    cumulative_net_cash = state.cumulative_net_cash
+    cumulative_expenses = state.cumulative_expenses
+    cumulative_cash_out = state.cumulative_cash_out
+    min_net_cash = state.min_net_cash
+    min_net_cash_month = state.min_net_cash_month
+    payback_period = state.payback_period
+    payback_found = state.payback_found
+
+    cash_in_column = []
+    cash_out_column = []
+    net_cash_column = []
+    cumulative_net_cash_column = []
+    checkpoints = []
+    next_checkpoint = state.month
+
+    # Checked once: a per-month logging call would cost more than the month itself
+    trace_months = engine_log.isEnabledFor(logging.DEBUG)
+    for i in range(state.month, horizon + 1):
+        if i == next_checkpoint:
+            checkpoints.append(ForecastState(
+                i, cumulative_net_cash, cumulative_expenses, cumulative_cash_out,
+                min_net_cash, min_net_cash_month, payback_period, payback_found))
+            next_checkpoint += interval
+
+        position = phase_index[i]
+        delay_start = delay_starts[i]
+        # During a delay, the cash out is just the delay expense plus overhead
+        # Overhead does not apply to cumulative expense that is uses for gross margin calculation
+        if delay_start:
+            delay_expense = delays[delay_start].expense
+            cumulative_expenses += delay_expense
+            cash_in = 0
+            cash_out = delay_expense + overheads[position]
+        else:
+            cumulative_expenses += working_expenses[position]
+            cash_in = milestone_percent[i] * contract_value
+            cash_out = working_cash_out[position]
+
+        net_cash = cash_in - cash_out
+        cumulative_net_cash += net_cash
+        cumulative_cash_out += cash_out
+
+        if phase_start[i]:
+            upfront = upfronts[position]
+            net_cash -= upfront
+            cash_out += upfront
+            cumulative_net_cash -= upfront
+            cumulative_expenses -= upfront
+        cash_in_column.append(cash_in)
+        cash_out_column.append(cash_out)
+        net_cash_column.append(net_cash)
+        cumulative_net_cash_column.append(cumulative_net_cash)
+        if trace_months:
+            engine_log.debug("Month %d: phase=%s delay=%s cash_in=%s cash_out=%s",
+                             i, forecast_input.phases[position].name if position >= 0 else None,
+                             bool(delay_start), cash_in, cash_out)
+
+        # Set the minimum net cash and the minimum net cash month
+        if i == 1:
+            min_net_cash = cumulative_net_cash
+        elif cumulative_net_cash < min_net_cash:
+            min_net_cash = cumulative_net_cash
+            min_net_cash_month = i
+
+        # If the cumulative net cash is greater than 0 and the payback period has not been found, set the payback period to the current month
+        if cumulative_net_cash > 0 and not payback_found:
+            payback_period = i
+            payback_found = True
+
+    final_state = ForecastState(
+        max(horizon + 1, state.month), cumulative_net_cash, cumulative_expenses, cumulative_cash_out,
+        min_net_cash, min_net_cash_month, payback_period, payback_found)
+    if not checkpoints or checkpoints[-1].month != final_state.month:
+        checkpoints.append(final_state)
+    phase_column = phase_index[state.month:horizon + 1]
+    columns = (cash_in_column, cash_out_column, net_cash_column, cumulative_net_cash_column, phase_column)
+    return columns, final_state, checkpoints
+
+
+def finish_forecast(forecast_input, columns, final_state, checkpoints):
+    """Build the ForecastResult, working out the verdict and margin from the final state"""
+    # The cumulative net cash went under the floor in some month exactly when its minimum did
+    ran_months = final_state.month > 1
+    verdict = 'Restructure' if ran_months and final_state.min_net_cash < forecast_input.min_cash_allowed else 'Go'
+    # If the contract value is less than the total cash out, the project is not profitable
+    if forecast_input.contract_value < final_state.cumulative_cash_out:
+        verdict = 'Not Profitable'
+    gross_margin = (forecast_input.contract_value - final_state.cumulative_expenses) / forecast_input.contract_value
+    return ForecastResult(
+        [phase.name for phase in forecast_input.phases],
+        *columns,
+        verdict,
+        final_state.payback_period,
+        gross_margin,
+        final_state.min_net_cash,
+        final_state.min_net_cash_month,
+        final_state.cumulative_net_cash,
+        forecast_input=forecast_input,
+        checkpoints=checkpoints,
+    )
+
+
+def forecast_with_checkpoints(forecast_input):
+    """Run the loop engine from month 1, keeping ForecastStates along the way"""
+    columns, final_state, checkpoints = run_months(forecast_input, ForecastState.initial())
+    return finish_forecast(forecast_input, columns, final_state, checkpoints)
+
+
+def first_changed_month(base, forecast_input):
+    """Earliest month whose figures can differ from base under forecast_input
+
+    Returns the month after the shorter horizon when no month can change;
+    the cash floor only moves the verdict, so it never changes a month.
+    """
+    old = base.forecast_input
+    month = min(len(base), forecast_horizon(forecast_input)) + 1
+    # Validation refuses negative delays; should one get through, the checks below cannot place it
+    if any(delay.length < 0 for delay in (*old.delays.values(), *forecast_input.delays.values())):
+        return 1
+    if (old.payment_lag, old.contract_value, old.contingency_percent) != (
+            forecast_input.payment_lag, forecast_input.contract_value, forecast_input.contingency_percent):
+        return 1
+    if [phase.name for phase in old.phases] != [phase.name for phase in forecast_input.phases]:
+        return 1
+
+    # A phase, or its unexpected costs, first matters in the first month it is the current phase
+    changed_positions = [
+        position for position, (old_phase, new_phase) in enumerate(zip(old.phases, forecast_input.phases))
+        if (old_phase.length, old_phase.expense, old_phase.overhead, old_phase.upfront) !=
+           (new_phase.length, new_phase.expense, new_phase.overhead, new_phase.upfront)
+        or old.unexpected_costs.get(old_phase.name) != forecast_input.unexpected_costs.get(new_phase.name)
+    ]
+    # The first phase's length places every later phase, even when it is too short to show up
+    if 0 in changed_positions:
+        return 1
+    phase_first_month = timeline_for(old).phase_first_month
+    for position in changed_positions:
+        if phase_first_month[position]:
+            month = min(month, phase_first_month[position])
+
+    # A delay first matters in its start month
+    old_delays = {start_month: (delay.length, delay.expense) for start_month, delay in old.delays.items()}
+    new_delays = {start_month: (delay.length, delay.expense) for start_month, delay in forecast_input.delays.items()}
+    for start_month in changed_keys(old_delays, new_delays):
+        if start_month >= 1:
+            month = min(month, start_month)
+
+    # A milestone is paid at least the payment lag after its month, later if delays push it back
+    for key in changed_keys(old.billing_milestones, forecast_input.billing_milestones):
+        try:
+            milestone_month = int(key)
+        except ValueError:
+            continue
+        # The engine looks milestones up by str(month), so keys such as '07' never match
+        if str(milestone_month) == key:
+            month = min(month, max(milestone_month + forecast_input.payment_lag, 1))
+    return month
+
+
+def changed_keys(old, new):
+    """Keys added, removed or changed between two mappings of hashable values"""
+    return {key for key, _ in old.items() ^ new.items()}
+
+
+def update_forecast(base, parsed_inputs):
+    """Re-forecast parsed_inputs starting from base's nearest checkpoint
+
+    base must come from the loop engine. Months before the first one the
+    change can affect are copied from base; the loop resumes from the last
+    checkpoint at or before it. Returns the ForecastResult and the month
+    the loop resumed from.
+    """
+    forecast_input = ForecastInput.from_parsed(parsed_inputs)
+    if not forecast_input.phases:
+        return {'success': False, 'message': 'No phases provided'}, 1
+    month = first_changed_month(base, forecast_input)
+    position = bisect_right(base.checkpoints, month, key=lambda checkpoint: checkpoint.month) - 1
+    start = base.checkpoints[position] if position >= 0 else ForecastState.initial()
+    columns, final_state, checkpoints = run_months(forecast_input, start)
+
+    kept = start.month - 1
+    prefix = (base.cash_in, base.cash_out, base.net_cash, base.cumulative_net_cash, base.phase_index)
+    columns = [np.concatenate((old[:kept], np.asarray(new, dtype=old.dtype))) for old, new in zip(prefix, columns)]
+    checkpoints = base.checkpoints[:max(position, 0)] + checkpoints
+    return finish_forecast(forecast_input, columns, final_state, checkpoints), start.month
@@ -0,0 +1,261 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from database import connect, run_with_retry
+
+log = logging.getLogger('forecast.jobs')
+
+# Job threads per worker process; 0 leaves this process to accept jobs without running any
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+# Jobs running at once across every process sharing the database
+MAX_RUNNING_JOBS = int(os.environ.get('MAX_RUNNING_JOBS', os.cpu_count() or 1))
+# Jobs waiting to run before new submissions are turned away
+MAX_QUEUED_JOBS = int(os.environ.get('MAX_QUEUED_JOBS', 100))
+# How often an idle runner looks for jobs submitted to other processes
+JOB_POLL_SECONDS = 1.0
+# Progress is written at most this often; each write also picks up cancellation
+JOB_PROGRESS_SECONDS = 0.25
+# A running job whose process has not checked in for this long is marked failed
+JOB_STALE_SECONDS = 60
+# Finished jobs are deleted after this long
+JOB_RETENTION_SECONDS = 7 * 24 * 3600
+
+FINISHED_STATUSES = ('succeeded', 'failed', 'cancelled')
+JOB_FIELDS = ('id', 'kind', 'status', 'progress', 'message', 'error', 'created_at', 'started_at', 'finished_at')
+
+
+class JobCancelled(Exception):
+    """Raised from a job's progress callback once the job has been cancelled"""
+
+
+def now():
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+
+
+def create_job(conn, kind, params, max_queued=MAX_QUEUED_JOBS):
+    """Queue a job and return its id, or None when the queue is full"""
+    job_id = uuid.uuid4().hex
+
+    def insert():
+        try:
+            # The count and the insert share one write transaction, so concurrent submissions cannot overfill the queue
+            conn.execute('BEGIN IMMEDIATE')
+            queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+            if queued >= max_queued:
+                conn.rollback()
+                return None
+            conn.execute('''
+                INSERT INTO jobs (id, kind, status, params, created_at) VALUES (?, ?, 'queued', ?, ?)
+            ''', (job_id, kind, json.dumps(params), now()))
+            conn.commit()
+            return job_id
+        except Exception:
+            conn.rollback()
+            raise
+
+    return run_with_retry(insert)
+
+
+def get_job(conn, job_id, with_result=False):
+    """A job as a dict, with its decoded result when asked for; None if unknown"""
+    columns = JOB_FIELDS + ('result',) if with_result else JOB_FIELDS
+    row = conn.execute(f"SELECT {', '.join(columns)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = {column: row[column] for column in JOB_FIELDS}
+    if with_result:
+        job['result'] = json.loads(row['result']) if row['result'] is not None else None
+    return job
+
+
+def cancel_job(conn, job_id):
+    """Cancel a job: a queued one at once, a running one at its next progress report
+
+    Returns the job's status afterwards, or None if it does not exist.
+    """
+    def cancel():
+        cursor = conn.execute('''
+            UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'
+        ''', (now(), job_id))
+        if not cursor.rowcount:
+            conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,))
+        conn.commit()
+
+    run_with_retry(cancel)
+    row = conn.execute('SELECT status FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    return row['status'] if row else None
+
+
+def claim_job(conn, worker, max_running=MAX_RUNNING_JOBS):
+    """Atomically move the oldest queued job to running; returns (id, kind, params) or None"""
+    def claim():
+        row = conn.execute('''
+            UPDATE jobs SET status = 'running', worker = ?, started_at = ?, heartbeat_at = ?
+            WHERE id = (SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at, rowid LIMIT 1)
+              AND (SELECT COUNT(*) FROM jobs WHERE status = 'running') < ?
+            RETURNING id, kind, params
+        ''', (worker, now(), now(), max_running)).fetchone()
+        conn.commit()
+        return row
+
+    row = run_with_retry(claim)
+    return (row['id'], row['kind'], json.loads(row['params'])) if row else None
+
+
+def finish_job(conn, job_id, status, result=None, error=None):
+    """Record how a job ended"""
+    def finish():
+        conn.execute('''
+            UPDATE jobs SET status = ?, progress = CASE WHEN ? = 'succeeded' THEN 1 ELSE progress END,
+                            result = ?, error = ?, finished_at = ?
+            WHERE id = ?
+        ''', (status, status, json.dumps(result) if result is not None else None, error, now(), job_id))
+        conn.commit()
+
+    run_with_retry(finish)
+
+
+def report_progress(conn, job_id, progress, message):
+    """Store a job's progress; returns whether it has been asked to cancel"""
+    def report():
+        row = conn.execute('''
+            UPDATE jobs SET progress = ?, message = COALESCE(?, message), heartbeat_at = ?
+            WHERE id = ?
+            RETURNING cancel_requested
+        ''', (progress, message, now(), job_id)).fetchone()
+        conn.commit()
+        return bool(row and row['cancel_requested'])
+
+    return run_with_retry(report)
+
+
+def maintain_jobs(conn, worker, purge=False):
+    """Heartbeat this worker's running jobs and fail those of workers that stopped"""
+    def maintain():
+        timestamp = now()
+        conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE worker = ? AND status = 'running'", (timestamp, worker))
+        stale = conn.execute('''
+            UPDATE jobs SET status = 'failed', error = 'The worker running this job stopped', finished_at = ?
+            WHERE status = 'running' AND heartbeat_at < datetime('now', ?)
+        ''', (timestamp, f'-{JOB_STALE_SECONDS} seconds')).rowcount
+        if purge:
+            conn.execute('''
+                DELETE FROM jobs WHERE status IN ('succeeded', 'failed', 'cancelled') AND finished_at < datetime('now', ?)
+            ''', (f'-{JOB_RETENTION_SECONDS} seconds',))
+        conn.commit()
+        return stale
+
+    stale = run_with_retry(maintain)
+    if stale:
+        log.warning("Marked %d jobs of stopped workers as failed", stale)
+
+
+class JobRunner:
+    """Runs queued jobs from the jobs table on a local thread pool
+
+    Jobs live in SQLite, so any process sharing the database can accept a
+    job and any can run it: a dispatcher thread claims queued jobs while
+    this process has free threads and fewer than max_running jobs run
+    across all processes. handlers maps a job kind to a function taking the
+    job's params and a progress(done, total, message=None) callback, and
+    returning a JSON-serialisable result. progress raises JobCancelled once
+    the job is cancelled. context, when given, returns the context manager
+    each job runs in.
+    """
+
+    def __init__(self, database, handlers, context=None, workers=JOB_WORKERS, max_running=MAX_RUNNING_JOBS):
+        self.database = database
+        self.handlers = handlers
+        self.context = context or nullcontext
+        self.workers = workers
+        self.max_running = max_running
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    @property
+    def worker(self):
+        return f'{socket.gethostname()}:{os.getpid()}'
+
+    def start(self):
+        """Start the dispatcher thread in this process, if it is not running yet"""
+        if not self.workers:
+            return
+        with self._lock:
+            # Threads do not survive a fork, so a forked worker starts its own
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._dispatch, name='job-dispatcher', daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        """Look for queued jobs now rather than at the next poll"""
+        self._wake.set()
+
+    def _dispatch(self):
+        conn = connect(self.database)
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='job')
+        free = threading.Semaphore(self.workers)
+        purged_at = 0
+        while True:
+            self._wake.wait(JOB_POLL_SECONDS)
+            self._wake.clear()
+            try:
+                purge = time.monotonic() - purged_at > 3600
+                maintain_jobs(conn, self.worker, purge)
+                if purge:
+                    purged_at = time.monotonic()
+                while free.acquire(blocking=False):
+                    job = claim_job(conn, self.worker, self.max_running)
+                    if job is None:
+                        free.release()
+                        break
+                    executor.submit(self._run, free, *job)
+            except Exception:
+                log.exception("Job dispatcher error")
+
+    def _run(self, free, job_id, kind, params):
+        conn = connect(self.database)
+        last_report = 0.0
+
+        def progress(done, total, message=None):
+            nonlocal last_report
+            # Reports are throttled; each one written also checks for cancellation
+            if time.monotonic() - last_report < JOB_PROGRESS_SECONDS:
+                return
+            last_report = time.monotonic()
+            if report_progress(conn, job_id, min(done / total, 1.0) if total else 0.0, message):
+                raise JobCancelled()
+
+        started = time.perf_counter()
+        try:
+            handler = self.handlers.get(kind)
+            if handler is None:
+                raise ValueError(f'Unknown job kind: {kind}')
+            with self.context():
+                result = handler(params, progress)
+            finish_job(conn, job_id, 'succeeded', result=result)
+            log.info("Job %s (%s) succeeded in %.2fs", job_id, kind, time.perf_counter() - started)
+        except JobCancelled:
+            finish_job(conn, job_id, 'cancelled')
+            log.info("Job %s (%s) cancelled", job_id, kind)
+        except ValueError as e:
+            # Invalid params, as the synchronous routes would answer with a 400
+            log.warning("Job %s (%s) failed: %s", job_id, kind, e)
+            finish_job(conn, job_id, 'failed', error=str(e))
+        except Exception as e:
+            log.exception("Job %s (%s) failed", job_id, kind)
+            finish_job(conn, job_id, 'failed', error=str(e))
+        finally:
+            conn.close()
+            free.release()
+            self._wake.set()
@@ -0,0 +1,84 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+
+from flask import g, has_request_context
+
+# Every logger of the app sits under this one, e.g. forecast.engine
+ROOT_LOGGER = 'forecast'
+TEXT_FORMAT = '%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s'
+
+_listener = None
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamp each record with the id of the request that logged it, or '-'"""
+
+    def filter(self, record):
+        record.request_id = g.get('request_id', '-') if has_request_context() else '-'
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', '-'),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+def configure_logging(level=None, json_output=None, stream=None):
+    """Send the app's logs through a queue to a background writer thread
+
+    Request threads only put records on an in-memory queue; formatting and
+    writing happen on the listener thread, so a slow stdout never blocks a
+    request. level defaults to LOG_LEVEL (INFO) and json_output to
+    LOG_FORMAT=json. Calling it again replaces the previous configuration.
+    """
+    global _listener
+    level = level or os.environ.get('LOG_LEVEL', 'INFO')
+    if json_output is None:
+        json_output = os.environ.get('LOG_FORMAT', 'text').lower() == 'json'
+
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JsonFormatter() if json_output else logging.Formatter(TEXT_FORMAT))
+
+    records = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(records)
+    # The request id must be read on the request's thread, before the record is queued
+    queue_handler.addFilter(RequestIdFilter())
+
+    if _listener is not None:
+        _listener.stop()
+    _listener = logging.handlers.QueueListener(records, handler, respect_handler_level=True)
+    _listener.start()
+
+    logger = logging.getLogger(ROOT_LOGGER)
+    for existing in list(logger.handlers):
+        logger.removeHandler(existing)
+    logger.addHandler(queue_handler)
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    logger.propagate = False
+    return logger
+
+
+@atexit.register
+def stop_logging():
+    """Flush queued records on shutdown"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
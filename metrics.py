@@ -0,0 +1,177 @@
+import contextvars
+import functools
+import glob
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# Latency buckets in seconds, and forecast length buckets in months
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MONTH_BUCKETS = (12, 24, 36, 60, 120, 240, 480, 1000)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+# With METRICS_DIR set, each worker writes its metrics there at most this often
+METRICS_FLUSH_SECONDS = 1.0
+
+# Database queries made by the request running in the current context, when one is
+_request_queries = contextvars.ContextVar('request_queries', default=None)
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set, in the Prometheus layout"""
+
+    def __init__(self, name, help_text, labels, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, value, *label_values):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series.setdefault(label_values, [[0] * (len(self.buckets) + 1), 0.0])
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def merge(self, snapshot):
+        for label_values, (counts, total) in snapshot:
+            series = self.series.setdefault(tuple(label_values), [[0] * (len(self.buckets) + 1), 0.0])
+            series[0] = [mine + theirs for mine, theirs in zip(series[0], counts)]
+            series[1] += total
+
+    def snapshot(self):
+        return [[list(label_values), [list(counts), total]] for label_values, (counts, total) in self.series.items()]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for label_values, (counts, total) in sorted(self.series.items()):
+            labels = [f'{name}="{escape(value)}"' for name, value in zip(self.labels, label_values)]
+            cumulative = 0
+            for bound, count in zip(list(self.buckets) + ['+Inf'], counts):
+                cumulative += count
+                bucket_labels = ','.join(labels + [f'le="{bound}"'])
+                lines.append(f'{self.name}_bucket{{{bucket_labels}}} {cumulative}')
+            label_text = f'{{{",".join(labels)}}}' if labels else ''
+            lines.append(f'{self.name}_sum{label_text} {total}')
+            lines.append(f'{self.name}_count{label_text} {cumulative}')
+        return lines
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsRegistry:
+    """Histograms of one process, rendered in the Prometheus text format
+
+    Under several worker processes each worker only sees its own requests.
+    Set METRICS_DIR to a directory shared by the workers: each one then
+    writes a snapshot there, and render() merges every snapshot, so any
+    worker answering /metrics reports the whole server.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._flushed_at = 0.0
+        self.request_duration = Histogram(
+            'forecast_http_request_duration_seconds', 'Time spent handling a request',
+            ('route', 'method', 'status'), DURATION_BUCKETS)
+        self.stage_duration = Histogram(
+            'forecast_stage_duration_seconds', 'Time spent in each forecast pipeline stage',
+            ('stage',), DURATION_BUCKETS)
+        self.query_duration = Histogram(
+            'forecast_db_query_duration_seconds', 'Time spent executing SQLite statements',
+            ('statement',), DURATION_BUCKETS)
+        self.request_queries = Histogram(
+            'forecast_db_queries_per_request', 'SQLite statements executed per request',
+            ('route',), QUERY_COUNT_BUCKETS)
+        self.horizon = Histogram(
+            'forecast_horizon_months', 'Months simulated per forecast',
+            (), MONTH_BUCKETS)
+        self.histograms = [self.request_duration, self.stage_duration, self.query_duration,
+                           self.request_queries, self.horizon]
+
+    def observe(self, histogram, value, *label_values):
+        with self._lock:
+            histogram.observe(value, *label_values)
+
+    def render(self):
+        """Prometheus text exposition of every histogram"""
+        if not self.directory:
+            with self._lock:
+                return '\n'.join(line for histogram in self.histograms for line in histogram.render()) + '\n'
+
+        self.flush(force=True)
+        merged = MetricsRegistry()
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            try:
+                with open(path) as snapshot_file:
+                    snapshot = json.load(snapshot_file)
+            except (OSError, ValueError):
+                continue
+            for histogram in merged.histograms:
+                histogram.merge(snapshot.get(histogram.name, []))
+        return '\n'.join(line for histogram in merged.histograms for line in histogram.render()) + '\n'
+
+    def flush(self, force=False):
+        """Write this process's snapshot to METRICS_DIR, at most once per METRICS_FLUSH_SECONDS"""
+        if not self.directory:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._flushed_at < METRICS_FLUSH_SECONDS:
+                return
+            self._flushed_at = now
+            snapshot = {histogram.name: histogram.snapshot() for histogram in self.histograms}
+        path = os.path.join(self.directory, f'metrics-{os.getpid()}.json')
+        # Write then rename, so a reader never sees half a file
+        with open(f'{path}.tmp', 'w') as snapshot_file:
+            json.dump(snapshot, snapshot_file)
+        os.replace(f'{path}.tmp', path)
+
+
+registry = MetricsRegistry(os.environ.get('METRICS_DIR') or None)
+
+
+def timed_stage(stage):
+    """Decorator recording how long each call of a function takes under a stage name"""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                registry.observe(registry.stage_duration, time.perf_counter() - started, stage)
+        return wrapper
+    return decorator
+
+
+def observe_query(statement, seconds):
+    """Record one SQLite statement, counting it against the current request"""
+    registry.observe(registry.query_duration, seconds, statement)
+    queries = _request_queries.get()
+    if queries is not None:
+        queries[0] += 1
+
+
+def observe_horizon(months):
+    """Record the number of months a forecast simulated"""
+    registry.observe(registry.horizon, months)
+
+
+def start_request():
+    """Begin counting the database queries of the current request"""
+    _request_queries.set([0])
+
+
+def finish_request(route, method, status, seconds):
+    """Record a finished request and its query count"""
+    queries = _request_queries.get()
+    _request_queries.set(None)
+    registry.observe(registry.request_duration, seconds, route, method, str(status))
+    registry.observe(registry.request_queries, queries[0] if queries else 0, route)
+    registry.flush()
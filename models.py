@@ -0,0 +1,280 @@
+import numpy as np
+
+
+class Phase:
+    """One project phase, in the order phases run"""
+    __slots__ = ('name', 'length', 'expense', 'overhead', 'upfront')
+
+    def __init__(self, name, length, expense, overhead=0.0, upfront=0.0):
+        self.name = str(name)
+        self.length = int(length)
+        self.expense = float(expense)
+        self.overhead = float(overhead)
+        self.upfront = float(upfront)
+
+
+class Delay:
+    """A pause in the work starting at a given month"""
+    __slots__ = ('start_month', 'length', 'expense')
+
+    def __init__(self, start_month, length, expense=0.0):
+        self.start_month = int(start_month)
+        self.length = int(length)
+        self.expense = float(expense)
+
+
+class ForecastInput:
+    """Typed form of the parsed inputs
+
+    Values are converted once on construction, so the engine can use them
+    without casting again. phases is a tuple in run order and delays maps
+    the start month to its Delay. Billing milestones stay a mapping of month
+    key to percent: the engine looks them up by the string of the month
+    number, and a record per month would cost more than the lookup saves.
+    timeline holds the compiled Timeline once timeline.timeline_for has
+    built it.
+    """
+    __slots__ = ('time_frame', 'payment_lag', 'contract_value', 'min_cash_allowed', 'contingency_percent',
+                 'phases', 'delays', 'unexpected_costs', 'billing_milestones', 'timeline')
+
+    def __init__(self, time_frame, payment_lag, contract_value, min_cash_allowed, contingency_percent,
+                 phases=(), delays=(), unexpected_costs=None, billing_milestones=None):
+        self.time_frame = int(time_frame)
+        self.payment_lag = int(payment_lag)
+        self.contract_value = float(contract_value)
+        self.min_cash_allowed = float(min_cash_allowed)
+        self.contingency_percent = float(contingency_percent)
+        self.phases = tuple(phases)
+        self.delays = {delay.start_month: delay for delay in delays}
+        self.unexpected_costs = {str(name): float(percent) for name, percent in (unexpected_costs or {}).items()}
+        self.billing_milestones = {str(month): float(percent) for month, percent in (billing_milestones or {}).items()}
+        self.timeline = None
+
+    @classmethod
+    def from_parsed(cls, parsed_inputs):
+        """Build from the dict returned by parse_inputs"""
+        return cls(
+            parsed_inputs['time_frame'],
+            parsed_inputs['payment_lag'],
+            parsed_inputs['contract_value'],
+            parsed_inputs['min_cash_allowed'],
+            parsed_inputs['contingency_percent'],
+            phases=[
+                Phase(name, phase['length'], phase['expense'], phase.get('overhead', 0), phase.get('upfront', 0))
+                for name, phase in parsed_inputs['phases'].items()
+            ],
+            delays=[Delay(month, delay['length'], delay['expense']) for month, delay in parsed_inputs['delays'].items()],
+            unexpected_costs=parsed_inputs['unexpected_costs'],
+            billing_milestones=parsed_inputs['billing_milestones'],
+        )
+
+    def to_parsed(self):
+        """Convert back to the parse_inputs dict"""
+        return {
+            'time_frame': self.time_frame,
+            'payment_lag': self.payment_lag,
+            'contract_value': self.contract_value,
+            'min_cash_allowed': self.min_cash_allowed,
+            'contingency_percent': self.contingency_percent,
+            'phases': {
+                phase.name: {'length': phase.length, 'expense': phase.expense,
+                             'overhead': phase.overhead, 'upfront': phase.upfront}
+                for phase in self.phases
+            },
+            'delays': {month: {'length': delay.length, 'expense': delay.expense} for month, delay in self.delays.items()},
+            'unexpected_costs': dict(self.unexpected_costs),
+            'billing_milestones': dict(self.billing_milestones),
+        }
+
+
+class Timeline:
+    """When each month's phase, delay and billing fall, compiled once per schedule
+
+    Every column is a tuple indexed by month, with index 0 unused:
+    phase_index is the current phase position (-1 after the last phase),
+    phase_start marks the months that charge the phase's upfront cost,
+    delay_start is the start month of the delay in effect (0 outside
+    delays) and milestone_percent is the share of the contract billed in
+    the month, already shifted by the payment lag and the delays before
+    it. phase_first_month holds the first month of each phase position, 0
+    when it never runs, and phases_reached how many leading phases run
+    at all. Only lengths, months and milestone percentages go
+    in, so forecasts that change amounts share one Timeline.
+    """
+    __slots__ = ('horizon', 'phase_index', 'phase_start', 'delay_start', 'milestone_percent', 'phase_first_month',
+                 'phases_reached')
+
+    def __init__(self, horizon, phase_index, phase_start, delay_start, milestone_percent, phase_first_month):
+        self.horizon = horizon
+        self.phase_index = tuple(phase_index)
+        self.phase_start = tuple(phase_start)
+        self.delay_start = tuple(delay_start)
+        self.milestone_percent = tuple(milestone_percent)
+        self.phase_first_month = tuple(phase_first_month)
+        # Phases run in order, so the last one to run bounds those that can appear in phase_index
+        self.phases_reached = max(
+            (position + 1 for position, month in enumerate(self.phase_first_month) if month), default=0)
+
+
+class ForecastState:
+    """Running totals of the loop engine before a given month
+
+    The Timeline says where every month falls, so this is all the month
+    loop carries from one month to the next, and a forecast can be resumed
+    from here instead of from month 1.
+    """
+    __slots__ = ('month', 'cumulative_net_cash', 'cumulative_expenses', 'cumulative_cash_out',
+                 'min_net_cash', 'min_net_cash_month', 'payback_period', 'payback_found')
+
+    def __init__(self, month, cumulative_net_cash, cumulative_expenses, cumulative_cash_out,
+                 min_net_cash, min_net_cash_month, payback_period, payback_found):
+        self.month = month
+        self.cumulative_net_cash = cumulative_net_cash
+        self.cumulative_expenses = cumulative_expenses
+        self.cumulative_cash_out = cumulative_cash_out
+        self.min_net_cash = min_net_cash
+        self.min_net_cash_month = min_net_cash_month
+        self.payback_period = payback_period
+        self.payback_found = payback_found
+
+    @classmethod
+    def initial(cls):
+        """The state before month 1"""
+        return cls(1, 0, 0, 0, 0, 0, 999, False)
+
+
+class ForecastResult:
+    """A forecast held as parallel arrays, one entry per month
+
+    phase_index points into phase_names, with -1 for the months after the
+    last phase. The per-month dicts of the JSON response are only built by
+    to_dict, so results held in memory (the cache, batches, sensitivity
+    runs) cost a few arrays each instead of a dict per month.
+
+    The loop engine also keeps the ForecastInput it ran on and a
+    ForecastState every few months in checkpoints, so an edit can be
+    re-forecast from the first month it changes. Other engines leave both
+    as None.
+    """
+    __slots__ = ('phase_names', 'cash_in', 'cash_out', 'net_cash', 'cumulative_net_cash', 'phase_index',
+                 'verdict', 'payback_period', 'gross_margin', 'min_net_cash', 'min_net_cash_month', 'final_net_cash',
+                 'forecast_input', 'checkpoints')
+
+    def __init__(self, phase_names, cash_in, cash_out, net_cash, cumulative_net_cash, phase_index,
+                 verdict, payback_period, gross_margin, min_net_cash, min_net_cash_month, final_net_cash,
+                 forecast_input=None, checkpoints=None):
+        self.phase_names = tuple(phase_names)
+        self.cash_in = np.asarray(cash_in, dtype=float)
+        self.cash_out = np.asarray(cash_out, dtype=float)
+        self.net_cash = np.asarray(net_cash, dtype=float)
+        self.cumulative_net_cash = np.asarray(cumulative_net_cash, dtype=float)
+        self.phase_index = np.asarray(phase_index, dtype=np.int32)
+        self.verdict = verdict
+        self.payback_period = int(payback_period)
+        self.gross_margin = float(gross_margin)
+        self.min_net_cash = float(min_net_cash)
+        self.min_net_cash_month = int(min_net_cash_month)
+        self.final_net_cash = float(final_net_cash)
+        self.forecast_input = forecast_input
+        self.checkpoints = checkpoints
+
+    def __len__(self):
+        return len(self.cash_in)
+
+    @property
+    def nbytes(self):
+        """Bytes held by the monthly arrays"""
+        return sum(array.nbytes for array in (self.cash_in, self.cash_out, self.net_cash,
+                                              self.cumulative_net_cash, self.phase_index))
+
+    @classmethod
+    def from_dict(cls, result):
+        """Build from the dict returned by calculate_forecast"""
+        rows = result['forecast']
+        phase_names = list(dict.fromkeys(row['phase'] for row in rows if row['phase'] is not None))
+        positions = {name: position for position, name in enumerate(phase_names)}
+        return cls(
+            phase_names,
+            [row['cash_in'] for row in rows],
+            [row['cash_out'] for row in rows],
+            [row['net_cash'] for row in rows],
+            [row['cumulative_net_cash'] for row in rows],
+            [positions.get(row['phase'], -1) for row in rows],
+            result['verdict'],
+            result['payback_period'],
+            result['gross_margin'],
+            result['min_net_cash'],
+            result['min_net_cash_month'],
+            result['cumulative_net_cash'],
+        )
+
+    @classmethod
+    def from_columns(cls, result):
+        """Build from the dict returned by to_columns, keeping phases that never became current"""
+        columns = result['columns']
+        return cls(
+            result['phases'],
+            columns['cash_in'],
+            columns['cash_out'],
+            columns['net_cash'],
+            columns['cumulative_net_cash'],
+            columns['phase_index'],
+            result['verdict'],
+            result['payback_period'],
+            result['gross_margin'],
+            result['min_net_cash'],
+            result['min_net_cash_month'],
+            result['cumulative_net_cash'],
+        )
+
+    def rows(self):
+        """The per-month dicts of the JSON response"""
+        phases = [self.phase_names[index] if index >= 0 else None for index in self.phase_index.tolist()]
+        return [
+            {
+                'cash_in': cash_in,
+                'cash_out': cash_out,
+                'net_cash': net_cash,
+                'cumulative_net_cash': cumulative,
+                'phase': phase,
+            }
+            for cash_in, cash_out, net_cash, cumulative, phase in zip(
+                self.cash_in.tolist(), self.cash_out.tolist(), self.net_cash.tolist(),
+                self.cumulative_net_cash.tolist(), phases
+            )
+        ]
+
+    def to_dict(self):
+        """The forecast in the format calculate_forecast returns"""
+        return {
+            'forecast': self.rows(),
+            'verdict': self.verdict,
+            'payback_period': self.payback_period,
+            'gross_margin': self.gross_margin,
+            'min_net_cash': self.min_net_cash,
+            'min_net_cash_month': self.min_net_cash_month,
+            'cumulative_net_cash': self.final_net_cash,
+        }
+
+    def to_columns(self):
+        """The forecast with its months as parallel arrays instead of a dict per month
+
+        phases names the phase_index entries; the headline figures are as
+        in to_dict.
+        """
+        return {
+            'columns': {
+                'cash_in': self.cash_in.tolist(),
+                'cash_out': self.cash_out.tolist(),
+                'net_cash': self.net_cash.tolist(),
+                'cumulative_net_cash': self.cumulative_net_cash.tolist(),
+                'phase_index': self.phase_index.tolist(),
+            },
+            'phases': list(self.phase_names),
+            'verdict': self.verdict,
+            'payback_period': self.payback_period,
+            'gross_margin': self.gross_margin,
+            'min_net_cash': self.min_net_cash,
+            'min_net_cash_month': self.min_net_cash_month,
+            'cumulative_net_cash': self.final_net_cash,
+        }
@@ -0,0 +1,191 @@
+from collections import deque
+from datetime import datetime
+from itertools import chain, islice
+
+import numpy as np
+
+from forecast_engine import calculate_forecast_arrays
+from process_pool import pool_workers, submit
+
+# Projects are forecast in chunks; at most two chunks per worker are in flight,
+# so memory stays bounded however many projects the portfolio holds.
+PORTFOLIO_CHUNK_SIZE = 50
+
+
+def calendar_month(start_date):
+    """Convert a YYYY-MM-DD start date into a running month number"""
+    date = datetime.strptime(start_date, '%Y-%m-%d')
+    return date.year * 12 + date.month - 1
+
+
+def month_label(month):
+    """Format a running month number as YYYY-MM"""
+    return f'{month // 12:04d}-{month % 12 + 1:02d}'
+
+
+def chunked(iterable, size):
+    """Yield lists of up to size items from an iterable"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def evaluate_portfolio_chunk(projects):
+    """Forecast one chunk of projects
+
+    Returns one (project, result, error) tuple per project, where result holds
+    the monthly cash arrays and headline figures needed by the portfolio. The
+    project inputs are not sent back to the caller.
+    """
+    evaluated = []
+    for project in projects:
+        identity = {'id': project['id'], 'name': project['name'], 'start_date': project['start_date']}
+        try:
+            start_month = calendar_month(project['start_date'])
+        except (TypeError, ValueError):
+            evaluated.append((identity, None, 'Missing or invalid start_date'))
+            continue
+        try:
+            result = calculate_forecast_arrays(project['inputs'])
+        except Exception as e:
+            evaluated.append((identity, None, str(e)))
+            continue
+        evaluated.append((identity, {
+            'start_month': start_month,
+            'cash_in': result['cash_in'],
+            'cash_out': result['cash_out'],
+            'verdict': result['verdict'],
+            'payback_period': result['payback_period'],
+            'min_net_cash': result['min_net_cash'],
+        }, None))
+    return evaluated
+
+
+def evaluate_chunks(chunks, workers):
+    """Evaluate chunks of projects in order, in parallel when there is more than one"""
+    first = next(chunks, None)
+    if first is None:
+        return
+    second = next(chunks, None)
+    if second is None or workers <= 1:
+        for chunk in chain([first], [second] if second is not None else [], chunks):
+            yield evaluate_portfolio_chunk(chunk)
+        return
+
+    pending = deque()
+    try:
+        for chunk in chain([first, second], chunks):
+            pending.append(submit(evaluate_portfolio_chunk, chunk))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # The pool outlives the run, so chunks still queued when it stops early are dropped here
+        for future in pending:
+            future.cancel()
+
+
+def aggregate_portfolio(projects, workers=None, progress=None, total=None):
+    """Combine the forecasts of many projects on a shared calendar
+
+    projects is an iterable of dicts with id, name, start_date and parsed
+    inputs, ideally ordered by start_date. Only running totals and a short
+    summary per project are kept, never the per-project monthly forecasts.
+    progress, when given, is called with (projects done, total) after each
+    chunk; total is the caller's count of projects, if it has one.
+    """
+    workers = pool_workers(workers)
+    origin = None
+    end = 0
+    cash_in = np.zeros(0)
+    cash_out = np.zeros(0)
+    contributions = []
+    skipped = []
+
+    done = 0
+    for evaluated in evaluate_chunks(chunked(projects, PORTFOLIO_CHUNK_SIZE), workers):
+        done += len(evaluated)
+        if progress:
+            progress(done, total)
+        for project, result, error in evaluated:
+            if error is not None:
+                skipped.append({'id': project['id'], 'name': project['name'], 'reason': error})
+                continue
+
+            months = len(result['cash_in'])
+            if origin is None:
+                origin = result['start_month']
+            if result['start_month'] < origin:
+                # Projects arrived out of calendar order; shift the totals right
+                shift = origin - result['start_month']
+                cash_in = np.concatenate((np.zeros(shift), cash_in))
+                cash_out = np.concatenate((np.zeros(shift), cash_out))
+                origin = result['start_month']
+                end += shift
+            offset = result['start_month'] - origin
+            if offset + months > len(cash_in):
+                # Grow geometrically so appending many projects stays linear
+                size = max(offset + months, 2 * len(cash_in))
+                cash_in = np.pad(cash_in, (0, size - len(cash_in)))
+                cash_out = np.pad(cash_out, (0, size - len(cash_out)))
+            cash_in[offset:offset + months] += result['cash_in']
+            cash_out[offset:offset + months] += result['cash_out']
+            end = max(end, offset + months)
+
+            total_cash_in = float(result['cash_in'].sum())
+            total_cash_out = float(result['cash_out'].sum())
+            contributions.append({
+                'id': project['id'],
+                'name': project['name'],
+                'start_date': project['start_date'],
+                'months': months,
+                'total_cash_in': total_cash_in,
+                'total_cash_out': total_cash_out,
+                'net_cash': total_cash_in - total_cash_out,
+                'min_net_cash': result['min_net_cash'],
+                'payback_period': result['payback_period'],
+                'verdict': result['verdict'],
+            })
+
+    if origin is None:
+        return {
+            'projects': 0,
+            'skipped': skipped,
+            'months': [],
+            'cash_in': [],
+            'cash_out': [],
+            'net_cash': [],
+            'cumulative_net_cash': [],
+            'trough': None,
+            'contributions': []
+        }
+
+    # Trim the growth headroom back to the last month any project covers
+    cash_in = cash_in[:end]
+    cash_out = cash_out[:end]
+    net_cash = cash_in - cash_out
+    cumulative_net_cash = np.cumsum(net_cash)
+
+    total_net_cash = float(net_cash.sum())
+    for contribution in contributions:
+        contribution['share_of_net_cash'] = contribution['net_cash'] / total_net_cash if total_net_cash else None
+
+    trough_index = int(np.argmin(cumulative_net_cash)) if end else 0
+    return {
+        'projects': len(contributions),
+        'skipped': skipped,
+        'months': [month_label(origin + month) for month in range(end)],
+        'cash_in': cash_in.tolist(),
+        'cash_out': cash_out.tolist(),
+        'net_cash': net_cash.tolist(),
+        'cumulative_net_cash': cumulative_net_cash.tolist(),
+        'trough': {
+            'cumulative_net_cash': float(cumulative_net_cash[trough_index]),
+            'month': month_label(origin + trough_index),
+        } if end else None,
+        'contributions': contributions
+    }
@@ -0,0 +1,57 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Processes in each web worker's pool. gunicorn already runs about two web
+# workers per CPU, so a few each is plenty; requests queue for them.
+POOL_WORKERS = int(os.environ.get('PROCESS_POOL_WORKERS', min(2, os.cpu_count() or 1)))
+# Pool processes never come from forking a web worker, whose other threads
+# may hold locks (logging, SQLite, the job runner) at the moment of the fork
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+_pool = None
+_pool_pid = None
+_lock = threading.Lock()
+
+
+def pool_workers(requested=None):
+    """Processes a parallel run may use: the pool size, or fewer when requested"""
+    if requested is None:
+        return POOL_WORKERS
+    return max(1, min(int(requested), POOL_WORKERS))
+
+
+def process_pool():
+    """The process pool shared by every request of this process, started on first use"""
+    global _pool, _pool_pid
+    with _lock:
+        # A forked gunicorn worker must not reuse the pool of the process it was forked from
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(max_workers=POOL_WORKERS,
+                                        mp_context=multiprocessing.get_context(START_METHOD))
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def submit(function, *args):
+    """Run function(*args) in the shared pool, replacing the pool if a process of it died"""
+    global _pool
+    pool = process_pool()
+    try:
+        return pool.submit(function, *args)
+    except BrokenProcessPool:
+        with _lock:
+            if _pool is pool:
+                _pool = None
+        return process_pool().submit(function, *args)
+
+
+def shutdown_pool():
+    """Stop the pool's processes, cancelling queued work"""
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None and _pool_pid == os.getpid():
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,79 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Opt in with PROFILE_SLOW_REQUESTS_MS; profiles go to PROFILE_DIR
+PROFILE_INTERVAL_SECONDS = float(os.environ.get('PROFILE_INTERVAL_MS', 5)) / 1000
+
+
+class SamplingProfiler:
+    """Samples the stacks of in-flight requests and keeps those of slow ones
+
+    A background thread wakes every interval and records the current stack
+    of each thread serving a request. When a request finishes after more
+    than threshold seconds its samples are written to directory in the
+    folded-stack format ('outer;inner;leaf count' per line) read by
+    flamegraph.pl and speedscope; faster requests are discarded.
+    """
+
+    def __init__(self, threshold, directory, interval=PROFILE_INTERVAL_SECONDS):
+        self.threshold = threshold
+        self.directory = directory
+        self.interval = interval
+        self._samples = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self):
+        """Begin sampling the calling thread"""
+        with self._lock:
+            self._samples[threading.get_ident()] = Counter()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+                self._thread.start()
+
+    def stop(self, duration, label):
+        """Stop sampling the calling thread; write its profile if the request was slow"""
+        with self._lock:
+            samples = self._samples.pop(threading.get_ident(), None)
+        if not samples or duration < self.threshold:
+            return None
+        name = ''.join(character if character.isalnum() else '_' for character in label)
+        path = os.path.join(self.directory, f'{time.strftime("%Y%m%d-%H%M%S")}-{int(duration * 1000)}ms-{name}.folded')
+        with open(path, 'w') as profile:
+            for stack, count in samples.most_common():
+                profile.write(f'{stack} {count}\n')
+        return path
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._samples:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, samples in self._samples.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        samples[fold(frame)] += 1
+
+
+def fold(frame):
+    """Render a stack as 'outermost;...;innermost' function names"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def profiler_from_env():
+    """A SamplingProfiler when PROFILE_SLOW_REQUESTS_MS is set, else None"""
+    threshold_ms = os.environ.get('PROFILE_SLOW_REQUESTS_MS')
+    if not threshold_ms:
+        return None
+    return SamplingProfiler(float(threshold_ms) / 1000, os.environ.get('PROFILE_DIR', 'profiles'))
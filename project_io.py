@@ -0,0 +1,402 @@
+import csv
+import io
+import json
+import os
+import pickle
+import struct
+import tempfile
+
+import numpy as np
+
+from batch_forecast import apply_overrides
+from database import run_with_retry
+from storage import CHILD_INSERTS, PROJECT_CHUNK_SIZE, insert_children_rows, iter_projects_with_inputs, project_children_rows
+
+# Formats of /import_projects and /export_projects, with their media types and file extensions
+FORMATS = {'jsonl': 'application/x-ndjson', 'csv': 'text/csv', 'columnar': 'application/octet-stream'}
+EXTENSIONS = {'jsonl': 'jsonl', 'csv': 'csv', 'columnar': 'fcol'}
+# Projects inserted per executemany batch during an import
+IMPORT_BATCH_SIZE = 500
+# Bytes read from an import stream at a time
+READ_BUFFER_SIZE = 1 << 16
+# Invalid records listed in an import report; any more are only counted
+MAX_REPORTED_ERRORS = 100
+
+SCALAR_COLUMNS = ('contract_value', 'time_frame', 'payment_lag', 'contingency_percent', 'cash_floor')
+SECTION_COLUMNS = ('phases', 'delays', 'unexpected_costs', 'billing_milestones')
+# Columns of an exported record; CSV holds the sections as JSON text
+EXPORT_COLUMNS = ('id', 'name', 'start_date') + SCALAR_COLUMNS + ('created_at', 'updated_at') + SECTION_COLUMNS
+
+# Parsed inputs every imported record starts from before its own fields are applied
+EMPTY_INPUTS = {
+    'time_frame': 0, 'payment_lag': 0, 'contract_value': 0.0, 'min_cash_allowed': 0.0, 'contingency_percent': 0.0,
+    'phases': {}, 'delays': {}, 'unexpected_costs': {}, 'billing_milestones': {},
+}
+
+# The columnar format: COLUMNAR_MAGIC, then blocks of up to PROJECT_CHUNK_SIZE projects, then a zero length.
+# Each block is a little-endian uint32 header length, a JSON header giving the row count and byte size of
+# every column, and the column buffers in header order. Numbers are little-endian arrays; strings are a
+# uint32 length per row followed by their UTF-8 bytes. Child rows point at their project by block row.
+COLUMNAR_MAGIC = b'FCOL\x01'
+COLUMNAR_TABLES = {
+    'projects': (('id', 'i8'), ('name', 'str'), ('start_date', 'str'), ('contract_value', 'f8'),
+                 ('time_frame', 'i8'), ('payment_lag', 'i8'), ('contingency_percent', 'f8'), ('cash_floor', 'f8'),
+                 ('created_at', 'str'), ('updated_at', 'str')),
+    'phases': (('project', 'i8'), ('name', 'str'), ('length', 'i8'), ('expense', 'f8'), ('overhead', 'f8'),
+               ('upfront', 'f8')),
+    'delays': (('project', 'i8'), ('start_month', 'i8'), ('length', 'i8'), ('expense', 'f8')),
+    'unexpected_costs': (('project', 'i8'), ('phase_name', 'str'), ('percent', 'f8')),
+    'billing_milestones': (('project', 'i8'), ('month', 'str'), ('percent', 'f8')),
+}
+
+
+def format_for_path(path):
+    """Format named by a file's extension, or None"""
+    extension = os.path.splitext(path)[1].lstrip('.').lower()
+    return {'jsonl': 'jsonl', 'ndjson': 'jsonl', 'csv': 'csv', 'fcol': 'columnar'}.get(extension)
+
+
+def parse_record(record):
+    """Validate one imported record; returns its projects columns and parsed inputs
+
+    Records use the raw input names of /create_project plus name and
+    start_date. Values are converted as parse_inputs converts them;
+    anything that does not convert raises ValueError. An exported id is
+    ignored: imported projects always get new ids, while created_at and
+    updated_at are kept when given.
+    """
+    if not isinstance(record, dict):
+        raise ValueError('Record must be an object')
+    if not record.get('name') or not isinstance(record['name'], str):
+        raise ValueError('name is required')
+    missing = [column for column in SCALAR_COLUMNS if record.get(column) in (None, '')]
+    if missing:
+        raise ValueError(f'Missing fields: {", ".join(missing)}')
+    parsed_inputs = apply_overrides(EMPTY_INPUTS, {
+        column: record[column] for column in SCALAR_COLUMNS + SECTION_COLUMNS if record.get(column) is not None
+    })
+    if not parsed_inputs['phases']:
+        raise ValueError('At least one phase is required')
+    project = {
+        'name': record['name'],
+        'start_date': record.get('start_date') or '',
+        'created_at': record.get('created_at') or None,
+        'updated_at': record.get('updated_at') or None,
+    }
+    return project, parsed_inputs
+
+
+def next_project_id(conn):
+    """First project id past every id used so far, deleted ones included"""
+    largest = conn.execute('SELECT MAX(id) FROM projects').fetchone()[0] or 0
+    sequence = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'projects'").fetchone()
+    return max(largest, sequence[0] if sequence else 0) + 1
+
+
+def insert_batch(conn, batch):
+    """Insert (project id, project, parsed inputs) triples with one executemany per table"""
+    if not batch:
+        return
+    conn.executemany('''
+        INSERT INTO projects (
+            id, name, start_date, contract_value, time_frame, payment_lag,
+            contingency_percent, cash_floor, created_at, updated_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), COALESCE(?, CURRENT_TIMESTAMP))
+    ''', [
+        (project_id, project['name'], project['start_date'], parsed_inputs['contract_value'],
+         parsed_inputs['time_frame'], parsed_inputs['payment_lag'], parsed_inputs['contingency_percent'],
+         parsed_inputs['min_cash_allowed'], project['created_at'], project['updated_at'] or project['created_at'])
+        for project_id, project, parsed_inputs in batch
+    ])
+    children = {table: [] for table in CHILD_INSERTS}
+    for project_id, _, parsed_inputs in batch:
+        for table, rows in project_children_rows(project_id, parsed_inputs).items():
+            children[table].extend(rows)
+    insert_children_rows(conn, children)
+
+
+def write_batches(conn, spool):
+    """Insert the batches pickled in spool in one write transaction; returns how many projects it wrote"""
+    def write():
+        spool.seek(0)
+        written = 0
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Ids are handed out under the write lock, so they stay free until the commit
+            next_id = next_project_id(conn)
+            while True:
+                try:
+                    batch = pickle.load(spool)
+                except EOFError:
+                    break
+                insert_batch(conn, [(next_id + offset, project, parsed_inputs)
+                                    for offset, (project, parsed_inputs) in enumerate(batch)])
+                next_id += len(batch)
+                written += len(batch)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return written
+    return run_with_retry(write)
+
+
+def import_projects(conn, records, skip_invalid=False, batch_size=IMPORT_BATCH_SIZE):
+    """Validate every record, then insert them batch by batch in a single transaction
+
+    records yields record dicts, or ValueErrors for records a reader could
+    not decode. Invalid records are reported by their 1-based number. Valid
+    ones are spooled to a temporary file in batches while the upload is
+    read, and only written once it has been read to the end, so other
+    writers never wait for the upload and an import is either written as a
+    whole or not at all. Unless skip_invalid is set, one invalid record
+    means nothing is written. Returns the import report.
+    """
+    errors = []
+    error_count = 0
+    staged = 0
+    batch = []
+    with tempfile.TemporaryFile() as spool:
+        for number, record in enumerate(records, start=1):
+            try:
+                if isinstance(record, ValueError):
+                    raise record
+                project, parsed_inputs = parse_record(record)
+            except ValueError as e:
+                error_count += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({'record': number, 'message': str(e)})
+                continue
+            # Once the import is bound to be refused, only validate the rest
+            if error_count and not skip_invalid:
+                continue
+            batch.append((project, parsed_inputs))
+            if len(batch) >= batch_size:
+                pickle.dump(batch, spool)
+                staged += len(batch)
+                batch = []
+        if batch:
+            pickle.dump(batch, spool)
+            staged += len(batch)
+
+        committed = not error_count or skip_invalid
+        imported = write_batches(conn, spool) if committed and staged else 0
+    return {'imported': imported, 'committed': committed, 'error_count': error_count, 'errors': errors}
+
+
+def read_jsonl(lines):
+    """Records of a JSON Lines stream; blank lines are skipped"""
+    for line in lines:
+        try:
+            if isinstance(line, bytes):
+                line = line.decode('utf-8')
+            if not line.strip():
+                continue
+            yield json.loads(line)
+        except ValueError as e:
+            yield ValueError(f'Invalid JSON: {e}')
+
+
+def read_csv(text):
+    """Records of a CSV stream with the EXPORT_COLUMNS header; sections are JSON text"""
+    for row in csv.DictReader(text):
+        record = {column: value for column, value in row.items() if column is not None and value != ''}
+        try:
+            for column in SECTION_COLUMNS:
+                if column in record:
+                    record[column] = json.loads(record[column])
+        except ValueError:
+            yield ValueError(f'Invalid JSON in {column}')
+            continue
+        yield record
+
+
+def read_records(stream, format):
+    """Records of a binary stream in one of FORMATS"""
+    if format == 'jsonl':
+        # Buffered, since an unbuffered request stream reads lines a byte at a time
+        return read_jsonl(io.BufferedReader(stream, READ_BUFFER_SIZE))
+    if format == 'csv':
+        return read_csv(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    if format == 'columnar':
+        return read_columnar(stream)
+    raise ValueError(f'Unknown format: {format}')
+
+
+def iter_export_records(conn):
+    """Every project as an export record, oldest first, read one chunk at a time"""
+    cursor = conn.execute('''
+        SELECT id, name, start_date, contract_value, time_frame, payment_lag,
+               contingency_percent, cash_floor, created_at, updated_at
+        FROM projects
+        ORDER BY id
+    ''')
+    for row, parsed_inputs in iter_projects_with_inputs(conn, cursor):
+        yield {
+            'id': row['id'],
+            'name': row['name'],
+            'start_date': row['start_date'] or '',
+            'contract_value': row['contract_value'],
+            'time_frame': row['time_frame'],
+            'payment_lag': row['payment_lag'],
+            'contingency_percent': row['contingency_percent'],
+            'cash_floor': row['cash_floor'],
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at'],
+            'phases': parsed_inputs['phases'],
+            'delays': parsed_inputs['delays'],
+            'unexpected_costs': parsed_inputs['unexpected_costs'],
+            'billing_milestones': parsed_inputs['billing_milestones'],
+        }
+
+
+def write_jsonl(records):
+    for record in records:
+        yield (json.dumps(record) + '\n').encode('utf-8')
+
+
+def write_csv(records, chunk_size=PROJECT_CHUNK_SIZE):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for count, record in enumerate(records, start=1):
+        writer.writerow([
+            json.dumps(record[column]) if column in SECTION_COLUMNS else record[column] for column in EXPORT_COLUMNS
+        ])
+        if count % chunk_size == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def write_records(records, format):
+    """Encode records as a stream of bytes chunks in one of FORMATS"""
+    if format == 'jsonl':
+        return write_jsonl(records)
+    if format == 'csv':
+        return write_csv(records)
+    if format == 'columnar':
+        return write_columnar(records)
+    raise ValueError(f'Unknown format: {format}')
+
+
+def encode_column(values, dtype):
+    if dtype == 'str':
+        encoded = [value.encode('utf-8') for value in values]
+        return np.asarray([len(value) for value in encoded], dtype='<u4').tobytes() + b''.join(encoded)
+    return np.asarray(values, dtype='<' + dtype).tobytes()
+
+
+def decode_column(buffer, dtype, rows):
+    if dtype == 'str':
+        lengths = np.frombuffer(buffer, dtype='<u4', count=rows)
+        ends = np.cumsum(lengths, dtype=np.int64) + 4 * rows
+        starts = ends - lengths
+        return [buffer[start:end].decode('utf-8') for start, end in zip(starts.tolist(), ends.tolist())]
+    return np.frombuffer(buffer, dtype='<' + dtype, count=rows).tolist()
+
+
+def encode_block(records):
+    """One columnar block holding records and their child rows"""
+    tables = {name: {column: [] for column, _ in columns} for name, columns in COLUMNAR_TABLES.items()}
+    for position, record in enumerate(records):
+        projects = tables['projects']
+        for column, _ in COLUMNAR_TABLES['projects']:
+            value = record[column]
+            projects[column].append('' if value is None else value)
+        for name, phase in record['phases'].items():
+            for column, value in (('project', position), ('name', name), ('length', phase['length']),
+                                  ('expense', phase['expense']), ('overhead', phase['overhead']),
+                                  ('upfront', phase['upfront'])):
+                tables['phases'][column].append(value)
+        for month, delay in record['delays'].items():
+            for column, value in (('project', position), ('start_month', int(month)), ('length', delay['length']),
+                                  ('expense', delay['expense'])):
+                tables['delays'][column].append(value)
+        for name, percent in record['unexpected_costs'].items():
+            tables['unexpected_costs']['project'].append(position)
+            tables['unexpected_costs']['phase_name'].append(name)
+            tables['unexpected_costs']['percent'].append(percent)
+        for month, percent in record['billing_milestones'].items():
+            tables['billing_milestones']['project'].append(position)
+            tables['billing_milestones']['month'].append(str(month))
+            tables['billing_milestones']['percent'].append(percent)
+
+    header = {'tables': {}}
+    buffers = []
+    for name, columns in COLUMNAR_TABLES.items():
+        encoded = [encode_column(tables[name][column], dtype) for column, dtype in columns]
+        header['tables'][name] = {
+            'rows': len(tables[name][columns[0][0]]),
+            'columns': [[column, dtype, len(buffer)] for (column, dtype), buffer in zip(columns, encoded)],
+        }
+        buffers.extend(encoded)
+    header = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    return struct.pack('<I', len(header)) + header + b''.join(buffers)
+
+
+def write_columnar(records, block_size=PROJECT_CHUNK_SIZE):
+    yield COLUMNAR_MAGIC
+    block = []
+    for record in records:
+        block.append(record)
+        if len(block) == block_size:
+            yield encode_block(block)
+            block = []
+    if block:
+        yield encode_block(block)
+    yield struct.pack('<I', 0)
+
+
+def read_exact(stream, size):
+    chunks = []
+    while size:
+        chunk = stream.read(size)
+        if not chunk:
+            raise ValueError('Columnar data is truncated')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def read_columnar(stream):
+    """Records of a columnar stream, decoded one block at a time"""
+    if read_exact(stream, len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+        raise ValueError('Not columnar project data')
+    while True:
+        (header_size,) = struct.unpack('<I', read_exact(stream, 4))
+        if not header_size:
+            return
+        try:
+            header = json.loads(read_exact(stream, header_size))
+            tables = {}
+            for name, table in header['tables'].items():
+                tables[name] = {
+                    column: decode_column(read_exact(stream, size), dtype, table['rows'])
+                    for column, dtype, size in table['columns']
+                }
+            projects = tables['projects']
+            records = [
+                dict(zip(projects, values), phases={}, delays={}, unexpected_costs={}, billing_milestones={})
+                for values in zip(*projects.values())
+            ]
+            phases = tables['phases']
+            for position, name, length, expense, overhead, upfront in zip(
+                    phases['project'], phases['name'], phases['length'], phases['expense'],
+                    phases['overhead'], phases['upfront']):
+                records[position]['phases'][name] = {
+                    'length': length, 'expense': expense, 'overhead': overhead, 'upfront': upfront}
+            delays = tables['delays']
+            for position, month, length, expense in zip(
+                    delays['project'], delays['start_month'], delays['length'], delays['expense']):
+                records[position]['delays'][str(month)] = {'length': length, 'expense': expense}
+            costs = tables['unexpected_costs']
+            for position, name, percent in zip(costs['project'], costs['phase_name'], costs['percent']):
+                records[position]['unexpected_costs'][name] = percent
+            milestones = tables['billing_milestones']
+            for position, month, percent in zip(milestones['project'], milestones['month'], milestones['percent']):
+                records[position]['billing_milestones'][month] = percent
+        except (KeyError, IndexError, TypeError, struct.error) as e:
+            raise ValueError(f'Malformed columnar block: {e}')
+        yield from records
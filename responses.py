@@ -0,0 +1,77 @@
+import gzip
+import os
+
+import brotli
+from flask import Response
+
+# Bodies smaller than this are sent as they are; compressing them saves less than the header costs
+MIN_COMPRESS_BYTES = int(os.environ.get('MIN_COMPRESS_BYTES', 1024))
+# Levels for responses compressed per request; static files are compressed once at the highest levels
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# Content codings produced, in order of preference
+SUPPORTED_ENCODINGS = ('br', 'gzip')
+COMPRESSIBLE_TYPES = ('application/json', 'application/javascript', 'text/', 'image/svg+xml')
+
+
+def negotiate_encoding(accept_encodings):
+    """The coding to compress a response with, from the request's Accept-Encoding, or None"""
+    return accept_encodings.best_match(SUPPORTED_ENCODINGS) if accept_encodings else None
+
+
+def compress(data, encoding, static=False):
+    """Compress bytes with gzip or br"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if static else BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=9 if static else GZIP_LEVEL, mtime=0)
+
+
+def is_compressible(mimetype):
+    return bool(mimetype) and mimetype.startswith(COMPRESSIBLE_TYPES)
+
+
+def compress_response(response, accept_encodings):
+    """Compress a buffered response body in the coding the client prefers
+
+    Streamed responses (project listings, exports, job events) and files
+    sent straight from disk are left alone, as are small or already encoded
+    bodies.
+    """
+    if (response.direct_passthrough or response.is_streamed or response.status_code < 200
+            or response.status_code in (204, 206, 304) or 'Content-Encoding' in response.headers
+            or not is_compressible(response.mimetype)):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding(accept_encodings)
+    data = response.get_data()
+    if encoding is None or len(data) < MIN_COMPRESS_BYTES:
+        return response
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    # A strong ETag names the exact bytes, so it must not survive a change of coding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def not_modified(request, etag, cache_control='private, no-cache'):
+    """A 304 response when the request's If-None-Match already holds etag, else None
+
+    Checked before the response is built, so a client that already has the
+    representation costs neither the database reads nor the forecast.
+    """
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = cache_control
+        response.vary.add('Accept-Encoding')
+        return response
+    return None
+
+
+def tag_response(response, etag, cache_control='private, no-cache'):
+    """Mark a response with a weak ETag, to be revalidated with If-None-Match before reuse"""
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = cache_control
+    return response
@@ -0,0 +1,192 @@
+import numpy as np
+
+from batch_forecast import apply_overrides, calculate_forecasts
+from forecast_engine import calculate_forecast_arrays
+from models import ForecastResult
+
+DEFAULT_BUMP = 0.1
+SENSITIVITY_METRICS = ('gross_margin', 'min_net_cash', 'payback_period')
+# Probes evaluated together in each round of a threshold search
+SEARCH_PROBES = 16
+SEARCH_TOLERANCE = 1e-6
+
+
+def sensitivity_inputs(parsed_inputs, bump):
+    """List (name, base value, low override, high override) for every bumped input
+
+    Integer inputs move by at least one month so a small bump still changes them.
+    """
+    def bumped(value, integer):
+        if integer:
+            step = max(1, int(round(abs(value) * bump)))
+            return max(value - step, 0), value + step
+        return value * (1 - bump), value * (1 + bump)
+
+    entries = []
+    for name in ('contract_value', 'contingency_percent'):
+        low, high = bumped(parsed_inputs[name], False)
+        entries.append((name, parsed_inputs[name], {name: low}, {name: high}))
+    low, high = bumped(parsed_inputs['payment_lag'], True)
+    entries.append(('payment_lag', parsed_inputs['payment_lag'], {'payment_lag': low}, {'payment_lag': high}))
+
+    for phase_name, phase in parsed_inputs['phases'].items():
+        low, high = bumped(phase['expense'], False)
+        entries.append((f'phases.{phase_name}.expense', phase['expense'],
+                        {'phases': {phase_name: {'expense': low}}}, {'phases': {phase_name: {'expense': high}}}))
+        low, high = bumped(phase['length'], True)
+        entries.append((f'phases.{phase_name}.length', phase['length'],
+                        {'phases': {phase_name: {'length': low}}}, {'phases': {phase_name: {'length': high}}}))
+
+    milestones = parsed_inputs['billing_milestones']
+    for month, percent in milestones.items():
+        low, high = bumped(percent, False)
+        entries.append((f'billing_milestones.{month}', percent,
+                        {'billing_milestones': {**milestones, month: low}},
+                        {'billing_milestones': {**milestones, month: high}}))
+    return entries
+
+
+def headline(result):
+    """Metrics reported for one forecast"""
+    return {
+        'verdict': result.verdict,
+        'gross_margin': result.gross_margin,
+        'min_net_cash': result.min_net_cash,
+        'payback_period': result.payback_period,
+    }
+
+
+def is_go(result):
+    """Whether a batch result is a forecast with a 'Go' verdict"""
+    return isinstance(result, ForecastResult) and result.verdict == 'Go'
+
+
+def bumped_value(name, variant):
+    """Read a bumped input back out of its variant by its dotted name"""
+    if name.startswith('phases.'):
+        _, phase_name, field = name.split('.', 2)
+        return variant['phases'][phase_name][field]
+    if name.startswith('billing_milestones.'):
+        return variant['billing_milestones'][name.split('.', 1)[1]]
+    return variant[name]
+
+
+def calculate_sensitivity(parsed_inputs, bump=DEFAULT_BUMP, sort_by='min_net_cash'):
+    """Tornado analysis: how each metric moves when each input is bumped by +/- bump
+
+    The base and every bumped variant are forecast in one batch. Inputs are
+    sorted by the swing of sort_by, largest first.
+    """
+    entries = sensitivity_inputs(parsed_inputs, bump)
+    variants = [parsed_inputs]
+    for _, _, low, high in entries:
+        variants.append(apply_overrides(parsed_inputs, low))
+        variants.append(apply_overrides(parsed_inputs, high))
+    results = calculate_forecasts(variants)
+
+    base = headline(results[0])
+    rows = []
+    for position, (name, base_value, _, _) in enumerate(entries):
+        low = headline(results[1 + 2 * position])
+        high = headline(results[2 + 2 * position])
+        rows.append({
+            'input': name,
+            'base_value': base_value,
+            'low_value': bumped_value(name, variants[1 + 2 * position]),
+            'high_value': bumped_value(name, variants[2 + 2 * position]),
+            'low': low,
+            'high': high,
+            'swing': {metric: abs(high[metric] - low[metric]) for metric in SENSITIVITY_METRICS},
+        })
+    rows.sort(key=lambda row: row['swing'][sort_by], reverse=True)
+    return {'bump': bump, 'base': base, 'inputs': rows}
+
+
+def search_threshold(holds, low, high, integer=False, tolerance=SEARCH_TOLERANCE):
+    """Largest value in [low, high] for which holds() is true
+
+    holds takes a list of values and returns one bool per value, so every
+    round of the search is a single batch evaluation. Each round probes
+    SEARCH_PROBES evenly spaced points and keeps the interval where the
+    predicate first fails, assuming it holds up to a threshold and then stops.
+    Returns None when it does not hold at low.
+    """
+    low_holds, high_holds = holds([low, high])
+    if not low_holds:
+        return None
+    if high_holds:
+        return high
+
+    while (high - low > 1) if integer else (high - low > tolerance * max(1.0, abs(high))):
+        if integer:
+            points = sorted(set(np.linspace(low, high, SEARCH_PROBES + 2)[1:-1].round().astype(int).tolist()) - {low, high})
+        else:
+            points = np.linspace(low, high, SEARCH_PROBES + 2)[1:-1].tolist()
+        if not points:
+            break
+        for point, point_holds in zip(points, holds(points)):
+            if point_holds:
+                low = point
+            else:
+                high = point
+                break
+    return low
+
+
+def min_contract_value_for_go(parsed_inputs):
+    """Smallest contract value that gives a 'Go' verdict, or None if none does
+
+    Only cash in depends on the contract value, so one evaluation of the
+    timeline at a unit contract value gives cumulative net cash as
+    contract_value * billed_fraction - costs for every month, and the bound
+    can be solved directly instead of probing.
+    """
+    unit = calculate_forecast_arrays(dict(parsed_inputs, contract_value=1.0))
+    billed = np.cumsum(unit['cash_in'])
+    costs = billed - unit['cumulative_net_cash']
+    floor = parsed_inputs['min_cash_allowed']
+
+    # Months with nothing billed yet cannot be rescued by a larger contract
+    if (-costs[billed <= 0] < floor).any():
+        return None
+    bounds = (costs[billed > 0] + floor) / billed[billed > 0]
+    candidate = max([unit['cumulative_cash_out'], 0.0] + bounds.tolist())
+
+    # Rounding can leave the candidate a hair short of the boundary
+    step = max(candidate * 1e-12, 1e-9)
+    for _ in range(64):
+        if calculate_forecast_arrays(dict(parsed_inputs, contract_value=candidate))['verdict'] == 'Go':
+            return candidate
+        candidate += step
+        step *= 2
+    return None
+
+
+def calculate_break_even(parsed_inputs, delay_month=1, delay_expense=0.0, max_delay=None):
+    """Break-even thresholds for a project
+
+    - min_contract_value_for_go: smallest contract value with a 'Go' verdict
+    - max_tolerable_delay: longest delay starting at delay_month that keeps a 'Go' verdict
+    - max_contingency_percent_for_go: highest contingency percent that keeps a 'Go' verdict
+    """
+    max_delay = parsed_inputs['time_frame'] if max_delay is None else max_delay
+    delays = {str(month): delay for month, delay in parsed_inputs['delays'].items()}
+
+    def delay_holds(lengths):
+        variants = [
+            apply_overrides(parsed_inputs, {'delays': {**delays, str(delay_month): {'length': length, 'expense': delay_expense}}})
+            if length > 0 else parsed_inputs
+            for length in lengths
+        ]
+        return [is_go(result) for result in calculate_forecasts(variants)]
+
+    def contingency_holds(percents):
+        variants = [dict(parsed_inputs, contingency_percent=float(percent)) for percent in percents]
+        return [is_go(result) for result in calculate_forecasts(variants)]
+
+    return {
+        'min_contract_value_for_go': min_contract_value_for_go(parsed_inputs),
+        'max_tolerable_delay': search_threshold(delay_holds, 0, max_delay, integer=True),
+        'delay_month': delay_month,
+        'max_contingency_percent_for_go': search_threshold(contingency_holds, 0.0, 1.0),
+    }
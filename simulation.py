@@ -0,0 +1,220 @@
+import numpy as np
+
+from forecast_engine import BATCH_VERDICTS, calculate_forecast_batch
+from process_pool import pool_workers, submit
+
+# Draws are generated and evaluated in fixed-size chunks. Each chunk gets its
+# own seed from the run's SeedSequence, so results only depend on the seed and
+# the number of draws, never on how many workers evaluated them.
+SIMULATION_CHUNK_SIZE = 2000
+MAX_SIMULATION_DRAWS = 100000
+DEFAULT_SIMULATION_DRAWS = 10000
+# Below this many draws the process pool start-up costs more than it saves
+PARALLEL_DRAWS_THRESHOLD = 20000
+DEFAULT_PERCENTILES = (10, 50, 90)
+# Parameters each distribution needs; fixed falls back to the input's own value
+DISTRIBUTION_PARAMETERS = {
+    'fixed': (),
+    'uniform': ('low', 'high'),
+    'normal': ('mean', 'std'),
+    'triangular': ('low', 'mode', 'high'),
+    'lognormal': ('mean', 'sigma'),
+}
+# Inputs /simulate can vary, each given a distribution spec
+SAMPLED_INPUTS = ('phase_length', 'phase_expense', 'unexpected_costs', 'payment_lag', 'delay_length', 'delay_expense')
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def validate_distributions(distributions):
+    """Check the distributions of a simulation, raising ValueError naming the first bad one
+
+    Unknown inputs, unknown distributions and missing or non-numeric
+    parameters are all refused, so a misspelt spec never silently leaves an
+    input fixed.
+    """
+    if not isinstance(distributions, dict):
+        raise ValueError('distributions must be an object')
+    for name, spec in distributions.items():
+        if name == 'delay_probability':
+            if not is_number(spec) or not 0 <= spec <= 1:
+                raise ValueError('delay_probability must be a number between 0 and 1')
+            continue
+        if name not in SAMPLED_INPUTS:
+            raise ValueError(f'Unknown distribution input: {name}')
+        if spec is None or is_number(spec):
+            continue
+        if not isinstance(spec, dict):
+            raise ValueError(f'{name} must be a number or a distribution object')
+        distribution = spec.get('distribution', 'fixed')
+        if distribution not in DISTRIBUTION_PARAMETERS:
+            raise ValueError(f'Unknown distribution: {distribution}')
+        parameters = DISTRIBUTION_PARAMETERS[distribution] + (('value',) if 'value' in spec else ())
+        for parameter in parameters:
+            if not is_number(spec.get(parameter)):
+                raise ValueError(f'{name}: {distribution} needs a numeric {parameter}')
+
+
+def sample_distribution(rng, spec, size, default):
+    """Draw samples from a distribution spec
+
+    A spec is either a plain number (always that value) or a dict such as
+    {'distribution': 'triangular', 'low': 0.9, 'mode': 1.0, 'high': 1.5}.
+    Supported distributions are fixed, uniform, normal, triangular and lognormal.
+    """
+    if spec is None:
+        return np.full(size, default, dtype=float)
+    if isinstance(spec, (int, float)):
+        return np.full(size, float(spec))
+
+    distribution = spec.get('distribution', 'fixed')
+    if distribution == 'fixed':
+        return np.full(size, float(spec.get('value', default)))
+    if distribution == 'uniform':
+        return rng.uniform(float(spec['low']), float(spec['high']), size)
+    if distribution == 'normal':
+        return rng.normal(float(spec['mean']), float(spec['std']), size)
+    if distribution == 'triangular':
+        return rng.triangular(float(spec['low']), float(spec['mode']), float(spec['high']), size)
+    if distribution == 'lognormal':
+        return rng.lognormal(float(spec['mean']), float(spec['sigma']), size)
+    raise ValueError(f'Unknown distribution: {distribution}')
+
+
+def sample_draws(parsed_inputs, distributions, rng, draws):
+    """Sample the per-draw engine arguments for one chunk of draws
+
+    phase_length and phase_expense are multipliers on each phase's own value,
+    unexpected_costs is the unexpected cost percentage for every phase and
+    payment_lag is in months. Each draw may also get one extra delay, with
+    probability delay_probability, starting in a random month of the time frame.
+    """
+    phases = parsed_inputs['phases']
+    phase_list = list(phases.keys())
+    shape = (draws, len(phase_list))
+
+    base_lengths = np.array([phases[name]['length'] for name in phase_list])
+    base_expenses = np.array([phases[name]['expense'] for name in phase_list])
+    phase_lengths = np.rint(base_lengths * sample_distribution(rng, distributions.get('phase_length'), shape, 1.0))
+    phase_lengths = np.maximum(phase_lengths, 0).astype(np.int64)
+    phase_expenses = base_expenses * sample_distribution(rng, distributions.get('phase_expense'), shape, 1.0)
+
+    if distributions.get('unexpected_costs') is None:
+        unexpected_rates = np.tile([parsed_inputs['unexpected_costs'].get(name, 0.0) for name in phase_list], (draws, 1))
+    else:
+        unexpected_rates = np.maximum(sample_distribution(rng, distributions['unexpected_costs'], shape, 0.0), 0.0)
+
+    payment_lags = sample_distribution(rng, distributions.get('payment_lag'), draws, parsed_inputs['payment_lag'])
+    payment_lags = np.maximum(np.rint(payment_lags), 0).astype(np.int64)
+
+    # Fixed delays from the inputs, plus one column for the sampled delay
+    delays = parsed_inputs['delays']
+    fixed_starts = np.array(list(delays.keys()), dtype=np.int64)
+    fixed_lengths = np.array([delay['length'] for delay in delays.values()], dtype=np.int64)
+    fixed_expenses = np.array([delay['expense'] for delay in delays.values()], dtype=float)
+
+    delay_probability = float(distributions.get('delay_probability', 0.0))
+    has_delay = rng.random(draws) < delay_probability
+    time_frame = max(parsed_inputs['time_frame'], 1)
+    sampled_starts = np.where(has_delay, rng.integers(1, time_frame + 1, draws), 0)
+    sampled_lengths = np.rint(sample_distribution(rng, distributions.get('delay_length'), draws, 1.0))
+    sampled_lengths = np.where(has_delay, np.maximum(sampled_lengths, 1), 0).astype(np.int64)
+    sampled_expenses = np.where(has_delay, sample_distribution(rng, distributions.get('delay_expense'), draws, 0.0), 0.0)
+
+    # A sampled delay replaces a fixed delay that starts in the same month, as a dict key would
+    replaced = fixed_starts[None, :] == sampled_starts[:, None]
+    delay_starts = np.concatenate((np.where(replaced, 0, fixed_starts[None, :]), sampled_starts[:, None]), axis=1)
+    delay_lengths = np.concatenate((np.where(replaced, 0, fixed_lengths[None, :]), sampled_lengths[:, None]), axis=1)
+    delay_expenses = np.concatenate((np.where(replaced, 0.0, fixed_expenses[None, :]), sampled_expenses[:, None]), axis=1)
+
+    return phase_lengths, phase_expenses, unexpected_rates, payment_lags, delay_starts, delay_lengths, delay_expenses
+
+
+def run_simulation_chunk(parsed_inputs, distributions, seed_sequence, draws):
+    """Sample and evaluate one chunk of draws"""
+    rng = np.random.default_rng(seed_sequence)
+    result = calculate_forecast_batch(parsed_inputs, *sample_draws(parsed_inputs, distributions, rng, draws))
+    return (
+        result['cumulative_net_cash'].astype(np.float32),
+        result['verdict'],
+        result['payback_period'].astype(np.int32),
+    )
+
+
+def run_simulation(parsed_inputs, distributions, draws=DEFAULT_SIMULATION_DRAWS, seed=None,
+                   percentiles=DEFAULT_PERCENTILES, workers=None, progress=None):
+    """Run a seeded Monte Carlo simulation of a project's forecast
+
+    Returns percentile bands of cumulative net cash per month, the probability
+    of each verdict and the payback period distribution. progress, when
+    given, is called with (draws done, draws) after each chunk. Large runs
+    are spread over the shared process pool; workers can only lower the
+    number of processes used.
+    """
+    validate_distributions(distributions)
+    if seed is None:
+        seed = int(np.random.SeedSequence().entropy % (2 ** 32))
+    chunk_sizes = [SIMULATION_CHUNK_SIZE] * (draws // SIMULATION_CHUNK_SIZE)
+    if draws % SIMULATION_CHUNK_SIZE:
+        chunk_sizes.append(draws % SIMULATION_CHUNK_SIZE)
+    seed_sequences = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+    tasks = [(parsed_inputs, distributions, seed_sequence, size) for seed_sequence, size in zip(seed_sequences, chunk_sizes)]
+
+    workers = pool_workers(workers)
+    if workers > 1 and len(tasks) > 1 and draws >= PARALLEL_DRAWS_THRESHOLD:
+        # At most workers chunks are queued at a time, so a run never holds more than its share of the pool
+        chunks = []
+        futures = []
+        try:
+            for task in tasks:
+                futures.append(submit(run_simulation_chunk, *task))
+                if len(futures) - len(chunks) >= workers:
+                    chunks.append(futures[len(chunks)].result())
+                    if progress:
+                        progress(sum(chunk_sizes[:len(chunks)]), draws)
+            while len(chunks) < len(futures):
+                chunks.append(futures[len(chunks)].result())
+                if progress:
+                    progress(sum(chunk_sizes[:len(chunks)]), draws)
+        except BaseException:
+            # Do not leave the remaining chunks queued when progress raised to stop the run
+            for future in futures:
+                future.cancel()
+            raise
+    else:
+        chunks = []
+        for task in tasks:
+            chunks.append(run_simulation_chunk(*task))
+            if progress:
+                progress(sum(chunk_sizes[:len(chunks)]), draws)
+
+    # Chunks can have different horizons; carry each draw's final value forward to the longest one
+    months = max(chunk[0].shape[1] for chunk in chunks)
+    cumulative_net_cash = np.concatenate([
+        np.pad(chunk[0], ((0, 0), (0, months - chunk[0].shape[1])), mode='edge') for chunk in chunks
+    ])
+    verdicts = np.concatenate([chunk[1] for chunk in chunks])
+    payback_periods = np.concatenate([chunk[2] for chunk in chunks])
+
+    bands = np.percentile(cumulative_net_cash, percentiles, axis=0)
+    payback_months, payback_counts = np.unique(payback_periods[payback_periods != 999], return_counts=True)
+    verdict_counts = np.bincount(verdicts, minlength=len(BATCH_VERDICTS))
+
+    return {
+        'draws': draws,
+        'seed': seed,
+        'months': months,
+        'cumulative_net_cash': {
+            f'p{percentile:g}': band.tolist() for percentile, band in zip(percentiles, bands)
+        },
+        'verdicts': {
+            verdict: float(count) / draws for verdict, count in zip(BATCH_VERDICTS, verdict_counts)
+        },
+        'payback_period': {
+            **{f'p{percentile:g}': float(value) for percentile, value in zip(percentiles, np.percentile(payback_periods, percentiles))},
+            'never': float(np.count_nonzero(payback_periods == 999)) / draws,
+            'distribution': {str(month): float(count) / draws for month, count in zip(payback_months.tolist(), payback_counts)},
+        },
+    }
@@ -1,5 +1,12 @@
 let cashFlowChart = null;
 let currentFormData = null; // Store form data for saving projects
+let currentForecastKey = null; // Key of the forecast on screen, for /update_forecast
+let currentForecastInputs = null; // Inputs that forecast was made from
+let updateTimer = null;
+// Edits made after a forecast is shown are re-forecast once typing pauses this long
+const UPDATE_DEBOUNCE_MS = 250;
+// Inputs that do not change the forecast and are never sent as changes
+const DISPLAY_ONLY_FIELDS = ['start_date'];
 
 // Initialize milestones
 document.addEventListener('DOMContentLoaded', function() {
@@ -32,6 +39,7 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Form submission
     document.getElementById('forecastForm').addEventListener('submit', handleFormSubmit);
+    document.getElementById('forecastForm').addEventListener('input', scheduleForecastUpdate);
     
     // Toggle form minimize/expand
     const toggleFormBtn = document.getElementById('toggleFormBtn');
@@ -103,15 +111,31 @@ function switchView(viewName) {
     }
 }
 
-function loadProjects() {
+// Projects loaded so far and the cursor of the next page, if any
+let loadedProjects = [];
+let nextProjectsCursor = null;
+const PROJECTS_PAGE_SIZE = 100;
+const PROJECT_LIST_FIELDS = 'id,name,start_date,contract_value,time_frame,payment_lag,contingency_percent,cash_floor,created_at';
+
+function loadProjects(cursor = null) {
     const container = document.getElementById('projectsTableContainer');
-    container.innerHTML = '<div class="loading">Loading projects...</div>';
+    if (!cursor) {
+        loadedProjects = [];
+        container.innerHTML = '<div class="loading">Loading projects...</div>';
+    }
     
-    fetch('/get_projects')
+    const params = new URLSearchParams({ limit: PROJECTS_PAGE_SIZE, fields: PROJECT_LIST_FIELDS });
+    if (cursor) {
+        params.set('cursor', cursor);
+    }
+    
+    fetch(`/get_projects?${params.toString()}`)
         .then(response => response.json())
         .then(data => {
             if (data.success) {
-                displayProjects(data.projects);
+                loadedProjects = loadedProjects.concat(data.projects);
+                nextProjectsCursor = data.next_cursor;
+                displayProjects(loadedProjects);
             } else {
                 container.innerHTML = `<div class="error">Error loading projects: ${data.message || 'Unknown error'}</div>`;
             }
@@ -166,22 +190,16 @@ function loadProjectAndGenerateForecast(projectId) {
                 
                 // Store form data globally for saving projects
                 currentFormData = formData;
+                // The form does not hold this project, so form edits must not update its forecast
+                currentForecastKey = null;
+                currentForecastInputs = null;
                 
-                // Generate forecast
-                fetch('/generate_forecast', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                    },
-                    body: JSON.stringify({
-                        inputs: formData,
-                        scenario: formData.scenario
-                    })
-                })
+                // Forecast the saved project; a GET, so the browser revalidates its copy by ETag
+                fetch(`/project_forecast/${projectId}?format=columnar`)
                 .then(response => response.json())
                 .then(forecastData => {
                     if (forecastData.success) {
-                        displayResults(forecastData.forecast);
+                        displayResults(forecastFromColumns(forecastData.forecast));
                     } else {
                         showError(forecastData.message || 'An error occurred while generating forecast');
                     }
@@ -247,8 +265,21 @@ function displayProjects(projects) {
         </table>
     `;
     
+    if (nextProjectsCursor) {
+        html += '<button type="button" class="btn-secondary" id="loadMoreProjectsBtn">Load more</button>';
+    }
+    
     container.innerHTML = html;
     
+    const loadMoreBtn = document.getElementById('loadMoreProjectsBtn');
+    if (loadMoreBtn) {
+        loadMoreBtn.addEventListener('click', function() {
+            this.disabled = true;
+            this.textContent = 'Loading...';
+            loadProjects(nextProjectsCursor);
+        });
+    }
+    
     // Add click handlers to project rows
     const projectRows = container.querySelectorAll('.project-row');
     projectRows.forEach(row => {
@@ -394,9 +425,7 @@ function addPhaseRow() {
     });
 }
 
-function handleFormSubmit(e) {
-    e.preventDefault();
-    
+function collectFormData() {
     // Collect form data
     let formData = {
         start_date: document.getElementById('start_date').value,
@@ -418,11 +447,6 @@ function handleFormSubmit(e) {
         }
     });
     
-    if (Object.keys(milestones).length === 0) {
-        alert('Please add at least one billing milestone');
-        return;
-    }
-    
     formData.billing_milestones = milestones;
     console.log(formData.billing_milestones);
 
@@ -443,10 +467,6 @@ function handleFormSubmit(e) {
         };
     });
 
-    if (Object.keys(phases).length === 0) {
-        alert('Please add at least one phase');
-        return;
-    }
     formData.phases = phases;
 
     // Collect delay data
@@ -478,6 +498,22 @@ function handleFormSubmit(e) {
         formData.unexpected_costs = unexpectedCosts;
         console.log('Unexpected costs added');
     }
+    return formData;
+}
+
+function handleFormSubmit(e) {
+    e.preventDefault();
+    clearTimeout(updateTimer);
+
+    const formData = collectFormData();
+    if (Object.keys(formData.billing_milestones).length === 0) {
+        alert('Please add at least one billing milestone');
+        return;
+    }
+    if (Object.keys(formData.phases).length === 0) {
+        alert('Please add at least one phase');
+        return;
+    }
     
     // Store form data globally for saving projects
     currentFormData = formData;
@@ -506,13 +542,97 @@ function handleFormSubmit(e) {
         },
         body: JSON.stringify({
             inputs: formData,
-            scenario: formData.scenario
+            scenario: formData.scenario,
+            format: 'columnar'
+        })
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            currentForecastKey = data.forecast_key;
+            currentForecastInputs = formData;
+            displayResults(forecastFromColumns(data.forecast));
+        } else {
+            showError(data.message || 'An error occurred');
+        }
+    })
+    .catch(error => {
+        showError('Network error: ' + error.message);
+    });
+}
+
+function scheduleForecastUpdate() {
+    // Only edits to a forecast already on screen are applied as they are typed
+    if (!currentForecastKey) {
+        return;
+    }
+    clearTimeout(updateTimer);
+    updateTimer = setTimeout(updateForecast, UPDATE_DEBOUNCE_MS);
+}
+
+function changedInputs(previous, next) {
+    // Sections that differ, in the override format of /update_forecast; a section is sent whole, and a removed one empty
+    const changes = {};
+    new Set([...Object.keys(previous), ...Object.keys(next)]).forEach(name => {
+        if (!DISPLAY_ONLY_FIELDS.includes(name) && JSON.stringify(previous[name]) !== JSON.stringify(next[name])) {
+            changes[name] = next[name] === undefined ? {} : next[name];
+        }
+    });
+    return changes;
+}
+
+function updateForecast() {
+    const formData = collectFormData();
+    if (Object.keys(formData.billing_milestones).length === 0 || Object.keys(formData.phases).length === 0) {
+        return;
+    }
+    if (Object.keys(changedInputs(currentFormData, formData)).length === 0) {
+        return;
+    }
+    currentFormData = formData;
+
+    // Only the sections changed since the forecast on screen are sent; the server resumes
+    // that cached forecast from the first changed month
+    const changes = changedInputs(currentForecastInputs, formData);
+    fetch('/update_forecast', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({
+            forecast_key: currentForecastKey,
+            changes: changes,
+            // Lets a worker that does not hold the base forecast rebuild it instead of answering 404
+            base_inputs: currentForecastInputs,
+            format: 'columnar'
         })
     })
+    .then(response => {
+        if (response.status === 404) {
+            // The base forecast left the server's cache; send the full inputs instead
+            return fetch('/generate_forecast', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({
+                    inputs: formData,
+                    format: 'columnar'
+                })
+            });
+        }
+        return response;
+    })
     .then(response => response.json())
     .then(data => {
+        // A newer edit has been sent since, so this answer is stale
+        if (currentFormData !== formData) {
+            return;
+        }
         if (data.success) {
-            displayResults(data.forecast);
+            currentForecastKey = data.forecast_key;
+            currentForecastInputs = formData;
+            displayResults(forecastFromColumns(data.forecast));
         } else {
             showError(data.message || 'An error occurred');
         }
@@ -522,6 +642,19 @@ function handleFormSubmit(e) {
     });
 }
 
+function forecastFromColumns(forecast) {
+    // Columnar responses hold each monthly figure as one array; the chart and table take a row per month
+    const columns = forecast.columns;
+    const rows = columns.cash_in.map((cashIn, month) => ({
+        cash_in: cashIn,
+        cash_out: columns.cash_out[month],
+        net_cash: columns.net_cash[month],
+        cumulative_net_cash: columns.cumulative_net_cash[month],
+        phase: columns.phase_index[month] >= 0 ? forecast.phases[columns.phase_index[month]] : null
+    }));
+    return { ...forecast, forecast: rows };
+}
+
 function displayResults(forecast) {
     const resultsSection = document.getElementById('resultsSection');
     
@@ -0,0 +1,528 @@
+import base64
+import json
+import string
+from itertools import groupby
+
+from forecast_engine import expand_delays, expand_phases
+
+# Chunk size used when streaming projects together with their child rows
+PROJECT_CHUNK_SIZE = 200
+
+# Columns /get_projects can return, selected with its fields= projection
+PROJECT_LIST_FIELDS = (
+    'id', 'name', 'start_date', 'contract_value', 'time_frame', 'payment_lag',
+    'contingency_percent', 'cash_floor', 'created_at', 'updated_at'
+)
+
+# COLLATE NOCASE folds ASCII letters, and only those, to lower case
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def migration_create_projects(conn):
+    """Version 1: the original projects table"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS projects (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            start_date TEXT,
+            contract_value REAL NOT NULL,
+            time_frame INTEGER NOT NULL,
+            payment_lag INTEGER NOT NULL,
+            contingency_percent REAL NOT NULL,
+            cash_floor REAL NOT NULL,
+            phases TEXT NOT NULL,
+            delays TEXT NOT NULL,
+            unexpected_costs TEXT NOT NULL,
+            billing_milestones TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def migration_add_start_date(conn):
+    """Version 2: start_date column, missing from the earliest databases"""
+    columns = [column[1] for column in conn.execute('PRAGMA table_info(projects)')]
+    if 'start_date' not in columns:
+        conn.execute('ALTER TABLE projects ADD COLUMN start_date TEXT')
+
+
+def migration_normalize_projects(conn):
+    """Version 3: move the JSON columns into indexed child tables"""
+    conn.execute('''
+        CREATE TABLE project_phases (
+            project_id INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            length INTEGER NOT NULL,
+            expense REAL NOT NULL,
+            overhead REAL NOT NULL,
+            upfront REAL NOT NULL,
+            PRIMARY KEY (project_id, position)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE project_delays (
+            project_id INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+            start_month INTEGER NOT NULL,
+            length INTEGER NOT NULL,
+            expense REAL NOT NULL,
+            phase_name TEXT,
+            PRIMARY KEY (project_id, start_month)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE project_milestones (
+            project_id INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+            month TEXT NOT NULL,
+            percent REAL NOT NULL,
+            PRIMARY KEY (project_id, month)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE project_unexpected_costs (
+            project_id INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+            phase_name TEXT NOT NULL,
+            percent REAL NOT NULL,
+            PRIMARY KEY (project_id, phase_name)
+        ) WITHOUT ROWID
+    ''')
+
+    # Copy the JSON blobs of existing projects into the child tables
+    for project in conn.execute('''
+        SELECT id, time_frame, payment_lag, phases, delays, unexpected_costs, billing_milestones
+        FROM projects
+    ''').fetchall():
+        insert_project_children(conn, project[0], {
+            'time_frame': project[1],
+            'payment_lag': project[2],
+            'phases': json.loads(project[3]),
+            'delays': {int(key): value for key, value in json.loads(project[4]).items()},
+            'unexpected_costs': json.loads(project[5]),
+            'billing_milestones': json.loads(project[6]),
+        })
+
+    # SQLite cannot drop several columns in place on older versions, so rebuild the table
+    conn.execute('''
+        CREATE TABLE projects_normalized (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            start_date TEXT,
+            contract_value REAL NOT NULL,
+            time_frame INTEGER NOT NULL,
+            payment_lag INTEGER NOT NULL,
+            contingency_percent REAL NOT NULL,
+            cash_floor REAL NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO projects_normalized (
+            id, name, start_date, contract_value, time_frame, payment_lag,
+            contingency_percent, cash_floor, created_at, updated_at
+        )
+        SELECT id, name, start_date, contract_value, time_frame, payment_lag,
+               contingency_percent, cash_floor, created_at, updated_at
+        FROM projects
+    ''')
+    conn.execute('DROP TABLE projects')
+    conn.execute('ALTER TABLE projects_normalized RENAME TO projects')
+
+    conn.execute('CREATE INDEX idx_projects_created_at ON projects(created_at)')
+    conn.execute('CREATE INDEX idx_projects_name ON projects(name)')
+    conn.execute('CREATE INDEX idx_projects_start_date ON projects(start_date)')
+    conn.execute('CREATE INDEX idx_project_phases_name ON project_phases(name)')
+    conn.execute('CREATE INDEX idx_project_delays_phase_length ON project_delays(phase_name, length)')
+    conn.execute('CREATE INDEX idx_project_delays_length ON project_delays(length)')
+
+
+def migration_add_listing_indexes(conn):
+    """Version 4: indexes for keyset pagination and contract value filters"""
+    # (created_at, id) is the listing sort key, so the old single-column index is redundant
+    conn.execute('DROP INDEX IF EXISTS idx_projects_created_at')
+    conn.execute('CREATE INDEX idx_projects_created_at_id ON projects(created_at, id)')
+    conn.execute('CREATE INDEX idx_projects_contract_value ON projects(contract_value)')
+
+
+def migration_create_jobs(conn):
+    """Version 5: the queue and results of background jobs, see jobs.py"""
+    conn.execute('''
+        CREATE TABLE jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            status TEXT NOT NULL,
+            params TEXT NOT NULL,
+            progress REAL NOT NULL DEFAULT 0,
+            message TEXT,
+            result TEXT,
+            error TEXT,
+            cancel_requested INTEGER NOT NULL DEFAULT 0,
+            worker TEXT,
+            created_at TIMESTAMP NOT NULL,
+            started_at TIMESTAMP,
+            heartbeat_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+    conn.execute('CREATE INDEX idx_jobs_status_created_at ON jobs(status, created_at)')
+
+
+def migration_create_scenarios(conn):
+    """Version 6: named scenarios of a project, stored as overrides of its inputs"""
+    conn.execute('''
+        CREATE TABLE scenarios (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            project_id INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+            name TEXT NOT NULL,
+            overrides TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (project_id, name)
+        )
+    ''')
+
+
+def migration_add_name_nocase_index(conn):
+    """Version 7: case-insensitive index for name prefix filters"""
+    # Prefix filters compare with NOCASE, which the BINARY index cannot serve
+    conn.execute('DROP INDEX IF EXISTS idx_projects_name')
+    conn.execute('CREATE INDEX idx_projects_name_nocase ON projects(name COLLATE NOCASE)')
+
+
+# Applied in order; PRAGMA user_version records how many have run
+MIGRATIONS = [
+    migration_create_projects,
+    migration_add_start_date,
+    migration_normalize_projects,
+    migration_add_listing_indexes,
+    migration_create_jobs,
+    migration_create_scenarios,
+    migration_add_name_nocase_index,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def migrate(conn):
+    """Bring a database up to SCHEMA_VERSION, one transaction per migration"""
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
+    isolation_level = conn.isolation_level
+    foreign_keys = conn.execute('PRAGMA foreign_keys').fetchone()[0]
+    # Manage the transactions explicitly so schema changes and data copies commit together.
+    # Foreign keys are off while tables are rebuilt, or dropping projects would cascade to the children.
+    conn.isolation_level = None
+    conn.execute('PRAGMA foreign_keys = OFF')
+    try:
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                migration(conn)
+                conn.execute(f'PRAGMA user_version = {number}')
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+    finally:
+        conn.execute(f'PRAGMA foreign_keys = {"ON" if foreign_keys else "OFF"}')
+        conn.isolation_level = isolation_level
+
+
+def delay_phases(parsed_inputs):
+    """Name of the phase each delay starts in, or None past the forecast"""
+    phases = parsed_inputs['phases']
+    delays = parsed_inputs['delays']
+    horizon = parsed_inputs['time_frame'] + parsed_inputs['payment_lag'] + sum(
+        int(delay['length']) for delay in delays.values()
+    )
+    if not phases or horizon <= 0:
+        return {month: None for month in delays}
+    phase_list = list(phases.keys())
+    in_delay, _, _ = expand_delays(delays, horizon)
+    phase_index, _ = expand_phases(phases, in_delay, horizon)
+    return {
+        month: phase_list[phase_index[month]] if 1 <= month <= horizon and phase_index[month] >= 0 else None
+        for month in delays
+    }
+
+
+def project_children_rows(project_id, parsed_inputs):
+    """Rows of the four child tables for one project, keyed by table"""
+    phase_names = delay_phases(parsed_inputs)
+    return {
+        'project_phases': [
+            (project_id, position, name, int(phase.get('length', 0)), float(phase.get('expense', 0)),
+             float(phase.get('overhead', 0)), float(phase.get('upfront', 0)))
+            for position, (name, phase) in enumerate(parsed_inputs['phases'].items())
+        ],
+        'project_delays': [
+            (project_id, int(month), int(delay.get('length', 0)), float(delay.get('expense', 0)), phase_names[month])
+            for month, delay in parsed_inputs['delays'].items()
+        ],
+        'project_milestones': [
+            (project_id, str(month), float(percent)) for month, percent in parsed_inputs['billing_milestones'].items()
+        ],
+        'project_unexpected_costs': [
+            (project_id, str(name), float(percent)) for name, percent in parsed_inputs['unexpected_costs'].items()
+        ],
+    }
+
+
+# INSERT statement of each child table, for the rows built by project_children_rows
+CHILD_INSERTS = {
+    'project_phases': '''
+        INSERT INTO project_phases (project_id, position, name, length, expense, overhead, upfront)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''',
+    'project_delays': '''
+        INSERT INTO project_delays (project_id, start_month, length, expense, phase_name)
+        VALUES (?, ?, ?, ?, ?)
+    ''',
+    'project_milestones': 'INSERT INTO project_milestones (project_id, month, percent) VALUES (?, ?, ?)',
+    'project_unexpected_costs': 'INSERT INTO project_unexpected_costs (project_id, phase_name, percent) VALUES (?, ?, ?)',
+}
+
+
+def insert_children_rows(conn, rows):
+    """Write child rows of any number of projects, one executemany per table"""
+    for table, statement in CHILD_INSERTS.items():
+        if rows[table]:
+            conn.executemany(statement, rows[table])
+
+
+def insert_project_children(conn, project_id, parsed_inputs):
+    """Write the phases, delays, milestones and unexpected costs of a project"""
+    insert_children_rows(conn, project_children_rows(project_id, parsed_inputs))
+
+
+def load_project_children(conn, project_ids):
+    """Load the child rows of several projects, keyed by project id"""
+    children = {
+        project_id: {'phases': {}, 'delays': {}, 'unexpected_costs': {}, 'billing_milestones': {}}
+        for project_id in project_ids
+    }
+    if not project_ids:
+        return children
+    placeholders = ', '.join('?' for _ in project_ids)
+    params = list(project_ids)
+
+    for row in conn.execute(f'''
+        SELECT project_id, name, length, expense, overhead, upfront FROM project_phases
+        WHERE project_id IN ({placeholders}) ORDER BY project_id, position
+    ''', params):
+        children[row[0]]['phases'][row[1]] = {
+            'length': row[2], 'expense': row[3], 'overhead': row[4], 'upfront': row[5]
+        }
+    for row in conn.execute(f'''
+        SELECT project_id, start_month, length, expense FROM project_delays
+        WHERE project_id IN ({placeholders}) ORDER BY project_id, start_month
+    ''', params):
+        children[row[0]]['delays'][row[1]] = {'length': row[2], 'expense': row[3]}
+    for row in conn.execute(f'''
+        SELECT project_id, month, percent FROM project_milestones WHERE project_id IN ({placeholders})
+    ''', params):
+        children[row[0]]['billing_milestones'][row[1]] = row[2]
+    for row in conn.execute(f'''
+        SELECT project_id, phase_name, percent FROM project_unexpected_costs WHERE project_id IN ({placeholders})
+    ''', params):
+        children[row[0]]['unexpected_costs'][row[1]] = row[2]
+    return children
+
+
+def project_inputs(project, children):
+    """Build the parsed inputs of a project row and its child rows"""
+    return {
+        'time_frame': project['time_frame'],
+        'payment_lag': project['payment_lag'],
+        'contract_value': project['contract_value'],
+        'min_cash_allowed': project['cash_floor'],
+        'contingency_percent': project['contingency_percent'],
+        'phases': children['phases'],
+        'delays': children['delays'],
+        'unexpected_costs': children['unexpected_costs'],
+        'billing_milestones': children['billing_milestones']
+    }
+
+
+def iter_projects_with_inputs(conn, cursor, chunk_size=PROJECT_CHUNK_SIZE):
+    """Stream (project row, parsed inputs) pairs from a cursor over projects
+
+    Child rows are loaded one chunk of projects at a time, so memory stays
+    bounded and each chunk costs four indexed queries.
+    """
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        children = load_project_children(conn, [row['id'] for row in rows])
+        for row in rows:
+            yield row, project_inputs(row, children[row['id']])
+
+
+def find_projects_with_delays(conn, min_length, phase_name=None):
+    """Projects with a delay longer than min_length months, optionally starting in a given phase"""
+    query = '''
+        SELECT p.id, p.name, d.start_month, d.length, d.expense, d.phase_name
+        FROM project_delays d
+        JOIN projects p ON p.id = d.project_id
+        WHERE d.length > ?
+    '''
+    params = [min_length]
+    if phase_name is not None:
+        query += ' AND d.phase_name = ?'
+        params.append(phase_name)
+    query += ' ORDER BY p.id, d.start_month'
+
+    projects = []
+    for project_id, rows in groupby(conn.execute(query, params), key=lambda row: row[0]):
+        rows = list(rows)
+        projects.append({
+            'id': project_id,
+            'name': rows[0][1],
+            'delays': [
+                {'start_month': row[2], 'length': row[3], 'expense': row[4], 'phase': row[5]} for row in rows
+            ]
+        })
+    return projects
+
+
+def scenario_json(row):
+    """A scenarios row as a dict, with its overrides decoded"""
+    return {
+        'id': row['id'],
+        'project_id': row['project_id'],
+        'name': row['name'],
+        'overrides': json.loads(row['overrides']),
+        'created_at': row['created_at'],
+        'updated_at': row['updated_at'],
+    }
+
+
+def load_scenarios(conn, project_id, scenario_ids=None):
+    """Scenarios of a project in the order they were created, optionally only the given ids"""
+    query = 'SELECT id, project_id, name, overrides, created_at, updated_at FROM scenarios WHERE project_id = ?'
+    params = [project_id]
+    if scenario_ids is not None:
+        query += f" AND id IN ({', '.join('?' for _ in scenario_ids)})"
+        params.extend(scenario_ids)
+    return [scenario_json(row) for row in conn.execute(query + ' ORDER BY id', params)]
+
+
+def load_scenario(conn, scenario_id):
+    """One scenario by id, or None if it does not exist"""
+    row = conn.execute('''
+        SELECT id, project_id, name, overrides, created_at, updated_at FROM scenarios WHERE id = ?
+    ''', (scenario_id,)).fetchone()
+    return scenario_json(row) if row else None
+
+
+def upsert_scenario(conn, project_id, name, overrides):
+    """Save a scenario of a project, replacing the overrides of the one already saved under name
+
+    Returns the scenario id; the caller commits.
+    """
+    return conn.execute('''
+        INSERT INTO scenarios (project_id, name, overrides) VALUES (?, ?, ?)
+        ON CONFLICT (project_id, name) DO UPDATE SET overrides = excluded.overrides, updated_at = CURRENT_TIMESTAMP
+        RETURNING id
+    ''', (project_id, name, json.dumps(overrides))).fetchone()[0]
+
+
+def encode_cursor(row):
+    """Opaque keyset cursor pointing just past a listed project"""
+    return base64.urlsafe_b64encode(json.dumps([row['created_at'], row['id']]).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Read the (created_at, id) pair back out of a cursor"""
+    try:
+        created_at, project_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return str(created_at), int(project_id)
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError('Invalid cursor')
+
+
+def name_prefix_range(prefix):
+    """Bounds of the names that start with prefix, ignoring ASCII case
+
+    For comparisons under COLLATE NOCASE: the bounds are taken on the
+    folded prefix, and the upper one is the prefix with its last character
+    incremented. It is None when nothing can sort after every match.
+    """
+    folded = prefix.translate(ASCII_LOWER)
+    for position in range(len(folded) - 1, -1, -1):
+        code = ord(folded[position]) + 1
+        # Surrogates cannot be stored, so the next storable character follows them
+        if code == 0xD800:
+            code = 0xE000
+        if code <= 0x10FFFF:
+            return folded, folded[:position] + chr(code)
+    return folded, None
+
+
+def project_filter_conditions(filters):
+    """WHERE conditions and their parameters for the project filters
+
+    filters may hold ids (comma separated), name (prefix, ignoring ASCII
+    case as LIKE did), start_from and start_to (YYYY-MM-DD), and
+    min_contract_value and max_contract_value. The name prefix is a range
+    on idx_projects_name_nocase rather than a LIKE, which SQLite only runs
+    through an index on a NOCASE column.
+    """
+    conditions = []
+    params = []
+    if filters.get('ids'):
+        id_list = [int(project_id) for project_id in filters['ids'].split(',') if project_id.strip()]
+        conditions.append(f"id IN ({', '.join('?' for _ in id_list)})")
+        params.extend(id_list)
+    if filters.get('name'):
+        lower, upper = name_prefix_range(filters['name'])
+        conditions.append('name >= ? COLLATE NOCASE')
+        params.append(lower)
+        if upper is not None:
+            conditions.append('name < ? COLLATE NOCASE')
+            params.append(upper)
+    if filters.get('start_from'):
+        conditions.append('start_date >= ?')
+        params.append(filters['start_from'])
+    if filters.get('start_to'):
+        conditions.append('start_date <= ?')
+        params.append(filters['start_to'])
+    if filters.get('min_contract_value') is not None:
+        conditions.append('contract_value >= ?')
+        params.append(float(filters['min_contract_value']))
+    if filters.get('max_contract_value') is not None:
+        conditions.append('contract_value <= ?')
+        params.append(float(filters['max_contract_value']))
+    return conditions, params
+
+
+def list_projects_query(fields, filters, cursor=None, limit=None):
+    """Build the SQL for one page of the project listing, newest first
+
+    filters are those of project_filter_conditions. Pages are keyed on
+    (created_at, id) rather than an OFFSET, so each page is an index range
+    scan however deep it goes. The cursor columns are always selected, even
+    when not in fields.
+    """
+    unknown = [field for field in fields if field not in PROJECT_LIST_FIELDS]
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(unknown)}')
+    columns = list(dict.fromkeys(['id', 'created_at'] + list(fields)))
+
+    conditions, params = project_filter_conditions(filters)
+    if cursor:
+        created_at, project_id = decode_cursor(cursor)
+        # A row-value comparison lets SQLite seek straight to the cursor in the index
+        conditions.append('(created_at, id) < (?, ?)')
+        params.extend([created_at, project_id])
+
+    query = f"SELECT {', '.join(columns)} FROM projects"
+    if conditions:
+        query += f" WHERE {' AND '.join(conditions)}"
+    query += ' ORDER BY created_at DESC, id DESC'
+    if limit is not None:
+        query += ' LIMIT ?'
+        params.append(int(limit))
+    return query, params
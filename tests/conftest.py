@@ -0,0 +1,24 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+
+
+@pytest.fixture
+def app(tmp_path):
+    return create_app(str(tmp_path / 'projects.db'), init_schema=True)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def post_json(client, url, body, **kwargs):
+    """POST body as JSON in its own key order; the test client's json= would sort phases by name"""
+    return client.post(url, data=json.dumps(body), content_type='application/json', **kwargs)
@@ -0,0 +1,55 @@
+import pytest
+
+from batch_forecast import MAX_BATCH_FORECASTS, expand_sweep, sweep_size
+from conftest import post_json
+
+INPUTS = {
+    'contract_value': 500000,
+    'time_frame': 36,
+    'payment_lag': 1,
+    'contingency_percent': 0.05,
+    'cash_floor': -100000,
+    'phases': {'Build': {'length': 6, 'expense': 10000}},
+    'delays': {},
+    'unexpected_costs': {},
+    'billing_milestones': {'6': 100},
+}
+
+
+def test_sweep_size_counts_without_expanding():
+    sweep = {name: list(range(60)) for name in ('time_frame', 'payment_lag', 'contract_value', 'cash_floor', 'contingency_percent')}
+    assert sweep_size(sweep) == 60 ** 5
+    assert next(expand_sweep(sweep)) == {name: 0 for name in sweep}
+
+
+def test_oversized_sweep_is_refused(client):
+    sweep = {'time_frame': list(range(MAX_BATCH_FORECASTS)), 'payment_lag': [0, 1]}
+    response = client.post('/generate_forecasts', json={'inputs': INPUTS, 'sweep': sweep})
+    assert response.status_code == 400
+    assert response.get_json()['message'] == f'At most {MAX_BATCH_FORECASTS} forecasts per request'
+
+
+def test_sweep_forecasts_every_combination(client):
+    sweep = {'time_frame': [30, 40], 'phases.Build.expense': [1000, 2000, 3000]}
+    response = post_json(client, '/generate_forecasts', {'inputs': INPUTS, 'sweep': sweep})
+    assert response.status_code == 200
+    assert [entry['overrides'] for entry in response.get_json()['forecasts']] == list(expand_sweep(sweep))
+
+
+@pytest.mark.parametrize('body, message', [
+    ({'inputs_list': 5}, 'inputs_list must be a list of inputs'),
+    ({'inputs': INPUTS, 'overrides': 5}, 'overrides must be a list of overrides'),
+    ({'inputs': INPUTS, 'sweep': {'phases.Build': [1, 2]}}, 'Invalid sweep key: phases.Build'),
+    ({'inputs': INPUTS, 'sweep': {'phases.Build.cost': [1, 2]}}, 'Invalid sweep key: phases.Build.cost'),
+    ({'inputs': INPUTS, 'sweep': {'timeframe': [1, 2]}}, 'Invalid sweep key: timeframe'),
+])
+def test_malformed_batches_are_refused(client, body, message):
+    response = client.post('/generate_forecasts', json=body)
+    assert response.status_code == 400
+    assert response.get_json()['message'].startswith(message)
+
+
+def test_sweep_phase_names_may_contain_dots():
+    sweep = {'phases.Phase 1.5.length': [2, 3]}
+    assert sweep_size(sweep) == 2
+    assert next(expand_sweep(sweep)) == {'phases': {'Phase 1.5': {'length': 2}}}
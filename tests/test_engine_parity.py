@@ -0,0 +1,84 @@
+import random
+
+import numpy as np
+import pytest
+
+from app import calculate_forecast
+from batch_forecast import calculate_forecasts
+from forecast_engine import calculate_forecast_result, calculate_forecast_vectorized
+
+SEEDS = range(200)
+
+
+def random_inputs(seed):
+    """Parsed inputs with delays, unexpected costs, zero-length phases and milestones pushed back by the payment lag"""
+    rng = random.Random(seed)
+    phase_names = [f'Phase {position}' for position in range(rng.randint(1, 6))]
+    time_frame = rng.randint(1, 60)
+    phases = {
+        name: {
+            'length': rng.choice([0, 0, 1, rng.randint(1, 18)]),
+            'expense': float(rng.randint(0, 40000)),
+            'overhead': float(rng.choice([0, rng.randint(0, 3000)])),
+            'upfront': float(rng.choice([0, rng.randint(0, 20000)])),
+        }
+        for name in phase_names
+    }
+    delays = {
+        rng.randint(1, time_frame + 6): {'length': rng.randint(0, 5), 'expense': float(rng.randint(0, 5000))}
+        for _ in range(rng.randint(0, 3))
+    }
+    unexpected_costs = {name: rng.choice([0.05, 0.1, 0.25]) for name in rng.sample(phase_names, rng.randint(0, len(phase_names)))}
+    billing_milestones = {str(rng.randint(0, time_frame)): float(rng.randint(5, 50)) / 100 for _ in range(rng.randint(1, 5))}
+    return {
+        'time_frame': time_frame,
+        'payment_lag': rng.randint(0, 6),
+        'contract_value': float(rng.randint(50000, 2000000)),
+        'min_cash_allowed': float(-rng.randint(0, 300000)),
+        'contingency_percent': rng.choice([0.0, 0.05, 0.1]),
+        'phases': phases,
+        'delays': delays,
+        'unexpected_costs': unexpected_costs,
+        'billing_milestones': billing_milestones,
+    }
+
+
+def assert_same_forecast(expected, actual):
+    for column in ('cash_in', 'cash_out', 'net_cash', 'cumulative_net_cash', 'phase_index'):
+        np.testing.assert_array_equal(getattr(actual, column), getattr(expected, column), err_msg=column)
+    assert actual.phase_names == expected.phase_names
+    for figure in ('verdict', 'payback_period', 'gross_margin', 'min_net_cash', 'min_net_cash_month', 'final_net_cash'):
+        assert getattr(actual, figure) == getattr(expected, figure), figure
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_vectorized_engine_matches_loop(seed):
+    parsed_inputs = random_inputs(seed)
+    assert_same_forecast(calculate_forecast(parsed_inputs), calculate_forecast_result(parsed_inputs))
+
+
+@pytest.mark.parametrize('seed', SEEDS[:20])
+def test_vectorized_response_matches_loop(seed):
+    parsed_inputs = random_inputs(seed)
+    assert calculate_forecast_vectorized(parsed_inputs) == calculate_forecast(parsed_inputs).to_dict()
+
+
+def test_batch_engine_matches_loop():
+    parsed_variants = [random_inputs(seed) for seed in SEEDS]
+    for parsed_inputs, result in zip(parsed_variants, calculate_forecasts(parsed_variants)):
+        assert_same_forecast(calculate_forecast(parsed_inputs), result)
+
+
+@pytest.mark.parametrize('engine', ['loop', 'vectorized'])
+@pytest.mark.parametrize('contract_value', [0, -1000])
+def test_engines_refuse_non_positive_contract_value(client, engine, contract_value):
+    inputs = {
+        'contract_value': contract_value, 'time_frame': 12, 'payment_lag': 1, 'contingency_percent': 0.05,
+        'cash_floor': -20000, 'phases': {'Build': {'length': 6, 'expense': 5000}}, 'billing_milestones': {'6': 1.0},
+    }
+    response = client.post('/generate_forecast', json={'inputs': inputs, 'engine': engine})
+    assert response.status_code == 400
+    sweep = {'contract_value': [100000, contract_value]}
+    response = client.post('/generate_forecasts', json={'inputs': dict(inputs, contract_value=100000), 'sweep': sweep})
+    assert response.status_code == 400
+    assert response.get_json()['message'] == 'contract_value must be a positive number'
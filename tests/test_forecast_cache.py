@@ -0,0 +1,30 @@
+from forecast_cache import ForecastCache, inputs_key
+from forecast_engine import calculate_forecast_result
+
+# Closeout never becomes the current phase within the time frame
+PARSED_INPUTS = {
+    'time_frame': 6,
+    'payment_lag': 0,
+    'contract_value': 100000.0,
+    'min_cash_allowed': -50000.0,
+    'contingency_percent': 0.0,
+    'phases': {
+        'Build': {'length': 12, 'expense': 5000.0, 'overhead': 0.0, 'upfront': 0.0},
+        'Closeout': {'length': 2, 'expense': 1000.0, 'overhead': 0.0, 'upfront': 0.0},
+    },
+    'delays': {},
+    'unexpected_costs': {},
+    'billing_milestones': {'3': 1.0},
+}
+
+
+def test_disk_tier_keeps_phases_that_never_ran(tmp_path):
+    result = calculate_forecast_result(PARSED_INPUTS)
+    key = inputs_key(PARSED_INPUTS)
+    ForecastCache(disk_path=str(tmp_path / 'cache.db')).put(key, result)
+
+    # A fresh cache has nothing in memory, so the result comes back from disk
+    from_disk = ForecastCache(disk_path=str(tmp_path / 'cache.db')).get(key)
+    assert from_disk.phase_names == ('Build', 'Closeout')
+    assert from_disk.to_columns() == result.to_columns()
+    assert from_disk.to_dict() == result.to_dict()
@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+import process_pool
+from portfolio import aggregate_portfolio
+from simulation import PARALLEL_DRAWS_THRESHOLD, run_simulation
+
+PARSED_INPUTS = {
+    'time_frame': 24,
+    'payment_lag': 1,
+    'contract_value': 600000.0,
+    'min_cash_allowed': -100000.0,
+    'contingency_percent': 0.05,
+    'phases': {
+        'Design': {'length': 4, 'expense': 10000.0, 'overhead': 500.0, 'upfront': 0.0},
+        'Build': {'length': 14, 'expense': 20000.0, 'overhead': 1000.0, 'upfront': 5000.0},
+    },
+    'delays': {6: {'length': 2, 'expense': 2000.0}},
+    'unexpected_costs': {},
+    'billing_milestones': {'4': 0.3, '18': 0.7},
+}
+DISTRIBUTIONS = {
+    'phase_expense': {'distribution': 'normal', 'mean': 1, 'std': 0.1},
+    'delay_probability': 0.3,
+    'delay_length': {'distribution': 'triangular', 'low': 1, 'mode': 2, 'high': 4},
+}
+
+
+@pytest.fixture
+def two_processes(monkeypatch):
+    monkeypatch.setattr(process_pool, 'POOL_WORKERS', 2)
+    yield
+    process_pool.shutdown_pool()
+
+
+def test_requested_workers_are_capped(two_processes):
+    assert process_pool.pool_workers() == 2
+    assert process_pool.pool_workers(64) == 2
+    assert process_pool.pool_workers(1) == 1
+
+
+def test_pool_is_shared_and_not_forked(two_processes):
+    pool = process_pool.process_pool()
+    assert process_pool.process_pool() is pool
+    assert pool._mp_context.get_start_method() in ('forkserver', 'spawn')
+    assert process_pool.submit(os.getpid).result() != os.getpid()
+
+
+def test_parallel_simulation_matches_serial(two_processes):
+    draws = PARALLEL_DRAWS_THRESHOLD + 1000
+    parallel = run_simulation(PARSED_INPUTS, DISTRIBUTIONS, draws=draws, seed=7)
+    serial = run_simulation(PARSED_INPUTS, DISTRIBUTIONS, draws=draws, seed=7, workers=1)
+    assert parallel == serial
+    # The draws really vary, so a chunk seeded wrongly would change the bands
+    bands = parallel['cumulative_net_cash']
+    assert all(low < high for low, high in zip(bands['p10'][1:], bands['p90'][1:]))
+
+
+def test_parallel_portfolio_matches_serial(two_processes):
+    projects = [
+        {'id': number, 'name': f'Project {number}', 'start_date': f'2024-{number % 12 + 1:02d}-01', 'inputs': PARSED_INPUTS}
+        for number in range(120)
+    ]
+    assert aggregate_portfolio(projects) == aggregate_portfolio(projects, workers=1)
+
+
+@pytest.mark.parametrize('distributions', [
+    5,
+    {'phase_expense': 'normal'},
+    {'phase_expense': {'distribution': 'uniform', 'low': 0.9}},
+    {'phase_expense': {'distribution': 'gamma'}},
+    {'phase_expenses': {'distribution': 'normal', 'mean': 1, 'std': 0.1}},
+    {'delay_probability': 2},
+])
+def test_malformed_distributions_are_refused(client, distributions):
+    inputs = {
+        'contract_value': 500000, 'time_frame': 24, 'payment_lag': 1, 'contingency_percent': 0.05,
+        'cash_floor': -100000, 'phases': {'Build': {'length': 6, 'expense': 10000}},
+        'delays': {}, 'unexpected_costs': {}, 'billing_milestones': {'6': 100},
+    }
+    response = client.post('/simulate', json={'inputs': inputs, 'distributions': distributions, 'draws': 10})
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
@@ -0,0 +1,90 @@
+import json
+
+import pytest
+
+import project_io
+from database import connect
+from project_io import import_projects
+
+
+def record(number):
+    return {
+        'name': f'Project {number}',
+        'contract_value': 100000 + number,
+        'time_frame': 12,
+        'payment_lag': 1,
+        'contingency_percent': 0.05,
+        'cash_floor': -20000,
+        'phases': {'Build': {'length': 6, 'expense': 5000}},
+        'billing_milestones': {'6': 1.0},
+    }
+
+
+def project_count(conn):
+    return conn.execute('SELECT COUNT(*) FROM projects').fetchone()[0]
+
+
+def test_import_writes_every_batch(app):
+    conn = connect(app.config['DATABASE'])
+    report = import_projects(conn, [record(number) for number in range(7)], batch_size=3)
+    assert report == {'imported': 7, 'committed': True, 'error_count': 0, 'errors': []}
+    assert project_count(conn) == 7
+    assert conn.execute('SELECT COUNT(*) FROM project_phases').fetchone()[0] == 7
+
+
+def test_invalid_record_writes_nothing(app):
+    conn = connect(app.config['DATABASE'])
+    records = [record(number) for number in range(7)] + [{'name': 'Broken'}]
+    report = import_projects(conn, records, batch_size=3)
+    assert report['committed'] is False and report['imported'] == 0
+    assert report['errors'][0]['record'] == 8
+    assert project_count(conn) == 0
+    assert conn.execute('SELECT COUNT(*) FROM project_phases').fetchone()[0] == 0
+
+
+def test_write_lock_is_free_while_records_are_read(app):
+    conn = connect(app.config['DATABASE'])
+    other = connect(app.config['DATABASE'])
+    other.execute('PRAGMA busy_timeout = 0')
+
+    def records():
+        for number in range(6):
+            if number == 4:
+                # No batch is visible before the import commits, and another writer gets the lock without waiting
+                assert project_count(other) == 0
+                other.execute('BEGIN IMMEDIATE')
+                other.execute("INSERT INTO projects (name, contract_value, time_frame, payment_lag, "
+                              "contingency_percent, cash_floor) VALUES ('Other', 1, 1, 0, 0, 0)")
+                other.commit()
+            yield record(number)
+
+    report = import_projects(conn, records(), batch_size=3)
+    assert report['imported'] == 6
+    assert project_count(conn) == 7
+
+
+def test_failed_write_rolls_back_every_batch(app, monkeypatch):
+    conn = connect(app.config['DATABASE'])
+    calls = []
+
+    def failing_insert(conn, batch):
+        calls.append(batch)
+        if len(calls) == 2:
+            raise RuntimeError('disk full')
+        original_insert(conn, batch)
+
+    original_insert = project_io.insert_batch
+    monkeypatch.setattr(project_io, 'insert_batch', failing_insert)
+    with pytest.raises(RuntimeError):
+        import_projects(conn, [record(number) for number in range(7)], batch_size=3)
+    assert project_count(conn) == 0
+
+
+def test_import_route_round_trip(client):
+    body = ''.join(json.dumps(record(number)) + '\n' for number in range(3))
+    response = client.post('/import_projects', data=body, content_type='application/x-ndjson')
+    assert response.status_code == 200
+    assert response.get_json()['imported'] == 3
+    exported = client.get('/export_projects')
+    assert [json.loads(line)['name'] for line in exported.data.decode().splitlines()] == [
+        'Project 0', 'Project 1', 'Project 2']
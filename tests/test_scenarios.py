@@ -0,0 +1,66 @@
+import pytest
+
+from conftest import post_json
+
+INPUTS = {
+    'contract_value': 400000,
+    'time_frame': 24,
+    'payment_lag': 1,
+    'contingency_percent': 0.05,
+    'cash_floor': -80000,
+    'phases': {'Design': {'length': 4, 'expense': 8000}, 'Build': {'length': 12, 'expense': 15000}},
+    'delays': {},
+    'unexpected_costs': {},
+    'billing_milestones': {'4': 30, '16': 70},
+}
+
+MALFORMED_OVERRIDES = [
+    {'phases': 5},
+    {'phases': {'Build': 3}},
+    {'phases': {'Build': {'expense': None}}},
+    {'delays': {'3': 'long'}},
+    {'billing_milestones': ['6']},
+    {'time_frame': [30]},
+]
+
+
+@pytest.fixture
+def project_id(client):
+    response = post_json(client, '/create_project', {'name': 'Tower', 'inputs': INPUTS})
+    return response.get_json()['project_id']
+
+
+def test_saved_scenario_applies_to_forecast(client, project_id):
+    saved = post_json(client, '/save_scenario', {'project_id': project_id, 'name': 'Longer', 'overrides': {'time_frame': 30}})
+    scenario_id = saved.get_json()['scenario_id']
+    response = post_json(client, '/generate_forecast', {'inputs': INPUTS, 'scenario': scenario_id})
+    longer = post_json(client, '/generate_forecast', {'inputs': {**INPUTS, 'time_frame': 30}})
+    assert response.get_json()['forecast'] == longer.get_json()['forecast']
+
+
+@pytest.mark.parametrize('scenario', ['best case', [1], 999])
+def test_unknown_scenario_is_refused(client, scenario):
+    response = post_json(client, '/generate_forecast', {'inputs': INPUTS, 'scenario': scenario})
+    if scenario == 999:
+        assert response.status_code == 404
+    else:
+        assert response.status_code == 400
+        assert response.get_json()['message'] == "scenario must be 'base' or the id of a saved scenario"
+
+
+@pytest.mark.parametrize('overrides', MALFORMED_OVERRIDES)
+def test_malformed_overrides_are_bad_requests(client, project_id, overrides):
+    saved = post_json(client, '/save_scenario', {'project_id': project_id, 'name': 'Broken', 'overrides': overrides})
+    assert saved.status_code == 400
+
+    compared = post_json(client, '/compare', {'inputs': INPUTS, 'scenarios': [{'name': 'Broken', 'overrides': overrides}]})
+    assert compared.status_code == 400
+
+    base = post_json(client, '/generate_forecast', {'inputs': INPUTS}).get_json()
+    updated = post_json(client, '/update_forecast', {'forecast_key': base['forecast_key'], 'changes': overrides})
+    assert updated.status_code == 400
+
+
+def test_compare_refuses_scenarios_that_are_not_objects(client):
+    response = post_json(client, '/compare', {'inputs': INPUTS, 'scenarios': ['Broken']})
+    assert response.status_code == 400
@@ -0,0 +1,42 @@
+import pytest
+
+from database import connect
+from storage import list_projects_query, name_prefix_range, project_filter_conditions
+
+NAMES = ['Alpha', 'alpine', 'ALPS', 'Beta', 'al_x', 'al%y', 'Al', 'Ålborg', 'alz', 'alZeta', 'am']
+
+
+@pytest.fixture
+def conn(app):
+    conn = connect(app.config['DATABASE'])
+    conn.executemany('''
+        INSERT INTO projects (name, start_date, contract_value, time_frame, payment_lag, contingency_percent, cash_floor)
+        VALUES (?, '2024-01-01', 1, 1, 0, 0, 0)
+    ''', [(name,) for name in NAMES])
+    conn.commit()
+    return conn
+
+
+def names_matching(conn, filters):
+    conditions, params = project_filter_conditions(filters)
+    return sorted(row[0] for row in conn.execute(f"SELECT name FROM projects WHERE {' AND '.join(conditions)}", params))
+
+
+@pytest.mark.parametrize('prefix', ['al', 'AL', 'Alp', 'alZ', 'al_', 'al%', 'Å', 'z'])
+def test_name_prefix_matches_like(conn, prefix):
+    escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    like = sorted(row[0] for row in conn.execute("SELECT name FROM projects WHERE name LIKE ? ESCAPE '\\'", (escaped + '%',)))
+    assert names_matching(conn, {'name': prefix}) == like
+
+
+def test_name_prefix_uses_index(conn):
+    query, params = list_projects_query(['name'], {'name': 'al'}, limit=10)
+    plan = ' '.join(row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + query, params))
+    assert 'USING INDEX idx_projects_name_nocase' in plan
+
+
+def test_name_prefix_range_bounds():
+    assert name_prefix_range('AbZ') == ('abz', 'ab{')
+    assert name_prefix_range('a\U0010ffff') == ('a\U0010ffff', 'b')
+    assert name_prefix_range('\U0010ffff') == ('\U0010ffff', None)
+    assert name_prefix_range('퟿')[1] == ''
@@ -0,0 +1,121 @@
+import copy
+
+import pytest
+
+from app import create_app
+from conftest import post_json
+from incremental import first_changed_month, forecast_with_checkpoints
+from models import Delay, ForecastInput, Phase
+
+INPUTS = {
+    'contract_value': 900000,
+    'time_frame': 30,
+    'payment_lag': 1,
+    'contingency_percent': 0.05,
+    'cash_floor': -150000,
+    'phases': {
+        'Design': {'length': 4, 'expense': 12000, 'overhead': 1000, 'upfront': 5000},
+        'Build': {'length': 14, 'expense': 25000, 'overhead': 2000, 'upfront': 0},
+        'Closeout': {'length': 3, 'expense': 6000, 'overhead': 500, 'upfront': 0},
+    },
+    'delays': {'8': {'length': 2, 'expense': 3000}},
+    'unexpected_costs': {'Build': 0.1},
+    'billing_milestones': {'4': 20, '12': 40, '24': 40},
+}
+
+
+def generate(client, inputs):
+    response = post_json(client, '/generate_forecast', {'inputs': inputs})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def update(client, key, changes, base_inputs=None):
+    body = {'forecast_key': key, 'changes': changes}
+    if base_inputs is not None:
+        body['base_inputs'] = base_inputs
+    return post_json(client, '/update_forecast', body)
+
+
+def edited(**phases):
+    inputs = copy.deepcopy(INPUTS)
+    inputs['phases'] = phases
+    return inputs
+
+
+@pytest.mark.parametrize('new_inputs', [
+    # Added, removed and renamed phases
+    edited(**INPUTS['phases'], Warranty={'length': 2, 'expense': 1000, 'overhead': 0, 'upfront': 0}),
+    edited(Design=INPUTS['phases']['Design'], Build=INPUTS['phases']['Build']),
+    edited(Design=INPUTS['phases']['Design'], Construction=INPUTS['phases']['Build'],
+           Closeout=INPUTS['phases']['Closeout']),
+    edited(Design={**INPUTS['phases']['Design'], 'length': 6}, Build=INPUTS['phases']['Build'],
+           Closeout=INPUTS['phases']['Closeout']),
+], ids=['add', 'remove', 'rename', 'change'])
+def test_update_matches_full_forecast(client, new_inputs):
+    base = generate(client, INPUTS)
+    response = update(client, base['forecast_key'], {'phases': new_inputs['phases']})
+    assert response.status_code == 200
+    updated = response.get_json()
+
+    full = generate(client, new_inputs)
+    assert updated['forecast_key'] == full['forecast_key']
+    assert updated['forecast'] == full['forecast']
+
+
+def test_update_without_base_in_memory_rebuilds_it(tmp_path, monkeypatch):
+    # Two workers sharing the disk tier: the second only has the base's figures, not its checkpoints
+    monkeypatch.setenv('FORECAST_CACHE_DB', str(tmp_path / 'cache.db'))
+    database = str(tmp_path / 'projects.db')
+    first = create_app(database, init_schema=True).test_client()
+    second = create_app(database).test_client()
+    base = generate(first, INPUTS)
+    new_inputs = edited(Design=INPUTS['phases']['Design'], Build=INPUTS['phases']['Build'])
+
+    response = update(second, base['forecast_key'], {'phases': new_inputs['phases']}, base_inputs=INPUTS)
+    assert response.status_code == 200
+    assert response.get_json()['forecast'] == generate(first, new_inputs)['forecast']
+
+
+def test_update_of_unknown_forecast_is_not_found(client):
+    response = update(client, 'missing', {'time_frame': 40})
+    assert response.status_code == 404
+
+
+def test_update_rejects_base_inputs_of_another_forecast(client):
+    base = generate(client, INPUTS)
+    other = edited(Design=INPUTS['phases']['Design'])
+    client.application.extensions['forecast_cache'].clear()
+    response = update(client, base['forecast_key'], {'time_frame': 40}, base_inputs=other)
+    assert response.status_code == 404
+
+
+def test_update_of_vectorized_forecast(client):
+    base = post_json(client, '/generate_forecast', {'inputs': INPUTS, 'engine': 'vectorized'}).get_json()
+    loop = generate(client, INPUTS)
+    assert base['forecast_key'] != loop['forecast_key']
+    assert base['forecast'] == loop['forecast']
+
+    new_inputs = edited(Design=INPUTS['phases']['Design'], Build=INPUTS['phases']['Build'])
+    assert update(client, base['forecast_key'], {'phases': new_inputs['phases']}).status_code == 404
+    response = update(client, base['forecast_key'], {'phases': new_inputs['phases']}, base_inputs=INPUTS)
+    assert response.status_code == 200
+    assert response.get_json()['forecast'] == generate(client, new_inputs)['forecast']
+
+
+def test_negative_delay_lengths_are_refused(client):
+    base = generate(client, INPUTS)
+    response = update(client, base['forecast_key'], {'delays': {'20': {'length': -3, 'expense': 0}}})
+    assert response.status_code == 400
+    assert response.get_json()['message'] == 'Delay lengths cannot be negative'
+    inputs = dict(INPUTS, delays={'20': {'length': -3, 'expense': 0}})
+    assert post_json(client, '/generate_forecast', {'inputs': inputs}).status_code == 400
+
+
+def test_negative_delay_length_recomputes_every_month():
+    phases = [Phase('Build', 14, 25000)]
+    base = forecast_with_checkpoints(ForecastInput(30, 1, 900000, -150000, 0.05, phases=phases,
+                                                   billing_milestones={'12': 100}))
+    changed = ForecastInput(30, 1, 900000, -150000, 0.05, phases=phases, delays=[Delay(20, -3)],
+                            billing_milestones={'12': 100})
+    assert first_changed_month(base, changed) == 1
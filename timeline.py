@@ -0,0 +1,104 @@
+from functools import lru_cache
+
+from models import Timeline
+
+# Compiled timelines kept for reuse; the scenarios and edits of one project usually share one
+TIMELINE_CACHE_SIZE = 512
+
+
+def timeline_key(forecast_input):
+    """The inputs a Timeline depends on, as a hashable key
+
+    Amounts (contract value, phase and delay expenses, contingency,
+    unexpected costs, the cash floor) are left out: they only scale what
+    happens in each month, not when.
+    """
+    return (
+        forecast_input.time_frame,
+        forecast_input.payment_lag,
+        tuple([phase.length for phase in forecast_input.phases]),
+        tuple([(start_month, delay.length) for start_month, delay in forecast_input.delays.items()]),
+        tuple(forecast_input.billing_milestones.items()),
+    )
+
+
+def timeline_for(forecast_input):
+    """The compiled Timeline of forecast_input
+
+    Kept on the ForecastInput, and shared through the cache with every other
+    forecast whose timeline_key matches.
+    """
+    if forecast_input.timeline is None:
+        forecast_input.timeline = compile_timeline(*timeline_key(forecast_input))
+    return forecast_input.timeline
+
+
+@lru_cache(maxsize=TIMELINE_CACHE_SIZE)
+def compile_timeline(time_frame, payment_lag, phase_lengths, delays, billing_milestones):
+    """Work out each month's phase, delay and billed share once
+
+    Walks the months the way the loop engine always has: a delay covers at
+    least its start month and stops the current phase counting down, a
+    phase runs one month past its length, and after the last phase comes an
+    end phase of 100 months before the phases start again from the second.
+    """
+    delays = dict(delays)
+    # The engine only ever matched milestones on str(month), so '07' or ' 7' are never billed
+    milestones = {}
+    for key, percent in billing_milestones:
+        try:
+            month = int(key)
+        except ValueError:
+            continue
+        if str(month) == key:
+            milestones[month] = percent
+
+    horizon = time_frame + payment_lag + sum(delays.values())
+    phase_index = [-1]
+    phase_start = [False]
+    delay_start_column = [0]
+    milestone_percent = [0.0]
+    phase_first_month = [0] * len(phase_lengths)
+
+    cumulative_delays = 0
+    current_delay = False
+    delay_remaining = 0
+    delay_start = 0
+    # Position of the current phase; the end phase counts as position 0
+    phase_position = 0
+    in_end_phase = False
+    current_phase_remaining = phase_lengths[0] - 1
+
+    for i in range(1, horizon + 1):
+        if i in delays:
+            cumulative_delays += delays[i]
+            current_delay = True
+            delay_remaining = delays[i] - 1
+            delay_start = i
+        elif current_delay and delay_remaining > 0:
+            delay_remaining -= 1
+        else:
+            current_delay = False
+            delay_remaining = 0
+            delay_start = 0
+
+        if current_phase_remaining >= 0:
+            if not current_delay:
+                current_phase_remaining -= 1
+            phase_change = False
+        else:
+            phase_position = (phase_position + 1) % len(phase_lengths)
+            in_end_phase = phase_position == 0
+            current_phase_remaining = 99 if in_end_phase else phase_lengths[phase_position] - 1
+            phase_change = True
+
+        if not in_end_phase and not phase_first_month[phase_position]:
+            phase_first_month[phase_position] = i
+        phase_index.append(-1 if in_end_phase else phase_position)
+        phase_start.append(phase_change or i == 1)
+        delay_start_column.append(delay_start)
+        # Milestone months count after the payment lag and every delay started so far
+        billing_month = i - payment_lag - cumulative_delays
+        milestone_percent.append(milestones.get(billing_month, 0.0) if not current_delay and billing_month >= 0 else 0.0)
+
+    return Timeline(horizon, phase_index, phase_start, delay_start_column, milestone_percent, phase_first_month)